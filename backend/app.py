@@ -1,29 +1,146 @@
 import sys
 import os
+import time
+# 模块开始导入的时刻，用于统计启动耗时和首个请求的完成时间
+process_started = time.time()
 from tempfile import tempdir
 # 在最早阶段设置环境变量
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'True'  # 允许重复加载 OpenMP 运行时
 
-# 在文件顶部添加 matplotlib 后端设置
-import matplotlib
-matplotlib.use('Agg')  # 强制使用非交互式后端
-from flask import Flask, request, jsonify, send_from_directory
+# 强制使用非交互式后端 (通过环境变量设置，matplotlib 在第一次绘图时才导入)
+os.environ.setdefault('MPLBACKEND', 'Agg')
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context, g
 from flask_cors import CORS  # 导入 CORS
 import numpy as np  # 确保已经导入 numpy
-import obspy
-import onnxruntime as ort
-import torch
+# obspy、onnxruntime 和 matplotlib 在各模块中用到时才导入，由启动线程在加载模型和预热时完成导入
 from dt_onnx_inference_windows import load_onnx_model, preprocess_stream, DiTing_predict_onnx,visualize_results
-from datetime import datetime
+from dt_onnx_inference_windows import warm_up_session, optimized_model_filename
+from dt_onnx_inference_windows import extract_event_slice, save_event_slice, load_event_slice, render_event_plot
+from concurrent.futures import ThreadPoolExecutor
+from streaming_inference import WaveformChunkReader, DiTing_predict_stream
+from multi_station import read_waveforms, group_by_station, station_id, DiTing_predict_multi_station
+from confidence_export import encode_confidence, to_npy_bytes, pack_confidence
+from realtime_picking import RealtimePicker, tcp_packets, tail_packets
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from quantize_model import model_variant_path
+from sta_lta_gate import StaLtaGate
+from waveform_assembly import (CHANNELS, MODEL_SAMPLING_RATE, WaveformSpanError, assemble_waveform, select_station,
+                               set_limits as set_waveform_limits, waveform_starttime)
+import cProfile
+from job_manager import JobManager, QueueFullError, FINISHED_STATES, DONE
+from result_cache import ResultCache, cache_key, content_digest, model_identity
+from waveform_store import WaveformStore
+from confidence_store import ConfidenceStore, REPICK_DEFAULTS, repick, repick_settings
+from envelope_pyramid import EnvelopeStore, TRACE_NAMES, float16_scales
+from plot_store import PlotStore, event_slice_path
+from pick_catalog import PickCatalog, PICK_COLUMNS
+from upload_spool import UploadTooLarge, make_request_class, spooled
+from impact_simulation import ImpactSimulator, PopulationGrid, DEFAULT_CITIES, DEFAULT_FACILITIES, load_points
+from usgs_feed import FeedCache, MAX_ZOOM, magnitude_stats, parse_feeds
+from werkzeug.exceptions import HTTPException
+from datetime import datetime, timezone
 import traceback
 import logging
+import json
+import threading
+import shutil
+from collections import deque
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
-model_path = os.path.join(base_dir, 'DiTing0.1B_v15.onnx')
+# 模型变体: fp32 (默认)、int8-dynamic、int8-static，量化模型由 quantize_model.py 生成
+model_variant = os.environ.get('DITING_MODEL_VARIANT', 'fp32')
+model_path = model_variant_path(os.path.join(base_dir, 'DiTing0.1B_v15.onnx'), model_variant)
+# 批量推理的窗口数，设为1时退回逐窗口推理
+inference_batch_size = int(os.environ.get('DITING_BATCH_SIZE', '16'))
+# 流式处理时每次解码的时长 (秒)
+stream_chunk_seconds = float(os.environ.get('DITING_STREAM_CHUNK_SECONDS', '3600'))
+# 异步任务的工作线程数和允许排队的任务数
+job_workers = int(os.environ.get('DITING_JOB_WORKERS', '2'))
+job_queue_size = int(os.environ.get('DITING_JOB_QUEUE_SIZE', '8'))
+# onnxruntime线程设置，多进程部署时由 gunicorn.conf.py 按CPU核数分配，0表示由onnxruntime决定
+ort_intra_op_threads = int(os.environ.get('DITING_INTRA_OP_THREADS', '0'))
+ort_inter_op_threads = int(os.environ.get('DITING_INTER_OP_THREADS', '0'))
+ort_allow_spinning = os.environ.get('DITING_ORT_ALLOW_SPINNING', '1') == '1'
+# 结果缓存目录和大小上限 (MB)，上限设为0时关闭缓存
+cache_dir = os.environ.get('DITING_CACHE_DIR', os.path.join(base_dir, 'cache'))
+cache_max_mb = float(os.environ.get('DITING_CACHE_MAX_MB', '1024'))
+# 异步任务状态的SQLite文件，gunicorn 的各工作进程共享，任一进程都能查询和取消任务；设为空时只保存在进程内
+# (此时多进程部署需要按任务ID粘性路由)
+job_state_path = os.environ.get('DITING_JOB_STATE_PATH', os.path.join(cache_dir, 'jobs.sqlite3'))
+# 解码后波形的内存映射存储大小上限 (MB)，设为0时关闭，每次分析都重新解码
+waveform_store_max_mb = float(os.environ.get('DITING_WAVEFORM_STORE_MAX_MB', '4096'))
+waveform_store_dir = os.path.join(cache_dir, 'waveforms')
+# 保留的置信度曲线大小上限 (MB)，用于 /repick 只重新后处理，设为0时关闭
+confidence_store_max_mb = float(os.environ.get('DITING_CONFIDENCE_STORE_MAX_MB', '1024'))
+confidence_store_dir = os.path.join(cache_dir, 'confidence')
+
+envelope_store_max_mb = float(os.environ.get('DITING_ENVELOPE_STORE_MAX_MB', '1024'))
+envelope_factor = int(os.environ.get('DITING_ENVELOPE_FACTOR', '8'))
+envelope_store_dir = os.path.join(cache_dir, 'envelopes')
+# 震相拾取目录: 每次分析的事件和 P/S 震相保存在SQLite中，供 /picks 按时间、台站和置信度查询，设为0时关闭
+pick_catalog_enabled = os.environ.get('DITING_PICK_CATALOG', '1') == '1'
+pick_catalog_path = os.environ.get('DITING_PICK_CATALOG_PATH', os.path.join(cache_dir, 'picks.sqlite3'))
+# 上传文件边接收边写入暂存目录: 请求体大小上限 (MB)，接收到文件开头后是否检查格式
+upload_max_mb = float(os.environ.get('DITING_MAX_UPLOAD_MB', '4096'))
+upload_format_check = os.environ.get('DITING_UPLOAD_FORMAT_CHECK', '1') == '1'
+upload_spool_dir = os.path.join(cache_dir, 'uploads')
+# 组装波形时允许填充的最长间断和整体组装的最长时长 (秒)，超过时返回400，设为0时不限制
+# (/process/stream 分块处理，不受时长上限限制)
+waveform_max_gap_seconds = float(os.environ.get('DITING_MAX_GAP_SECONDS', '3600'))
+waveform_max_seconds = float(os.environ.get('DITING_MAX_WAVEFORM_SECONDS', '172800'))
+set_waveform_limits(waveform_max_gap_seconds or None, waveform_max_seconds or None)
+# 影响模拟: 预处理后的人口栅格目录 (见 impact_simulation.py)，城市和设施列表 (JSON)，不设置时使用示例数据
+population_grid_dir = os.environ.get('DITING_POPULATION_GRID', os.path.join(base_dir, 'data', 'population_grid'))
+impact_cities_path = os.environ.get('DITING_IMPACT_CITIES', '')
+impact_facilities_path = os.environ.get('DITING_IMPACT_FACILITIES', '')
+
+# USGS 地震目录的缓存代理: 名称=地址或本地文件，逗号分隔，为空时使用前端用到的 all_day 和 2.5_day
+usgs_feeds_spec = os.environ.get('DITING_USGS_FEEDS', '')
+usgs_poll_seconds = float(os.environ.get('DITING_USGS_POLL_SECONDS', '60'))
+usgs_store_dir = os.path.join(cache_dir, 'usgs')
+# 结果图像的生成方式: lazy 首次请求图片时绘制, background 后台线程绘制, sync 在请求中绘制
+plot_mode = os.environ.get('DITING_PLOT_MODE', 'lazy')
+plot_dpi = int(os.environ.get('DITING_PLOT_DPI', '300'))
+plot_max_points = int(os.environ.get('DITING_PLOT_MAX_POINTS', '4000'))
+plot_spec_dir = os.path.join(cache_dir, 'plots')
+# 结果图像 (事件片段和各分辨率的图像) 的大小上限 (MB)，超过时按LRU删除，设为0时不限制
+plot_store_max_mb = float(os.environ.get('DITING_PLOT_STORE_MAX_MB', '1024'))
+# 实时连续拾取的数据源: tcp://host:port 或数据包文件路径，不设置时不启用
+# (多进程部署时每个工作进程都会各自消费数据源，实时拾取应使用单个工作进程)
+realtime_source = os.environ.get('DITING_REALTIME_SOURCE', '')
+realtime_buffer_seconds = float(os.environ.get('DITING_REALTIME_BUFFER_SECONDS', '600'))
+realtime_max_picks = int(os.environ.get('DITING_REALTIME_MAX_PICKS', '1000'))
+# 按请求性能分析: 开启后请求带 ?profile=1 时返回 cProfile 结果的下载地址
+profiling_enabled = os.environ.get('DITING_PROFILING', '0') == '1'
+profile_dir = os.path.join(cache_dir, 'profiles')
+profile_keep = int(os.environ.get('DITING_PROFILE_KEEP', '50'))
+# 启动: onnxruntime 图优化结果的磁盘缓存、加载后的预热推理、请求等待模型加载的最长时间 (秒)
+ort_graph_cache_dir = os.path.join(cache_dir, 'ort') if os.environ.get('DITING_ORT_GRAPH_CACHE', '1') == '1' else None
+warmup_enabled = os.environ.get('DITING_WARMUP', '1') == '1'
+model_wait_seconds = float(os.environ.get('DITING_MODEL_WAIT_SECONDS', '60'))
+# STA/LTA 门控: 只对触发区间 (两侧各扩展 margin) 附近的窗口运行模型，默认关闭，效果用 sta_lta_gate.py 评估
+# (只作用于整体读入的文件，流式处理的大文件和实时拾取不门控)
+sta_lta_gate = None
+if os.environ.get('DITING_STA_LTA_GATE', '0') == '1':
+    sta_lta_gate = StaLtaGate(
+        sta_seconds=float(os.environ.get('DITING_STA_SECONDS', '1')),
+        lta_seconds=float(os.environ.get('DITING_LTA_SECONDS', '30')),
+        on=float(os.environ.get('DITING_STA_LTA_ON', '2.5')),
+        off=float(os.environ.get('DITING_STA_LTA_OFF', '1')),
+        margin_seconds=float(os.environ.get('DITING_GATE_MARGIN_SECONDS', '30')))
+
+# 推理参数，同时作为结果缓存键的一部分
+inference_params = {
+    'window_length': 10000,
+    'step_size': 3000,
+    'p_th': 0.1,
+    's_th': 0.1,
+    'det_th': 0.3,
+}
 
 parent_dir = os.path.dirname(base_dir)
 
@@ -37,26 +154,433 @@ logger.info(f"图片目录: {pictures_dir}")
 # 修正目录名称
 tempdir = resources_dir
 app = Flask(__name__, static_folder=resources_dir, static_url_path='/resources')
+# 上传文件不在内存中缓冲，见 upload_spool.py
+upload_max_bytes = int(upload_max_mb * 1024 * 1024) if upload_max_mb > 0 else None
+app.request_class = make_request_class(upload_spool_dir, max_bytes=upload_max_bytes,
+                                       check_format=upload_format_check)
+app.config['MAX_CONTENT_LENGTH'] = upload_max_bytes
 
 # 启用 CORS，允许所有源
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(app, resources={r"/*": {"origins": "*"}},
+     expose_headers=['X-Profile-Url', 'X-DiTing-Analysis-Id', 'X-Confidence-Decimate', 'X-Confidence-Dtype',
+                     'X-Start-Index', 'X-Start-Time', 'X-Sampling-Rate',
+                     'X-Envelope-Traces', 'X-Envelope-Level', 'X-Envelope-Bin-Samples', 'X-Envelope-Scales'])
 logger.info("已启用CORS，允许所有源")
 
+# 指标，由 /metrics 以 Prometheus 文本格式输出 (每个工作进程分别统计)
+metrics_registry = Registry()
+metric_requests = metrics_registry.counter(
+    'diting_requests_total', '处理的请求数', ('endpoint', 'method', 'status'))
+metric_request_errors = metrics_registry.counter(
+    'diting_request_errors_total', '返回5xx状态码的请求数', ('endpoint',))
+metric_request_seconds = metrics_registry.histogram(
+    'diting_request_duration_seconds', '请求处理耗时 (秒)', ('endpoint',))
+metric_stage_seconds = metrics_registry.histogram(
+    'diting_stage_duration_seconds', '各处理阶段的耗时 (秒)', ('stage',))
+metric_windows = metrics_registry.counter(
+    'diting_windows_processed_total', '完成推理的窗口数')
+metric_windows_skipped = metrics_registry.counter(
+    'diting_windows_skipped_total', '被STA/LTA门控跳过的窗口数 (已计入 diting_windows_processed_total)')
+metric_in_flight = metrics_registry.gauge(
+    'diting_requests_in_flight', '正在处理的请求数', ('endpoint',))
+metric_jobs_active = metrics_registry.gauge(
+    'diting_jobs_active', '排队和运行中的异步任务数')
+metric_model_info = metrics_registry.gauge(
+    'diting_model_info', '模型会话信息', ('model', 'providers', 'intra_op_threads', 'inter_op_threads',
+                                    'batch_size', 'pid'))
+metric_model_loaded = metrics_registry.gauge(
+    'diting_model_loaded', '模型是否已加载')
+metric_ready = metrics_registry.gauge(
+    'diting_ready', '模型是否已加载并完成预热')
+metric_startup_seconds = metrics_registry.gauge(
+    'diting_startup_seconds', '启动各阶段的耗时 (秒)，ready/first_request 为从进程启动算起的时间', ('phase',))
+
+def observe_timings(timings):
+    """记录 DiTing_predict_onnx 返回的各阶段耗时"""
+    stages = ('windows', 'session_run', 'accumulate', 'postprocess') + (('gate',) if sta_lta_gate is not None else ())
+    for stage in stages:
+        if stage in timings:
+            metric_stage_seconds.observe(timings[stage], stage=stage)
+    metric_windows.inc(timings.get('num_windows', 0))
+    metric_windows_skipped.inc(timings.get('windows_skipped', 0))
+
+def _request_endpoint():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+# 同一时间只能有一个 cProfile 分析器处于活动状态
+profile_lock = threading.Lock()
+
+@app.before_request
+def _before_request():
+    g.request_start = time.perf_counter()
+    g.endpoint_label = _request_endpoint()
+    metric_in_flight.inc(endpoint=g.endpoint_label)
+    g.profiler = None
+    if profiling_enabled and request.args.get('profile') == '1' and profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def _after_request(response):
+    endpoint = g.get('endpoint_label', 'unmatched')
+    if endpoint not in PROBE_ENDPOINTS and 'first_request_seconds' not in startup_state:
+        record_first_request(time.perf_counter() - g.request_start if 'request_start' in g else 0.0)
+    metric_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if response.status_code >= 500:
+        metric_request_errors.inc(endpoint=endpoint)
+    if 'request_start' in g:
+        metric_request_seconds.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    profiler = g.get('profiler')
+    if profiler is not None:
+        g.profiler = None
+        profiler.disable()
+        profile_lock.release()
+        response.headers['X-Profile-Url'] = f"/profiles/{save_profile(profiler)}"
+    elif profiling_enabled and request.args.get('profile') == '1':
+        response.headers['X-Profile-Skipped'] = 'another request is being profiled'
+    return response
+
+@app.teardown_request
+def _teardown_request(exc):
+    if 'endpoint_label' in g:
+        metric_in_flight.dec(endpoint=g.endpoint_label)
+    profiler = g.get('profiler')
+    if profiler is not None:
+        # 请求异常结束，after_request 未执行
+        g.profiler = None
+        profiler.disable()
+        profile_lock.release()
+
+def save_profile(profiler):
+    """保存 cProfile 结果 (可用 pstats 或 snakeviz 打开)，只保留最近 profile_keep 个"""
+    os.makedirs(profile_dir, exist_ok=True)
+    name = f"{datetime.now().strftime('%y%m%d%H%M%S')}_{os.getpid()}_{threading.get_ident()}.prof"
+    profiler.dump_stats(os.path.join(profile_dir, name))
+    profiles = sorted(os.listdir(profile_dir), key=lambda f: os.path.getmtime(os.path.join(profile_dir, f)))
+    for old in profiles[:max(len(profiles) - profile_keep, 0)]:
+        os.remove(os.path.join(profile_dir, old))
+    return name
+
 # 载入模型
+# 在 gunicorn 等预派生(pre-fork)服务器下，每个工作进程各自导入本模块，因此各自只加载一次会话。
+# 加载和预热在启动线程中进行 (见 start_model_loader)，模块导入后即可响应 /health，
+# 需要模型的请求最多等待 model_wait_seconds 秒
+ort_session = None
+model_loaded = threading.Event()
+model_ready = threading.Event()
+# 启动阶段和各阶段耗时，由 /ready 返回
+startup_state = {'phase': 'importing'}
+# 探活和监控请求不计为首个请求
+PROBE_ENDPOINTS = ('/health', '/ready', '/metrics')
+
+def _set_startup_seconds(phase, seconds):
+    startup_state[f'{phase}_seconds'] = round(seconds, 3)
+    metric_startup_seconds.set(seconds, phase=phase)
+
+def load_model():
+    """加载ONNX会话 (使用图优化缓存) 并预热，完成后启动实时拾取"""
+    global ort_session
+    startup_state['phase'] = 'loading'
+    t0 = time.perf_counter()
+    try:
+        logger.info(f"正在加载ONNX模型: {model_path} (进程 {os.getpid()}, "
+                    f"intra_op={ort_intra_op_threads}, inter_op={ort_inter_op_threads})")
+        if ort_graph_cache_dir is None:
+            startup_state['graph_cache'] = 'disabled'
+        else:
+            cached = os.path.exists(os.path.join(ort_graph_cache_dir, optimized_model_filename(model_path)))
+            startup_state['graph_cache'] = 'hit' if cached else 'miss'
+        ort_session = load_onnx_model(model_path,
+                                      intra_op_num_threads=ort_intra_op_threads,
+                                      inter_op_num_threads=ort_inter_op_threads,
+                                      allow_spinning=ort_allow_spinning,
+                                      optimized_cache_dir=ort_graph_cache_dir)
+        _set_startup_seconds('model_load', time.perf_counter() - t0)
+        logger.info(f"模型加载成功，耗时 {startup_state['model_load_seconds']} 秒")
+    except Exception as e:
+        logger.error(f"加载模型失败: {str(e)}")
+        traceback.print_exc()
+        ort_session = None
+        startup_state.update(phase='failed', error=str(e))
+        return
+    finally:
+        model_loaded.set()
+
+    if warmup_enabled:
+        startup_state['phase'] = 'warming_up'
+        try:
+            _set_startup_seconds('warmup', warm_up_session(
+                ort_session, inference_params['window_length'], inference_params['step_size'],
+                inference_batch_size))
+            # 绘图在第一次请求结果图像时才导入 pyplot，这里提前导入
+            import matplotlib.pyplot
+            logger.info(f"预热完成，耗时 {startup_state['warmup_seconds']} 秒")
+        except Exception as e:
+            # 预热失败不影响服务，只是第一个请求会慢一些
+            logger.warning(f"预热失败: {str(e)}")
+    startup_state['phase'] = 'ready'
+    _set_startup_seconds('ready', time.time() - process_started)
+    model_ready.set()
+    logger.info(f"服务就绪，距进程启动 {startup_state['ready_seconds']} 秒")
+    start_realtime_consumer()
+
+def start_model_loader():
+    threading.Thread(target=load_model, name='model-loader', daemon=True).start()
+
+def wait_for_model():
+    """
+    等待模型加载完成
+
+    Returns:
+        模型不可用时的错误响应，可用时返回None
+    """
+    if not model_loaded.wait(model_wait_seconds):
+        return jsonify({"error": "模型正在加载，请稍后重试"}), 503
+    if ort_session is None:
+        logger.error("模型未正确加载，无法处理请求")
+        return jsonify({"error": "模型未正确加载，请检查服务器日志"}), 500
+    return None
+
+def record_first_request(latency):
+    """记录首个 (非探活) 请求完成的时间"""
+    _set_startup_seconds('first_request', time.time() - process_started)
+    _set_startup_seconds('first_request_latency', latency)
+    logger.info(f"首个请求完成，距进程启动 {startup_state['first_request_seconds']} 秒，"
+                f"请求耗时 {startup_state['first_request_latency_seconds']} 秒")
+
+# matplotlib.pyplot 使用全局状态，绘图需要加锁
+plot_lock = threading.Lock()
+os.makedirs(plot_spec_dir, exist_ok=True)
+plot_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='plot') if plot_mode == 'background' else None
+
+# 结果图像的存储，多个工作进程共享同一目录
+plot_store = None
+if plot_store_max_mb > 0:
+    try:
+        plot_store = PlotStore(plot_spec_dir, pictures_dir, max_bytes=int(plot_store_max_mb * 1024 * 1024))
+        logger.info(f"结果图像存储目录: {plot_spec_dir} (上限 {plot_store_max_mb} MB)")
+    except Exception as e:
+        logger.error(f"初始化结果图像存储失败，将不淘汰结果图像: {str(e)}")
+
+def plot_spec_path(plot_filename):
+    """延迟绘图所需数据的保存路径"""
+    return event_slice_path(plot_spec_dir, plot_filename)
+
+def track_plot(plot_filename):
+    """在结果图像存储中登记新保存的事件片段或图像，超过上限时淘汰最久未使用的结果图像"""
+    if plot_store is None:
+        return
+    try:
+        plot_store.add(plot_filename)
+    except Exception as e:
+        logger.warning(f"登记结果图像失败: {str(e)}")
+
+def plot_variant_filename(plot_filename, dpi):
+    """非默认分辨率的图像文件名"""
+    if dpi == plot_dpi:
+        return plot_filename
+    stem, ext = os.path.splitext(plot_filename)
+    return f"{stem}_{dpi}dpi{ext}"
+
+def render_plot_file(plot_filename, dpi=None):
+    """
+    由保存的事件片段绘制结果图像
+
+    Args:
+        plot_filename: 默认分辨率的图像文件名
+        dpi: 分辨率，None表示默认分辨率
+
+    Returns:
+        生成的图像文件名，没有绘图数据时返回None
+    """
+    dpi = dpi or plot_dpi
+    target = plot_variant_filename(plot_filename, dpi)
+    save_path = os.path.join(pictures_dir, target)
+    spec_path = plot_spec_path(plot_filename)
+    with plot_lock:
+        if os.path.exists(save_path):
+            return target
+        if not os.path.exists(spec_path):
+            return None
+        logger.info(f"生成可视化结果，保存至: {save_path}")
+        with metric_stage_seconds.time(stage='plot_render'):
+            render_event_plot(load_event_slice(spec_path), output_file=save_path,
+                              dpi=dpi, max_points=plot_max_points)
+    track_plot(plot_filename)
+    return target
+
+# 结果缓存，多个工作进程共享同一目录
+result_cache = None
+if cache_max_mb > 0:
+    try:
+        result_cache = ResultCache(cache_dir, max_bytes=int(cache_max_mb * 1024 * 1024))
+        logger.info(f"结果缓存目录: {cache_dir} (上限 {cache_max_mb} MB)")
+    except Exception as e:
+        logger.error(f"初始化结果缓存失败，将不使用缓存: {str(e)}")
+
+def result_cache_key(data=None, path=None, digest=None):
+    """由文件内容、推理参数和模型标识计算缓存键"""
+    params = dict(inference_params, model=model_identity(model_path))
+    if sta_lta_gate is not None:
+        params['gate'] = sta_lta_gate.config()
+    return cache_key(params, data=data, path=path, digest=digest)
+
+def lookup_cached_result(key):
+    """查询结果缓存，命中时确保对应的结果图像仍在图片目录中"""
+    if result_cache is None:
+        return None
+    try:
+        hit = result_cache.get(key)
+    except Exception as e:
+        logger.warning(f"查询结果缓存失败: {str(e)}")
+        return None
+    if hit is None:
+        return None
+    result, cached_plot = hit
+    plot_filename = result.get('plot_filename')
+    if plot_filename and not os.path.exists(os.path.join(pictures_dir, plot_filename)):
+        if cached_plot:
+            shutil.copyfile(cached_plot, os.path.join(pictures_dir, plot_filename))
+            track_plot(plot_filename)
+        elif not os.path.exists(plot_spec_path(plot_filename)):
+            result['plot_filename'] = None
+    return result
+
+# 解码后波形的存储，多个工作进程共享同一目录
+waveform_store = None
+if waveform_store_max_mb > 0:
+    try:
+        waveform_store = WaveformStore(waveform_store_dir, max_bytes=int(waveform_store_max_mb * 1024 * 1024))
+        logger.info(f"波形存储目录: {waveform_store_dir} (上限 {waveform_store_max_mb} MB)")
+    except Exception as e:
+        logger.error(f"初始化波形存储失败，将每次重新解码: {str(e)}")
+
+# 保留的置信度曲线，多个工作进程共享同一目录
+confidence_store = None
+if confidence_store_max_mb > 0:
+    try:
+        confidence_store = ConfidenceStore(confidence_store_dir,
+                                           max_bytes=int(confidence_store_max_mb * 1024 * 1024))
+        logger.info(f"置信度存储目录: {confidence_store_dir} (上限 {confidence_store_max_mb} MB)")
+    except Exception as e:
+        logger.error(f"初始化置信度存储失败，将不支持重新拾取: {str(e)}")
+
+# 波形和置信度曲线的包络金字塔，供交互式缩放查看
+envelope_store = None
+if envelope_store_max_mb > 0:
+    try:
+        envelope_store = EnvelopeStore(envelope_store_dir, max_bytes=int(envelope_store_max_mb * 1024 * 1024),
+                                       factor=envelope_factor)
+        logger.info(f"包络存储目录: {envelope_store_dir} (上限 {envelope_store_max_mb} MB，每级降采样 {envelope_factor} 倍)")
+    except Exception as e:
+        logger.error(f"初始化包络存储失败，将不支持交互式波形查看: {str(e)}")
+
+# 震相拾取目录，多个工作进程共享同一个数据库
+pick_catalog = None
+if pick_catalog_enabled:
+    try:
+        pick_catalog = PickCatalog(pick_catalog_path)
+        logger.info(f"震相拾取目录: {pick_catalog_path}")
+    except Exception as e:
+        logger.error(f"初始化震相拾取目录失败，将不保存拾取: {str(e)}")
+
+def record_picks(analysis_id, station, starttime, events_matches, source, filename=None):
+    """把一次分析中一个台站的拾取写入目录，失败时只记录警告"""
+    if pick_catalog is None:
+        return
+    try:
+        with metric_stage_seconds.time(stage='pick_catalog'):
+            pick_catalog.record(analysis_id, station, starttime, MODEL_SAMPLING_RATE, events_matches,
+                                source=source, filename=filename)
+    except Exception as e:
+        logger.warning(f"写入震相拾取目录失败: {str(e)}")
+
+# 影响模拟，人口栅格内存映射打开，多个工作进程共享页缓存
+impact_simulator = None
 try:
-    logger.info(f"正在加载ONNX模型: {model_path}")
-    ort_session = load_onnx_model(model_path)
-    logger.info("模型加载成功")
+    population_grid = None
+    if os.path.exists(os.path.join(population_grid_dir, 'meta.json')):
+        population_grid = PopulationGrid(population_grid_dir)
+        logger.info(f"人口栅格: {population_grid_dir} ({population_grid.cells} 个有人口的格网)")
+    else:
+        logger.info("未找到人口栅格，影响人口按城市人口估算")
+    impact_simulator = ImpactSimulator(population_grid,
+                                       cities=load_points(impact_cities_path, DEFAULT_CITIES),
+                                       facilities=load_points(impact_facilities_path, DEFAULT_FACILITIES))
+except Exception as e:
+    logger.error(f"初始化影响模拟失败: {str(e)}")
+
+# USGS feed 由后台线程定时拉取，拉取结果在工作进程之间共享
+usgs_feeds = {}
+try:
+    usgs_feeds = {name: FeedCache(name, source, poll_seconds=usgs_poll_seconds, store_dir=usgs_store_dir)
+                  for name, source in parse_feeds(usgs_feeds_spec).items()}
 except Exception as e:
-    logger.error(f"加载模型失败: {str(e)}")
-    traceback.print_exc()
-    ort_session = None
+    logger.error(f"初始化 USGS feed 缓存失败: {str(e)}")
+
+def start_usgs_pollers():
+    for feed in usgs_feeds.values():
+        feed.start()
+
+def load_waveform(digest, decode):
+    """
+    取得待分析的波形: 波形存储中已有该文件时直接内存映射，不再解码；
+    否则解码后写入存储。文件包含多个台站时分析第一个三分量齐全的台站。
+
+    Args:
+        digest: 文件内容的哈希
+        decode: 无参函数，返回解码后的ObsPy Stream
+
+    Returns:
+        (stream, waveform)：waveform为内存映射的[3, n]数组，不使用存储时为None，
+        此时stream为解码结果
+
+    Raises:
+        WaveformSpanError: 间断或时长超出上限 (见 DITING_MAX_GAP_SECONDS / DITING_MAX_WAVEFORM_SECONDS)
+    """
+    if waveform_store is not None:
+        try:
+            entries = waveform_store.get(digest)
+        except Exception as e:
+            logger.warning(f"查询波形存储失败: {str(e)}")
+            entries = None
+        if entries:
+            logger.info(f"波形存储命中: {digest[:12]} ({entries[0].station})，跳过解码")
+            waveform = entries[0].open()
+            return entries[0].to_stream(waveform), waveform
+    with metric_stage_seconds.time(stage='decode'):
+        stream = decode()
+    if waveform_store is not None and stream:
+        try:
+            with metric_stage_seconds.time(stage='waveform_store'):
+                entries = waveform_store.put(digest, stream)
+        except WaveformSpanError:
+            # 间断或时长超出上限，整体组装同样会失败，直接报告给客户端
+            raise
+        except Exception as e:
+            logger.warning(f"写入波形存储失败: {str(e)}")
+            entries = None
+        if entries:
+            waveform = entries[0].open()
+            return entries[0].to_stream(waveform), waveform
+    return stream, None
+
+def store_cached_result(key, result):
+    """将分析结果和图像写入缓存，失败时只记录日志"""
+    if result_cache is None:
+        return
+    plot_filename = result.get('plot_filename')
+    plot_file = os.path.join(pictures_dir, plot_filename) if plot_filename else None
+    try:
+        result_cache.put(key, result, plot_file=plot_file)
+    except Exception as e:
+        logger.warning(f"写入结果缓存失败: {str(e)}")
 
 def numpy_to_list(data):
     if isinstance(data, np.ndarray):
         return data.tolist()
     # 添加 UTCDateTime 类型处理
-    elif isinstance(data, obspy.UTCDateTime):
+    elif 'obspy' in sys.modules and isinstance(data, sys.modules['obspy'].UTCDateTime):
         return data.strftime("%Y-%m-%dT%H:%M:%S.%fZ")  # 转换为ISO格式字符串
     elif isinstance(data, (np.int64, np.int32, np.int16, np.int8, np.uint64, np.uint32, np.uint16, np.uint8)):
         return int(data)
@@ -69,11 +593,238 @@ def numpy_to_list(data):
     else:
         return data
 
+def format_matches(events_matches):
+    """
+    将后处理得到的事件匹配整理为前端需要的震相列表
+
+    Args:
+        events_matches: DiTing_predict_onnx 返回的事件匹配
+            结构: [[bg, [[p_idx, p_prob]], [[s_idx, s_prob]]], ...]
+
+    Returns:
+        包含 p/s 到时索引和置信度列表的字典
+    """
+    logger.info("处理事件数据以匹配前端格式...")
+    p_arrival_indices = []
+    s_arrival_indices = []
+    p_confidence_list = []
+    s_confidence_list = []
+
+    # 处理 DiTing_predict_onnx 返回的 events_matches 结构
+    if events_matches and not (len(events_matches) == 1 and np.isnan(events_matches[0][0])):
+        for match in events_matches:
+            try:
+                # 提取 P 波信息
+                p_info = match[1][0]
+                p_idx = p_info[0]
+                p_prob = p_info[1]
+                if not np.isnan(p_idx):
+                    p_arrival_indices.append(p_idx)
+                    p_confidence_list.append(p_prob)
+                else:
+                    # 如果 P 波无效，则跳过此事件或添加 None？根据需求，这里跳过
+                    logger.warning("检测到无效 P 波索引，跳过此事件匹配。")
+                    continue # 或者都添加 None? p_arrival_indices.append(None), p_confidence_list.append(None)
+
+                # 提取 S 波信息
+                s_info = match[2][0]
+                s_idx = s_info[0]
+                s_prob = s_info[1]
+                s_arrival_indices.append(None if np.isnan(s_idx) else s_idx)
+                s_confidence_list.append(None if np.isnan(s_prob) else s_prob)
+
+            except (IndexError, TypeError) as e:
+                logger.error(f"处理事件匹配时出错: {match}，错误: {e}")
+                # 如果单个事件处理失败，可以选择跳过或添加 None
+                # 这里选择不添加，避免数据不一致
+                continue 
+    else:
+        logger.info("未检测到有效事件或事件列表为空。")
+
+    # 确保所有列表长度一致 (如果上面处理逻辑没问题，应该是一致的)
+    # assert len(p_arrival_indices) == len(s_arrival_indices) == len(p_confidence_list) == len(s_confidence_list)
+
+    # 转换 NumPy 类型为 Python 内置类型，并处理 None
+    final_p_indices = numpy_to_list(p_arrival_indices)
+    final_s_indices = numpy_to_list(s_arrival_indices)
+    final_p_confidence = numpy_to_list(p_confidence_list)
+    final_s_confidence = numpy_to_list(s_confidence_list)
+
+    return {
+        'p_arrival_indices': final_p_indices,
+        's_arrival_indices': final_s_indices,
+        'p_confidence': final_p_confidence,
+        's_confidence': final_s_confidence,
+    }
+
+def analyze_stream(stream, filename, progress_callback=None, return_confidence=False, waveform=None,
+                   analysis_id=None, file_key=None):
+    """
+    对已读取的数据流运行模型、生成结果图像，并整理为前端需要的格式
+
+    Args:
+        stream: ObsPy Stream对象
+        filename: 上传的文件名，用于生成图像文件名
+        progress_callback: 传给DiTing_predict_onnx的进度回调
+        return_confidence: 为True时同时返回置信度曲线
+        waveform: 可选的已组装波形 (见load_waveform)，给出时推理直接从中取窗口
+        analysis_id: 分析ID (结果缓存键)，给出时保留置信度曲线供 /repick 使用，计算包络金字塔供 /envelope 使用，
+            拾取写入震相目录，并写入结果
+        file_key: 文件内容的哈希，/envelope 放大到原始采样点时从波形存储读取
+
+    Returns:
+        结果字典；return_confidence为True时返回 (结果字典, 置信度[1, 3, length])
+
+    Raises:
+        ValueError: 无法从数据流中提取采样率/起始时间
+    """
+    # 提取元数据
+    try:
+        # 拾取的采样点索引对应组装后的波形: 从三个分量中最早的起始时间开始，采样率为模型采样率
+        sampling_rate = MODEL_SAMPLING_RATE
+        # 多台站数据只分析第一个三分量齐全的台站 (与波形存储的第一个台站相同)，不跨台站拼接
+        stream = select_station(stream)
+        start_time_obj = waveform_starttime(stream)
+        # 转换为 ISO 8601 UTC 字符串
+        start_time_iso = start_time_obj.isoformat()
+        logger.info(f"提取元数据: 采样率={sampling_rate} Hz, 起始时间={start_time_iso}")
+    except (AttributeError, IndexError, ValueError) as e:
+        logger.error(f"从数据流提取元数据失败: {str(e)}")
+        raise ValueError(f"无法从文件中提取必要的元数据（采样率/起始时间）: {str(e)}")
+
+    # 使用模型处理数据
+    logger.info("开始处理数据...")
+    # 注意：DiTing_predict_onnx 返回的 'events' 实际上是 postprocessor 的 'matches'
+    # 结构: [[bg, [[p_idx, p_prob]], [[s_idx, s_prob]]], ...]
+    timings = {}
+    events_matches, confidence_waveforms = DiTing_predict_onnx(
+        ort_session, stream, 
+        **inference_params,
+        batch_size=inference_batch_size,
+        progress_callback=progress_callback,
+        timings=timings,
+        gate=sta_lta_gate,
+        waveform=waveform
+    )
+    observe_timings(timings)
+    logger.info(f"模型处理完成，检测到 {len(events_matches)} 个匹配事件结构")
+
+    # 保存结果图像
+    timestamp = datetime.now().strftime("%y%m%d%H%M%S")
+    # 使用原始文件名的一部分创建更可读的图像文件名
+    base_filename = os.path.splitext(filename)[0]
+    plot_filename = f"{base_filename}_{timestamp}.png"
+    save_path = os.path.join(pictures_dir, plot_filename)
+
+    try:
+        # 只截取和滤波事件片段；绘图本身按 plot_mode 推迟到请求图片时或后台进行
+        with metric_stage_seconds.time(stage='plot_extract'):
+            event_slice = extract_event_slice(stream, events_matches)
+            if event_slice is not None:
+                save_event_slice(event_slice, plot_spec_path(plot_filename))
+                track_plot(plot_filename)
+        if event_slice is None:
+            plot_filename = None # 设为 None 表示无图
+        else:
+            if plot_mode == 'sync':
+                render_plot_file(plot_filename)
+            elif plot_executor is not None:
+                plot_executor.submit(render_plot_file, plot_filename)
+    except Exception as vis_e:
+         logger.error(f"生成可视化图像时出错: {str(vis_e)}")
+         # 即使可视化失败，也尝试返回数据
+         plot_filename = None # 设为 None 表示无图
+
+    # 同步绘图时检查图像是否成功生成
+    if plot_filename and plot_mode == 'sync' and not os.path.exists(save_path):
+        logger.warning(f"图像文件未成功生成: {save_path}")
+        plot_filename = None # 设为 None 表示无图
+
+    result = format_matches(events_matches)
+    result.update({
+        'plot_filename': plot_filename,
+        'start_time_utc': start_time_iso,
+        'sampling_rate_hz': sampling_rate
+    })
+    if analysis_id is not None:
+        record_picks(analysis_id, station_id(stream.select(channel='*HZ')[0]), start_time_obj,
+                     events_matches, 'process', filename)
+    if analysis_id is not None and confidence_store is not None:
+        try:
+            with metric_stage_seconds.time(stage='confidence_store'):
+                confidence_store.put(analysis_id, confidence_waveforms, {
+                    'filename': filename,
+                    'start_time_utc': start_time_iso,
+                    'sampling_rate_hz': sampling_rate,
+                    'inference_params': inference_params,
+                })
+            result['analysis_id'] = analysis_id
+        except Exception as e:
+            logger.warning(f"保存置信度曲线失败: {str(e)}")
+    if analysis_id is not None and envelope_store is not None:
+        try:
+            with metric_stage_seconds.time(stage='envelope'):
+                traces = [stream.select(channel=ch)[0] for ch in CHANNELS]
+                envelope_store.put(analysis_id, waveform if waveform is not None else assemble_waveform(stream),
+                                   confidence_waveforms, start_time_obj.timestamp, sampling_rate,
+                                   file_key=file_key, station=station_id(traces[0]),
+                                   channels=[tr.stats.channel for tr in traces])
+            result['analysis_id'] = analysis_id
+        except Exception as e:
+            logger.warning(f"保存包络金字塔失败: {str(e)}")
+    if return_confidence:
+        return result, confidence_waveforms
+    return result
+
+def parse_confidence_options(args):
+    """
+    解析 /process 的置信度导出参数
+
+    confidence: npy 或 packed，不提供时只返回JSON结果
+    confidence_dtype: float16 (默认) 或 float32
+    confidence_decimate: 降采样倍数，默认 1
+
+    Returns:
+        None 或 (格式, 数据类型, 降采样倍数)
+
+    Raises:
+        ValueError: 参数无效
+    """
+    fmt = args.get('confidence')
+    if not fmt:
+        return None
+    if fmt not in ('npy', 'packed'):
+        raise ValueError(f"不支持的置信度格式: {fmt}，可选 npy, packed")
+    dtype = args.get('confidence_dtype', 'float16')
+    try:
+        decimate = int(args.get('confidence_decimate', '1'))
+    except ValueError:
+        raise ValueError("confidence_decimate 必须为正整数")
+    # 提前检查数据类型和降采样倍数，避免推理完成后才报错
+    encode_confidence(np.zeros((3, 1), dtype=np.float32), dtype=dtype, decimate=decimate)
+    return fmt, dtype, decimate
+
+def confidence_response(result, confidence, options, analysis_id):
+    """按导出参数把置信度曲线编码为二进制响应"""
+    fmt, dtype, decimate = options
+    data = encode_confidence(confidence, dtype=dtype, decimate=decimate)
+    if fmt == 'npy':
+        # 震相结果可能很长，超出代理和服务器的响应头大小限制，响应头中只放分析ID，结果由 /results/<analysis_id> 获取
+        response = Response(to_npy_bytes(data), mimetype='application/octet-stream')
+        response.headers['X-DiTing-Analysis-Id'] = analysis_id
+    else:
+        response = Response(pack_confidence(data, result['sampling_rate_hz'], decimate, metadata=result),
+                            mimetype='application/octet-stream')
+    response.headers['X-Confidence-Decimate'] = str(decimate)
+    response.headers['X-Confidence-Dtype'] = dtype
+    logger.info(f"返回置信度曲线: {fmt}, {dtype}, 降采样 {decimate}, {response.content_length} 字节")
+    return response
+
 @app.route('/process', methods=['POST'])
 def process_file():
-    if ort_session is None:
-        logger.error("模型未正确加载，无法处理请求")
-        return jsonify({"error": "模型未正确加载，请检查服务器日志"}), 500
+    error = wait_for_model()
+    if error is not None:
+        return error
     
     try:
         logger.info("接收到文件上传请求")
@@ -91,14 +842,29 @@ def process_file():
             return jsonify({"error": "上传的文件名为空"}), 400
             
         logger.info(f"处理文件: {file.filename}")
+
+        # 可选: 以二进制返回置信度曲线
+        try:
+            confidence_options = parse_confidence_options(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if confidence_options is not None and confidence_options[0] == 'npy' and result_cache is None:
+            return jsonify({"error": "confidence=npy 的震相结果需从结果缓存获取，未启用结果缓存时请使用 confidence=packed"}), 400
         
-        # 读取地震数据
+        # 读取地震数据: 上传时已写入暂存文件并计算了哈希，直接从文件解码
         try:
-            # 使用 BytesIO 包装文件流，避免文件指针问题
-            from io import BytesIO
-            file_content = file.read()
-            stream = obspy.read(BytesIO(file_content))
-            file.seek(0) # 重置文件指针以防万一
+            import obspy
+            spool = spooled(file)
+            digest = spool.digest
+            key = result_cache_key(digest=digest)
+            # 缓存中只有JSON结果，需要置信度曲线时重新推理；?no_cache=1 时跳过查询 (如压测时测量推理本身)
+            with metric_stage_seconds.time(stage='cache_lookup'):
+                use_cache = confidence_options is None and request.args.get('no_cache') != '1'
+                cached = lookup_cached_result(key) if use_cache else None
+            if cached is not None:
+                logger.info(f"结果缓存命中: {key[:12]}")
+                return jsonify(cached)
+            stream, waveform = load_waveform(digest, lambda: obspy.read(spool.path))
             logger.info(f"成功读取数据流，包含 {len(stream)} 条记录")
         except Exception as e:
             logger.error(f"读取文件失败: {str(e)}")
@@ -109,120 +875,832 @@ def process_file():
             logger.error("数据流为空")
             return jsonify({"error": "解析后的数据流为空"}), 400
             
-        # 提取元数据
-        try:
-            trace = stream[0] # 假设至少有一条记录
-            sampling_rate = trace.stats.sampling_rate
-            start_time_obj = trace.stats.starttime
-            # 转换为 ISO 8601 UTC 字符串
-            start_time_iso = start_time_obj.isoformat()
-            logger.info(f"提取元数据: 采样率={sampling_rate} Hz, 起始时间={start_time_iso}")
-        except (AttributeError, IndexError) as e:
-             logger.error(f"从数据流提取元数据失败: {str(e)}")
-             return jsonify({"error": f"无法从文件中提取必要的元数据（采样率/起始时间）: {str(e)}"}), 400
-
-        # 使用模型处理数据
-        logger.info("开始处理数据...")
-        # 注意：DiTing_predict_onnx 返回的 'events' 实际上是 postprocessor 的 'matches'
-        # 结构: [[bg, [[p_idx, p_prob]], [[s_idx, s_prob]]], ...]
-        events_matches, confidence_waveforms = DiTing_predict_onnx(
-            ort_session, stream, 
-            window_length=10000, step_size=3000, 
-            p_th=0.1, s_th=0.1, det_th=0.3
-        )
-        logger.info(f"模型处理完成，检测到 {len(events_matches)} 个匹配事件结构")
-        
-        # 保存结果图像
-        timestamp = datetime.now().strftime("%y%m%d%H%M%S")
-        # 使用原始文件名的一部分创建更可读的图像文件名
-        base_filename = os.path.splitext(file.filename)[0]
-        plot_filename = f"{base_filename}_{timestamp}.png"
-        save_path = os.path.join(pictures_dir, plot_filename)
-        
-        logger.info(f"生成可视化结果，保存至: {save_path}")
         try:
-            # 确保传递正确的 events 结构给 visualize_results
-            visualize_results(stream, events_matches, output_file=save_path)
-        except Exception as vis_e:
-             logger.error(f"生成可视化图像时出错: {str(vis_e)}")
-             # 即使可视化失败，也尝试返回数据
-             plot_filename = None # 设为 None 表示无图
+            result, confidence = analyze_stream(stream, file.filename, return_confidence=True, waveform=waveform,
+                                                analysis_id=key, file_key=digest)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        store_cached_result(key, result)
 
-        # 检查图像是否成功生成 (如果 visualize_results 没有抛出错误)
-        if plot_filename and not os.path.exists(save_path):
-            logger.warning(f"图像文件未成功生成: {save_path}")
-            plot_filename = None # 设为 None 表示无图
-            
-        logger.info("处理事件数据以匹配前端格式...")
-        p_arrival_indices = []
-        s_arrival_indices = []
-        p_confidence_list = []
-        s_confidence_list = []
-        
-        # 处理 DiTing_predict_onnx 返回的 events_matches 结构
-        if events_matches and not (len(events_matches) == 1 and np.isnan(events_matches[0][0])):
-            for match in events_matches:
-                try:
-                    # 提取 P 波信息
-                    p_info = match[1][0]
-                    p_idx = p_info[0]
-                    p_prob = p_info[1]
-                    if not np.isnan(p_idx):
-                        p_arrival_indices.append(p_idx)
-                        p_confidence_list.append(p_prob)
-                    else:
-                        # 如果 P 波无效，则跳过此事件或添加 None？根据需求，这里跳过
-                        logger.warning("检测到无效 P 波索引，跳过此事件匹配。")
-                        continue # 或者都添加 None? p_arrival_indices.append(None), p_confidence_list.append(None)
-                    
-                    # 提取 S 波信息
-                    s_info = match[2][0]
-                    s_idx = s_info[0]
-                    s_prob = s_info[1]
-                    s_arrival_indices.append(None if np.isnan(s_idx) else s_idx)
-                    s_confidence_list.append(None if np.isnan(s_prob) else s_prob)
-                    
-                except (IndexError, TypeError) as e:
-                    logger.error(f"处理事件匹配时出错: {match}，错误: {e}")
-                    # 如果单个事件处理失败，可以选择跳过或添加 None
-                    # 这里选择不添加，避免数据不一致
-                    continue 
-        else:
-            logger.info("未检测到有效事件或事件列表为空。")
+        logger.info("请求处理成功，返回格式化结果")
+        if confidence_options is not None:
+            return confidence_response(result, confidence, confidence_options, key)
+        with metric_stage_seconds.time(stage='json_encode'):
+            return jsonify(result)
         
-        # 确保所有列表长度一致 (如果上面处理逻辑没问题，应该是一致的)
-        # assert len(p_arrival_indices) == len(s_arrival_indices) == len(p_confidence_list) == len(s_confidence_list)
+    except HTTPException:
+        # 上传被拒绝 (大小超限、格式无法识别)，见 upload_error
+        raise
+    except Exception as e:
+        logger.error(f"处理过程中发生未知错误: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"error": f"处理过程中发生未知错误: {str(e)}"}), 500
 
-        # 转换 NumPy 类型为 Python 内置类型，并处理 None
-        final_p_indices = numpy_to_list(p_arrival_indices)
-        final_s_indices = numpy_to_list(s_arrival_indices)
-        final_p_confidence = numpy_to_list(p_confidence_list)
-        final_s_confidence = numpy_to_list(s_confidence_list)
+@app.route('/process/stream', methods=['POST'])
+def process_file_stream():
+    """
+    流式处理长波形文件，按NDJSON逐行返回已确定的事件
+
+    第一行为元数据 (起始时间、采样率)，之后每行一个事件，最后一行为汇总。
+    """
+    error = wait_for_model()
+    if error is not None:
+        return error
+
+    if 'file' not in request.files:
+        logger.error("请求中没有文件")
+        return jsonify({"error": "没有找到上传的文件"}), 400
+    file = request.files['file']
+    if file.filename == '':
+        logger.error("上传的文件名为空")
+        return jsonify({"error": "上传的文件名为空"}), 400
+
+    logger.info(f"流式处理文件: {file.filename}")
+    # 分块读取暂存文件，响应生成完后删除
+    spool = spooled(file)
+    tmp_path = spool.detach()
+    try:
+        reader = WaveformChunkReader(tmp_path, chunk_seconds=stream_chunk_seconds)
+        analysis_id = result_cache_key(digest=spool.digest)
+    except Exception as e:
+        os.remove(tmp_path)
+        logger.error(f"读取文件失败: {str(e)}")
+        return jsonify({"error": f"读取地震数据失败: {str(e)}"}), 400
+
+    def generate():
+        try:
+            yield json.dumps({
+                'start_time_utc': reader.starttime.isoformat(),
+                'sampling_rate_hz': reader.sampling_rate,
+                'npts': reader.npts
+            }) + '\n'
+            num_events = 0
+            events_matches = []
+            for bg, candidate_Ps, candidate_Ss in DiTing_predict_stream(
+                    ort_session, reader,
+                    **inference_params,
+                    batch_size=inference_batch_size):
+                events_matches.append([bg, candidate_Ps, candidate_Ss])
+                p_idx, p_prob = candidate_Ps[0]
+                s_idx, s_prob = candidate_Ss[0]
+                num_events += 1
+                yield json.dumps(numpy_to_list({
+                    'p_arrival_index': p_idx,
+                    'p_confidence': p_prob,
+                    'p_arrival_utc': reader.starttime + p_idx / reader.sampling_rate,
+                    's_arrival_index': None if np.isnan(s_idx) else s_idx,
+                    's_confidence': None if np.isnan(s_prob) else s_prob,
+                })) + '\n'
+            logger.info(f"流式处理完成，共 {num_events} 个事件")
+            record_picks(analysis_id, reader.station, reader.starttime, events_matches, 'stream', file.filename)
+            yield json.dumps({'done': True, 'num_events': num_events}) + '\n'
+        except Exception as e:
+            logger.error(f"流式处理过程中发生错误: {str(e)}")
+            traceback.print_exc()
+            yield json.dumps({'error': f"处理过程中发生错误: {str(e)}"}) + '\n'
+        finally:
+            os.remove(tmp_path)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/process/batch', methods=['POST'])
+def process_batch():
+    """
+    多台站批量分析
+
+    接受一个或多个文件 (表单字段 file，可重复)，每个文件可以是多台站波形或
+    .zip/.tar 压缩包。数据按台站分组，所有台站的窗口共享推理批次，
+    按台站返回震相拾取结果 (不生成结果图像)。
+    """
+    error = wait_for_model()
+    if error is not None:
+        return error
+
+    files = [f for f in request.files.getlist('file') if f.filename]
+    if not files:
+        logger.error("请求中没有文件")
+        return jsonify({"error": "没有找到上传的文件"}), 400
+
+    try:
+        import obspy
+        stream = obspy.Stream()
+        skipped_files = {}
+        digests = []
+        for file in files:
+            spool = spooled(file)
+            digests.append(spool.digest)
+            with metric_stage_seconds.time(stage='decode'):
+                file_stream, errors = read_waveforms(file.filename, spool.path)
+            stream += file_stream
+            skipped_files.update(errors)
+        logger.info(f"批量分析: {len(files)} 个文件，共 {len(stream)} 条记录")
+
+        stations, skipped_stations = group_by_station(stream)
+        if not stations:
+            return jsonify({"error": "没有找到包含 *HZ/*HN/*HE 三个通道的台站",
+                            "skipped_files": skipped_files,
+                            "skipped_stations": skipped_stations}), 400
+
+        t_begin = time.perf_counter()
+        timings = {}
+        results, failed = DiTing_predict_multi_station(
+            ort_session, stations,
+            **inference_params,
+            batch_size=inference_batch_size,
+            timings=timings
+        )
+        observe_timings(timings)
+        skipped_stations.update(failed)
+
+        # 同一组文件再次分析时替换目录中的拾取 (单个文件时与 /process 的分析ID相同)
+        digest = digests[0] if len(digests) == 1 else content_digest(data=''.join(digests).encode('ascii'))
+        analysis_id = result_cache_key(digest=digest)
+        filenames = ', '.join(file.filename for file in files)
+        station_results = {}
+        for sid, (events_matches, _) in results.items():
+            starttime = waveform_starttime(stations[sid])
+            station_result = format_matches(events_matches)
+            station_result.update({
+                'start_time_utc': starttime.isoformat(),
+                'sampling_rate_hz': MODEL_SAMPLING_RATE
+            })
+            station_results[sid] = station_result
+            record_picks(analysis_id, sid, starttime, events_matches, 'batch', filenames)
+        elapsed = time.perf_counter() - t_begin
+        logger.info(f"批量分析完成: {len(station_results)} 个台站，耗时 {elapsed:.3f} 秒")
 
-        logger.info("请求处理成功，返回格式化结果")
         return jsonify({
-            # 移除旧的 'events' 和 'confidence'
-            # 'events': events_list, 
-            # 'confidence': confidence_list, 
-            'plot_filename': plot_filename, # 重命名
-            'p_arrival_indices': final_p_indices,
-            's_arrival_indices': final_s_indices,
-            'p_confidence': final_p_confidence,
-            's_confidence': final_s_confidence,
-            'start_time_utc': start_time_iso,
-            'sampling_rate_hz': sampling_rate
+            'analysis_id': analysis_id,
+            'stations': station_results,
+            'skipped_stations': skipped_stations,
+            'skipped_files': skipped_files,
+            'elapsed_seconds': elapsed
         })
-        
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"处理过程中发生未知错误: {str(e)}")
+        logger.error(f"批量分析过程中发生未知错误: {str(e)}")
         traceback.print_exc()
         return jsonify({"error": f"处理过程中发生未知错误: {str(e)}"}), 500
 
+def _run_analysis_job(job):
+    """异步任务的处理函数: 从临时文件读取数据并分析"""
+    path = job.payload['path']
+    digest = job.payload['digest']
+    key = result_cache_key(digest=digest)
+    cached = lookup_cached_result(key)
+    if cached is not None:
+        logger.info(f"任务 {job.id} 结果缓存命中: {key[:12]}")
+        return cached
+    import obspy
+    stream, waveform = load_waveform(digest, lambda: obspy.read(path))
+    if not stream:
+        raise ValueError("解析后的数据流为空")
+    logger.info(f"任务 {job.id} 成功读取数据流，包含 {len(stream)} 条记录")
+    result = analyze_stream(stream, job.payload['filename'], progress_callback=job.report_progress,
+                            waveform=waveform, analysis_id=key, file_key=digest)
+    store_cached_result(key, result)
+    return result
+
+job_manager = JobManager(_run_analysis_job, max_workers=job_workers, max_pending=job_queue_size,
+                         state_path=job_state_path or None)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """提交异步分析任务，立即返回任务ID"""
+    error = wait_for_model()
+    if error is not None:
+        return error
+
+    # 队列已满时在读取请求体 (request.files) 之前拒绝，不接收上传内容
+    if job_manager.active_count() >= job_manager.max_workers + job_manager.max_pending:
+        logger.warning("任务队列已满，拒绝提交")
+        return jsonify({"error": "服务器繁忙，任务队列已满，请稍后重试"}), 503, {'Retry-After': '10'}
+
+    if 'file' not in request.files:
+        logger.error("请求中没有文件")
+        return jsonify({"error": "没有找到上传的文件"}), 400
+    file = request.files['file']
+    if file.filename == '':
+        logger.error("上传的文件名为空")
+        return jsonify({"error": "上传的文件名为空"}), 400
+
+    # 暂存文件留给任务读取，任务结束后删除
+    spool = spooled(file)
+    tmp_path = spool.detach()
+    try:
+        job = job_manager.submit({'path': tmp_path, 'filename': file.filename, 'digest': spool.digest},
+                                 cleanup=lambda: os.remove(tmp_path))
+    except QueueFullError as e:
+        os.remove(tmp_path)
+        logger.warning(f"拒绝提交任务: {str(e)}")
+        return jsonify({"error": "服务器繁忙，任务队列已满，请稍后重试"}), 503, {'Retry-After': '10'}
+
+    logger.info(f"已提交任务 {job.id}: {file.filename}")
+    return jsonify(job.to_dict()), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """查询任务状态和进度"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """获取已完成任务的结果，格式与 /process 相同"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在"}), 404
+    if job.status not in FINISHED_STATES:
+        return jsonify(job.to_dict()), 202
+    if job.status != DONE:
+        return jsonify(job.to_dict()), 409
+    return jsonify(job.result)
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """取消任务"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在"}), 404
+    logger.info(f"请求取消任务 {job_id}")
+    return jsonify(job.to_dict())
+
+@app.errorhandler(413)
+@app.errorhandler(415)
+def upload_error(e):
+    """上传文件超过大小上限或格式无法识别时，在接收完整个文件之前返回JSON错误"""
+    description = e.description
+    if e.code == 413 and not isinstance(e, UploadTooLarge):
+        # 由 MAX_CONTENT_LENGTH 根据请求头拒绝
+        description = f"上传内容超过大小上限 {upload_max_mb:g} MB"
+    logger.warning(f"拒绝上传: {description}")
+    return jsonify({"error": description}), e.code
+
+@app.route('/results/<analysis_id>', methods=['GET'])
+def get_result(analysis_id):
+    """从结果缓存取分析结果 (与 /process 的JSON结果相同)，如 confidence=npy 响应头中的 X-DiTing-Analysis-Id"""
+    result = lookup_cached_result(analysis_id)
+    if result is None:
+        return jsonify({"error": "结果不存在或已被淘汰"}), 404
+    return jsonify(result)
+
 # 图片路由
 @app.route('/resources/picture/<filename>')
 def serve_image(filename):
-    logger.info(f"请求图片: {filename}")
-    return send_from_directory(pictures_dir, filename)
+    """返回结果图像，尚未绘制时先绘制；可用 ?dpi= 选择分辨率 (50-600)"""
+    dpi = request.args.get('dpi', type=int)
+    if dpi is not None:
+        dpi = min(max(dpi, 50), 600)
+    logger.info(f"请求图片: {filename}" + (f" (dpi={dpi})" if dpi else ""))
+    target = plot_variant_filename(filename, dpi or plot_dpi)
+    if not os.path.exists(os.path.join(pictures_dir, target)):
+        try:
+            target = render_plot_file(filename, dpi) or target
+        except Exception as e:
+            logger.error(f"生成可视化图像时出错: {str(e)}")
+            return jsonify({"error": f"生成图像失败: {str(e)}"}), 500
+    elif plot_store is not None:
+        try:
+            plot_store.touch(filename)
+        except Exception as e:
+            logger.warning(f"更新结果图像访问时间失败: {str(e)}")
+    return send_from_directory(pictures_dir, target)
+
+@app.route('/repick/<analysis_id>', methods=['POST'])
+def repick_analysis(analysis_id):
+    """
+    用新的后处理参数对保留的置信度曲线重新拾取，不重新推理
+
+    请求体为JSON: 一组参数 {"p_th": 0.2, ...}，或多组参数 {"settings": [{...}, ...]} (阈值扫描)。
+    可设置 det_th/p_th/s_th/p_mpd/s_mpd/ev_tolerance/p_tolerance，未给出的参数使用分析时的值。
+    analysis_id 见 /process 或异步任务结果中的 analysis_id。
+    """
+    if confidence_store is None:
+        return jsonify({"error": "未启用置信度存储 (DITING_CONFIDENCE_STORE_MAX_MB)"}), 404
+    body = request.get_json(silent=True)
+    if body is None:
+        body = {}
+    if not isinstance(body, dict):
+        return jsonify({"error": "请求体必须为JSON对象"}), 400
+    entry = confidence_store.get(analysis_id)
+    if entry is None:
+        return jsonify({"error": "置信度曲线不存在或已被淘汰，请重新分析"}), 404
+    confidence, metadata = entry
+    defaults = dict(REPICK_DEFAULTS, **{name: metadata['inference_params'][name]
+                                        for name in ('det_th', 'p_th', 's_th')})
+    try:
+        settings_list = body['settings'] if 'settings' in body else [body]
+        if not isinstance(settings_list, list) or not settings_list:
+            raise ValueError("settings 必须为非空列表")
+        settings_list = [repick_settings(values, defaults) for values in settings_list]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = []
+    with metric_stage_seconds.time(stage='repick'):
+        confidence = np.asarray(confidence)
+        for settings in settings_list:
+            t0 = time.perf_counter()
+            events_matches = repick(confidence, settings)
+            result = format_matches(events_matches)
+            result.update({'settings': settings, 'elapsed_ms': (time.perf_counter() - t0) * 1000})
+            results.append(result)
+    logger.info(f"重新拾取 {analysis_id[:12]}: {len(results)} 组参数")
+    return jsonify({
+        'analysis_id': analysis_id,
+        'start_time_utc': metadata['start_time_utc'],
+        'sampling_rate_hz': metadata['sampling_rate_hz'],
+        'results': results,
+    })
+
+def _envelope_raw(analysis_id, pyramid):
+    """
+    包络查询放大到原始采样点时读取原始数据的函数 (见 EnvelopePyramid.query)，
+    波形或置信度曲线已被淘汰时返回None，此时使用第1级
+    """
+    entry = None
+    if waveform_store is not None and pyramid.metadata.get('file_key'):
+        entry = waveform_store.lookup(pyramid.metadata['file_key'], pyramid.metadata['station'])
+    stored = confidence_store.get(analysis_id) if confidence_store is not None else None
+
+    def raw(rows, i0, i1):
+        if (entry is None and min(rows) < 3) or (stored is None and max(rows) >= 3):
+            return None
+        waveform = entry.open() if entry is not None else None
+        values = np.zeros((len(rows), i1 - i0), dtype=np.float32)
+        for k, row in enumerate(rows):
+            source = waveform[row] if row < 3 else stored[0][row - 3]
+            part = source[i0:i1]
+            values[k, :part.shape[0]] = part
+        return values
+
+    return raw
+
+@app.route('/envelope/<analysis_id>', methods=['GET'])
+def get_envelope(analysis_id):
+    """
+    交互式波形查看: 返回时间范围内按像素宽度选取的最小/最大值包络
+
+    查询参数: start/end (ISO 8601，默认为整条记录)、width (像素宽度，默认1000，最大10000)、
+    traces (逗号分隔，可选 Z,N,E,det,P,S，默认全部)、format (npy (默认) 或 json)、
+    dtype (float32 (默认) 或 float16，float16 时振幅超出范围的曲线除以 X-Envelope-Scales 中的倍数)
+
+    npy 为 float32/float16 [曲线数, 2, 区间数] (第二维为 最小值/最大值)，
+    区间的采样点数、第一个区间的起点等在响应头中；json 在响应体中给出相同的内容
+    """
+    if envelope_store is None:
+        return jsonify({"error": "未启用包络存储 (DITING_ENVELOPE_STORE_MAX_MB)"}), 404
+    pyramid = envelope_store.get(analysis_id)
+    if pyramid is None:
+        return jsonify({"error": "包络不存在或已被淘汰，请重新分析"}), 404
+    try:
+        starttime = _parse_utc_arg('start')
+        endtime = _parse_utc_arg('end')
+        try:
+            width = min(int(request.args.get('width', '1000')), 10000)
+        except ValueError:
+            raise ValueError(f"无效的像素宽度: {request.args.get('width')}")
+        traces = [name.strip() for name in request.args.get('traces', ','.join(TRACE_NAMES)).split(',') if name.strip()]
+        output_format = request.args.get('format', 'npy')
+        if output_format not in ('npy', 'json'):
+            raise ValueError(f"不支持的格式: {output_format}，可选 npy, json")
+        dtype = request.args.get('dtype', 'float32')
+        if dtype not in ('float32', 'float16'):
+            raise ValueError(f"不支持的数据类型: {dtype}，可选 float32, float16")
+        with metric_stage_seconds.time(stage='envelope_query'):
+            envelope = pyramid.query(starttime, endtime, width=width, traces=traces,
+                                     raw=_envelope_raw(analysis_id, pyramid))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    import obspy
+    data = envelope['data']
+    scales = [1.0] * len(traces)
+    if dtype == 'float16':
+        scales = float16_scales(pyramid.metadata['amplitude'], traces)
+        data = (data / np.asarray(scales, dtype=np.float32)[:, None, None]).astype(np.float16)
+    start_time = obspy.UTCDateTime(pyramid.starttime + envelope['start_index'] / pyramid.sampling_rate).isoformat()
+    if output_format == 'json':
+        response = jsonify({
+            'analysis_id': analysis_id,
+            'traces': traces,
+            'level': envelope['level'],
+            'bin_samples': envelope['bin_samples'],
+            'start_index': envelope['start_index'],
+            'start_time_utc': start_time,
+            'sampling_rate_hz': pyramid.sampling_rate,
+            'scales': scales,
+            'min': numpy_to_list(data[:, 0].astype(np.float32)),
+            'max': numpy_to_list(data[:, 1].astype(np.float32)),
+        })
+    else:
+        response = Response(to_npy_bytes(np.ascontiguousarray(data)), mimetype='application/octet-stream')
+        response.headers['X-Envelope-Traces'] = ','.join(traces)
+        response.headers['X-Envelope-Level'] = str(envelope['level'])
+        response.headers['X-Envelope-Bin-Samples'] = str(envelope['bin_samples'])
+        response.headers['X-Envelope-Scales'] = ','.join(f'{scale:g}' for scale in scales)
+        response.headers['X-Start-Index'] = str(envelope['start_index'])
+        response.headers['X-Start-Time'] = start_time
+        response.headers['X-Sampling-Rate'] = str(pyramid.sampling_rate)
+    # 同一分析ID的包络不会改变
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+@app.route('/envelope/<analysis_id>/info', methods=['GET'])
+def get_envelope_info(analysis_id):
+    """包络对应记录的起止时间、采样率、各级的区间大小和各曲线的最大振幅"""
+    if envelope_store is None:
+        return jsonify({"error": "未启用包络存储 (DITING_ENVELOPE_STORE_MAX_MB)"}), 404
+    pyramid = envelope_store.get(analysis_id)
+    if pyramid is None:
+        return jsonify({"error": "包络不存在或已被淘汰，请重新分析"}), 404
+    import obspy
+    info = pyramid.info()
+    info.update(analysis_id=analysis_id, start_time_utc=obspy.UTCDateTime(pyramid.starttime).isoformat(),
+                end_time_utc=obspy.UTCDateTime(pyramid.endtime).isoformat())
+    return jsonify(info)
+
+@app.route('/impact/simulate', methods=['POST'])
+def simulate_impact():
+    """
+    地震影响模拟
+
+    请求体为JSON: {"lat": 震中纬度, "lng": 震中经度, "magnitude": 震级}，
+    返回与前端 SimulationResult 相同结构的结果 (见 impact_simulation.ImpactSimulator)
+    """
+    if impact_simulator is None:
+        return jsonify({"error": "影响模拟未初始化"}), 503
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "请求体必须为JSON对象"}), 400
+    try:
+        lat, lng, magnitude = (float(body[name]) for name in ('lat', 'lng', 'magnitude'))
+    except KeyError as e:
+        return jsonify({"error": f"缺少参数: {e.args[0]}"}), 400
+    except (TypeError, ValueError):
+        return jsonify({"error": "lat、lng、magnitude 必须为数值"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({"error": f"震中坐标超出范围: ({lat}, {lng})"}), 400
+    if not 0 <= magnitude <= 10:
+        return jsonify({"error": f"震级超出范围: {magnitude}"}), 400
+
+    t0 = time.perf_counter()
+    with metric_stage_seconds.time(stage='impact'):
+        result = impact_simulator.simulate(lat, lng, magnitude)
+    result['elapsedMs'] = (time.perf_counter() - t0) * 1000
+    logger.info(f"影响模拟: ({lat}, {lng}) M{magnitude}，影响人口 {result['estimatedAffectedPopulation']}，"
+                f"耗时 {result['elapsedMs']:.1f} ms")
+    return jsonify(result)
+
+def _usgs_snapshot(feed_name):
+    """
+    取得 feed 的最新数据，尚未拉取过时同步拉取
+
+    Returns:
+        (FeedCache, FeedSnapshot, 错误响应)，成功时错误响应为None
+    """
+    feed = usgs_feeds.get(feed_name)
+    if feed is None:
+        return None, None, (jsonify({"error": f"未配置 USGS feed: {feed_name}，可用: {', '.join(usgs_feeds)}"}), 404)
+    try:
+        with metric_stage_seconds.time(stage='usgs_fetch'):
+            snapshot = feed.ensure_loaded()
+    except Exception as e:
+        logger.error(f"拉取 USGS feed {feed_name} 失败: {str(e)}")
+        return feed, None, (jsonify({"error": f"拉取 USGS feed 失败: {str(e)}"}), 502)
+    return feed, snapshot, None
+
+def _usgs_filters():
+    """
+    解析 USGS feed 的筛选参数: minmagnitude/maxmagnitude、starttime/endtime (ISO 8601)、
+    bbox (west,south,east,north)
+
+    Raises:
+        ValueError: 参数无效
+    """
+    filters = {}
+    for name, key in (('minmagnitude', 'min_mag'), ('maxmagnitude', 'max_mag')):
+        value = request.args.get(name)
+        if value:
+            try:
+                filters[key] = float(value)
+            except ValueError:
+                raise ValueError(f"无效的震级参数 {name}: {value}")
+    for name, key in (('starttime', 'starttime'), ('endtime', 'endtime')):
+        timestamp = _parse_utc_arg(name)
+        if timestamp is not None:
+            filters[key] = timestamp * 1000
+    bbox = request.args.get('bbox')
+    if bbox:
+        try:
+            west, south, east, north = (float(v) for v in bbox.split(','))
+        except ValueError:
+            raise ValueError(f"无效的范围参数 bbox: {bbox}，格式为 west,south,east,north")
+        filters['bbox'] = (west, south, east, north)
+    return filters
+
+def _usgs_response(body, snapshot, feed_name):
+    """以 feed 版本为ETag返回，客户端带 If-None-Match 且版本未变时返回304"""
+    response = jsonify(body)
+    response.set_etag(f"{feed_name}-{snapshot.version}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/usgs/feeds', methods=['GET'])
+def list_usgs_feeds():
+    """已配置的 USGS feed 及其拉取状态"""
+    return jsonify({'feeds': [feed.status() for feed in usgs_feeds.values()]})
+
+@app.route('/usgs/<feed_name>', methods=['GET'])
+def get_usgs_feed(feed_name):
+    """
+    筛选后的地震 (GeoJSON FeatureCollection，另有 version 字段)
+
+    查询参数见 _usgs_filters；另有 since (上次返回的 version)，给出时只返回此后新增或修改的地震，
+    以及消失或不再符合条件的地震ID (removed)；变化记录不完整时 full 为true，返回全部符合条件的地震
+    """
+    feed, snapshot, error = _usgs_snapshot(feed_name)
+    if error is not None:
+        return error
+    try:
+        filters = _usgs_filters()
+        since = request.args.get('since')
+        since = int(since) if since else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    body = {}
+    if since is None:
+        index = snapshot.select(**filters)
+    else:
+        snapshot, changed, removed = feed.delta(since)
+        if changed is None:
+            index = snapshot.select(**filters)
+            body.update(full=True, removed=[])
+        else:
+            # 修改后不再符合条件的地震也需要客户端删除
+            index = snapshot.select(since=since, **filters)
+            removed |= {snapshot.ids[i] for i in np.setdiff1d(changed, index)}
+            body.update(full=False, removed=sorted(removed))
+        body['since'] = since
+    body.update(type='FeatureCollection', metadata=snapshot.metadata, version=snapshot.version,
+                features=[snapshot.features[i] for i in index])
+    return _usgs_response(body, snapshot, feed_name)
+
+@app.route('/usgs/<feed_name>/stats', methods=['GET'])
+def get_usgs_stats(feed_name):
+    """
+    地震统计 (字段与前端的 EarthquakeStats 相同)，未加筛选时返回拉取时预先计算的结果
+    """
+    feed, snapshot, error = _usgs_snapshot(feed_name)
+    if error is not None:
+        return error
+    try:
+        filters = _usgs_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not filters:
+        return _usgs_response(snapshot.stats, snapshot, feed_name)
+    stats = dict(magnitude_stats(snapshot.mag[snapshot.select(**filters)]), lastUpdated=snapshot.stats['lastUpdated'],
+                 dataSourceTitle=snapshot.stats['dataSourceTitle'], version=snapshot.version)
+    return _usgs_response(stats, snapshot, feed_name)
+
+def _usgs_markers(feed_name, zoom, tile=None):
+    feed, snapshot, error = _usgs_snapshot(feed_name)
+    if error is not None:
+        return error
+    if not 0 <= zoom <= MAX_ZOOM:
+        return jsonify({"error": f"缩放级别超出范围: {zoom}，应为 0-{MAX_ZOOM}"}), 400
+    if tile is not None and not (0 <= tile[1] < 2 ** zoom and 0 <= tile[2] < 2 ** zoom):
+        return jsonify({"error": f"瓦片坐标超出范围: {tile}"}), 400
+    try:
+        filters = _usgs_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    bbox = filters.pop('bbox', None)
+    with metric_stage_seconds.time(stage='usgs_cluster'):
+        # 只有范围条件时使用按缩放级别缓存的聚合结果
+        markers = snapshot.markers(zoom, snapshot.select(**filters) if filters else None)
+        items = markers.select(bbox=bbox, tile=tile)
+    return _usgs_response({'version': snapshot.version, 'zoom': zoom, 'markers': items}, snapshot, feed_name)
+
+@app.route('/usgs/<feed_name>/clusters', methods=['GET'])
+def get_usgs_clusters(feed_name):
+    """
+    按缩放级别 (zoom) 聚合的地图标记，见 usgs_feed.cluster_markers；
+    筛选参数见 _usgs_filters，bbox 按标记位置筛选 (一般为当前地图视野)
+    """
+    try:
+        zoom = int(request.args.get('zoom', '5'))
+    except ValueError:
+        return jsonify({"error": f"无效的缩放级别: {request.args.get('zoom')}"}), 400
+    return _usgs_markers(feed_name, zoom)
+
+@app.route('/usgs/<feed_name>/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_usgs_tile(feed_name, z, x, y):
+    """一个 Web墨卡托瓦片内的聚合标记 (与 /clusters 在该缩放级别的结果一致)，筛选参数同上"""
+    return _usgs_markers(feed_name, z, tile=(z, x, y))
+
+def _parse_utc_arg(name):
+    """解析ISO 8601时间参数为UTC时间戳，未提供时返回None"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    import obspy
+    try:
+        return obspy.UTCDateTime(value).timestamp
+    except Exception:
+        raise ValueError(f"无效的时间参数 {name}: {value}")
+
+def _pick_filters():
+    """
+    解析 /picks 的查询参数: start/end (ISO 8601)、station (逗号分隔的 NET.STA.LOC)、
+    phase (P/S)、min_confidence、analysis_id
+
+    Raises:
+        ValueError: 参数无效
+    """
+    filters = {'starttime': _parse_utc_arg('start'), 'endtime': _parse_utc_arg('end')}
+    stations = request.args.get('station')
+    if stations:
+        filters['stations'] = [sid.strip() for sid in stations.split(',') if sid.strip()]
+    phase = request.args.get('phase')
+    if phase:
+        if phase.upper() not in ('P', 'S'):
+            raise ValueError(f"无效的震相: {phase}，可选 P/S")
+        filters['phase'] = phase.upper()
+    min_confidence = request.args.get('min_confidence')
+    if min_confidence:
+        try:
+            filters['min_confidence'] = float(min_confidence)
+        except ValueError:
+            raise ValueError(f"无效的置信度阈值: {min_confidence}")
+    if request.args.get('analysis_id'):
+        filters['analysis_id'] = request.args['analysis_id']
+    return filters
+
+def _pick_to_dict(pick):
+    pick['time_utc'] = datetime.fromtimestamp(pick['time'], timezone.utc).isoformat()
+    return pick
+
+@app.route('/picks', methods=['GET'])
+def list_picks():
+    """
+    按时间顺序分页查询震相拾取目录
+
+    查询参数见 _pick_filters，另有 limit (每页条数，最大1000) 和 cursor
+    (上一页返回的 next_cursor，最后一页时为null)。
+    """
+    if pick_catalog is None:
+        return jsonify({"error": "未启用震相拾取目录 (DITING_PICK_CATALOG)"}), 404
+    try:
+        filters = _pick_filters()
+        limit = min(max(int(request.args.get('limit', '100')), 1), 1000)
+        with metric_stage_seconds.time(stage='pick_query'):
+            picks, next_cursor = pick_catalog.query(limit=limit, cursor=request.args.get('cursor') or None,
+                                                    **filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({'picks': [_pick_to_dict(pick) for pick in picks], 'next_cursor': next_cursor})
+
+@app.route('/picks/export', methods=['GET'])
+def export_picks():
+    """
+    批量导出符合条件的全部拾取 (参数同 /picks，不分页)，format=csv (默认) 或 ndjson，
+    边查询边输出，不在内存中保留全部结果
+    """
+    if pick_catalog is None:
+        return jsonify({"error": "未启用震相拾取目录 (DITING_PICK_CATALOG)"}), 404
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({"error": f"无效的导出格式: {export_format}，可选 csv/ndjson"}), 400
+    try:
+        filters = _pick_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    columns = PICK_COLUMNS + ('time_utc',)
+
+    def generate():
+        if export_format == 'csv':
+            yield ','.join(columns) + '\n'
+        lines = []
+        for pick in pick_catalog.iter_picks(**filters):
+            pick = _pick_to_dict(pick)
+            if export_format == 'csv':
+                lines.append(','.join('' if pick[c] is None else str(pick[c]) for c in columns))
+            else:
+                lines.append(json.dumps(pick))
+            if len(lines) >= 10000:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=picks.{export_format}'
+    return response
+
+@app.route('/waveforms', methods=['GET'])
+def list_waveforms():
+    """按台站 (station=NET.STA.LOC) 和时间范围 (start/end，ISO 8601) 查询已存储的波形"""
+    if waveform_store is None:
+        return jsonify({"error": "未启用波形存储 (DITING_WAVEFORM_STORE_MAX_MB)"}), 404
+    try:
+        starttime = _parse_utc_arg('start')
+        endtime = _parse_utc_arg('end')
+        limit = min(max(int(request.args.get('limit', '100')), 1), 1000)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    entries = waveform_store.find(request.args.get('station') or None, starttime, endtime, limit=limit)
+    return jsonify({'waveforms': [entry.to_dict() for entry in entries], 'store': waveform_store.stats()})
+
+@app.route('/waveforms/<file_key>/<station>', methods=['GET'])
+def get_waveform(file_key, station):
+    """
+    以 .npy (float32 [3, n]，Z/N/E) 返回已存储波形在 start/end 范围内的数据，
+    只读取该范围对应的页面；响应头给出第一个采样点的索引和时间
+    """
+    if waveform_store is None:
+        return jsonify({"error": "未启用波形存储 (DITING_WAVEFORM_STORE_MAX_MB)"}), 404
+    entry = waveform_store.lookup(file_key, station)
+    if entry is None:
+        return jsonify({"error": "波形不存在"}), 404
+    try:
+        starttime = _parse_utc_arg('start')
+        endtime = _parse_utc_arg('end')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with metric_stage_seconds.time(stage='waveform_read'):
+        i0, data = entry.read(starttime, endtime)
+        body = to_npy_bytes(np.ascontiguousarray(data))
+    import obspy
+    response = Response(body, mimetype='application/octet-stream')
+    response.headers['X-Start-Index'] = str(i0)
+    response.headers['X-Start-Time'] = obspy.UTCDateTime(entry.starttime + i0 / entry.sampling_rate).isoformat()
+    response.headers['X-Sampling-Rate'] = str(entry.sampling_rate)
+    return response
+
+# 实时连续拾取: 后台线程从数据源接收数据包，确定的震相按序号保存，供轮询
+realtime_picker = None
+realtime_picks = deque(maxlen=realtime_max_picks)
+realtime_seq = 0
+realtime_lock = threading.Lock()
+
+def _record_realtime_pick(pick):
+    global realtime_seq
+    with realtime_lock:
+        realtime_seq += 1
+        realtime_picks.append(dict(pick, seq=realtime_seq))
+    if pick_catalog is not None:
+        try:
+            pick_catalog.record_picks([pick], source='realtime')
+        except Exception as e:
+            logger.warning(f"写入震相拾取目录失败: {str(e)}")
+
+def _run_realtime_consumer(source):
+    if source.startswith('tcp://'):
+        host, port = source[len('tcp://'):].rsplit(':', 1)
+        packets = tcp_packets(host, int(port), stop_event=threading.Event())
+    else:
+        packets = tail_packets(source)
+    logger.info(f"实时拾取已启动，数据源: {source}")
+    for header, data in packets:
+        try:
+            realtime_picker.ingest(header, data)
+        except Exception as e:
+            logger.error(f"实时拾取处理数据包失败: {str(e)}")
+            traceback.print_exc()
+
+def start_realtime_consumer():
+    """配置了数据源时启动实时拾取线程"""
+    global realtime_picker
+    if not realtime_source or ort_session is None or realtime_picker is not None:
+        return
+    realtime_picker = RealtimePicker(ort_session, **inference_params, batch_size=inference_batch_size,
+                                     buffer_seconds=realtime_buffer_seconds, on_pick=_record_realtime_pick)
+    threading.Thread(target=_run_realtime_consumer, args=(realtime_source,), name='realtime', daemon=True).start()
+
+@app.route('/realtime/picks', methods=['GET'])
+def get_realtime_picks():
+    """返回序号大于 since 的实时震相，以及下次轮询使用的序号"""
+    if realtime_picker is None:
+        return jsonify({"error": "未启用实时拾取 (DITING_REALTIME_SOURCE)"}), 404
+    since = request.args.get('since', 0, type=int)
+    with realtime_lock:
+        picks = [pick for pick in realtime_picks if pick['seq'] > since]
+        return jsonify({'picks': picks, 'next': realtime_seq})
+
+@app.route('/realtime/status', methods=['GET'])
+def get_realtime_status():
+    """实时拾取的台站数、数据包数和震相延迟统计"""
+    if realtime_picker is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(realtime_picker.latency_stats(), enabled=True, source=realtime_source))
 
 # 健康检查路由
 @app.route('/health', methods=['GET'])
@@ -230,16 +1708,63 @@ def health_check():
     return jsonify({
         "status": "ok",
         "model_loaded": ort_session is not None,
+        "model_variant": model_variant,
+        "pid": os.getpid(),
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """模型加载并完成预热后返回200，之前返回503 (供负载均衡/编排系统的就绪探针使用)"""
+    body = dict(startup_state, ready=model_ready.is_set(), pid=os.getpid())
+    return jsonify(body), 200 if model_ready.is_set() else 503
+
+def _collect_gauges():
+    metric_jobs_active.set(job_manager.active_count())
+    metric_model_loaded.set(1 if ort_session is not None else 0)
+    metric_ready.set(1 if model_ready.is_set() else 0)
+    if ort_session is not None:
+        metric_model_info.set(1, model=os.path.basename(model_path),
+                              providers=','.join(ort_session.get_providers()),
+                              intra_op_threads=ort_intra_op_threads, inter_op_threads=ort_inter_op_threads,
+                              batch_size=inference_batch_size, pid=os.getpid())
+
+metrics_registry.add_collector(_collect_gauges)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式的指标"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/profiles/<filename>', methods=['GET'])
+def get_profile(filename):
+    """下载请求的 cProfile 结果"""
+    if not profiling_enabled:
+        return jsonify({"error": "未开启性能分析 (DITING_PROFILING=1)"}), 404
+    return send_from_directory(profile_dir, filename, as_attachment=True)
+
+# 结果缓存统计
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    if result_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(result_cache.stats(), enabled=True))
+
 # 测试路由，检查CORS是否工作
 @app.route('/test', methods=['GET', 'POST'])
 def test_endpoint():
     logger.info(f"收到测试请求，方法: {request.method}")
     return jsonify({"message": "测试成功", "method": request.method})
 
+_set_startup_seconds('import', time.time() - process_started)
+
+# 调试模式下 reloader 的父进程不处理请求，只在实际服务的进程中加载模型和启动实时拾取
+if __name__ != '__main__' or os.environ.get('FLASK_DEBUG', '1') != '1' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    start_model_loader()
+    start_usgs_pollers()
+
 if __name__ == '__main__':
     logger.info("启动Flask服务器...")
+    # 开发服务器，生产环境请使用 gunicorn -c gunicorn.conf.py app:app
     # 使用0.0.0.0允许外部访问，端口改为8080避免与macOS AirPlay冲突
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=8080, debug=os.environ.get('FLASK_DEBUG', '1') == '1')
\ No newline at end of file
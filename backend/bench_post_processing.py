@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后处理 (postprocesser_ev_center) 的性能基准
+
+在长度递增的合成置信度曲线上比较原来的逐个扫描实现和当前基于
+有序数组 + searchsorted 的实现，并逐条核对两者输出一致。
+安装了 numba 时 _detect_peaks 的 mpd 过滤会走编译版本。
+
+用法:
+    python bench_post_processing.py --lengths 10000 100000 1000000 --repeat 3
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+from obspy.signal.trigger import trigger_onset
+
+import post_processing
+from post_processing import _detect_peaks, postprocesser_ev_center
+
+
+def _reference_detect_peaks(x, mph=None, mpd=1, kpsh=False):
+    """原实现中 mph + mpd 过滤部分 (O(n^2))，仅用于对比"""
+    x = np.atleast_1d(x).astype('float64')
+    if x.size < 3:
+        return np.array([], dtype=int)
+    dx = x[1:] - x[:-1]
+    ind = np.unique(np.where((np.hstack((dx, 0)) <= 0) & (np.hstack((0, dx)) > 0))[0])
+    if ind.size and ind[0] == 0:
+        ind = ind[1:]
+    if ind.size and ind[-1] == x.size - 1:
+        ind = ind[:-1]
+    if ind.size and mph is not None:
+        ind = ind[x[ind] >= mph]
+    if ind.size and mpd > 1:
+        ind = ind[np.argsort(x[ind])][::-1]
+        idel = np.zeros(ind.size, dtype=bool)
+        for i in range(ind.size):
+            if not idel[i]:
+                idel = idel | (ind >= ind[i] - mpd) & (ind <= ind[i] + mpd) \
+                    & (x[ind[i]] > x[ind] if kpsh else True)
+                idel[i] = 0
+        ind = np.sort(ind[~idel])
+    return ind
+
+
+def _reference_postprocesser(yh1, yh2, yh3, det_th=0.3, p_th=0.3, p_mpd=10, s_th=0.3, s_mpd=10,
+                             ev_tolerance=100, p_tolerance=500):
+    """原来的 postprocesser_ev_center (每个事件扫描全部震相)，仅用于对比"""
+    detection = trigger_onset(yh1, det_th, det_th)
+    pp_arr = _reference_detect_peaks(yh2, mph=p_th, mpd=p_mpd)
+    ss_arr = _reference_detect_peaks(yh3, mph=s_th, mpd=s_mpd)
+    P_PICKS = {}
+    S_PICKS = {}
+    EVENTS = {}
+    matches = list()
+    if len(detection) > 0:
+        for ev in range(1, len(detection)):
+            if detection[ev][0] - detection[ev - 1][1] < ev_tolerance:
+                detection[ev - 1][1] = detection[ev][1]
+                detection[ev][0] = -1
+                detection[ev][1] = -1
+        for ev in range(len(detection)):
+            EVENTS.update({detection[ev][0]: detection[ev][1]})
+    for pauto in pp_arr:
+        if pauto:
+            P_PICKS.update({pauto: np.round(yh2[int(pauto)], 3)})
+    for sauto in ss_arr:
+        if sauto:
+            S_PICKS.update({sauto: np.round(yh3[int(sauto)], 3)})
+    for ev in EVENTS:
+        bg = ev
+        ed = EVENTS[ev]
+        if int(ed - bg) >= ev_tolerance:
+            candidate_Ps = list()
+            for Ps, P_val in P_PICKS.items():
+                if bg - p_tolerance < Ps < bg + p_tolerance:
+                    candidate_Ps.append([Ps, P_val])
+            if len(candidate_Ps) == 0:
+                continue
+            max_prob = -10
+            for Ps, P_val in candidate_Ps:
+                if P_val > max_prob:
+                    max_prob = P_val
+            candidate_Ps = [p for p in candidate_Ps if p[1] == max_prob][:1]
+            candidate_Ss = list()
+            for Ss, S_val in S_PICKS.items():
+                if bg < Ss < ed:
+                    candidate_Ss.append([Ss, S_val])
+            if len(candidate_Ss) == 0:
+                candidate_Ss = [[np.nan, np.nan]]
+            else:
+                max_prob = -10
+                for Ss, S_val in candidate_Ss:
+                    if S_val > max_prob:
+                        max_prob = S_val
+                candidate_Ss = [s for s in candidate_Ss if s[1] == max_prob][:1]
+            matches.append([bg, candidate_Ps, candidate_Ss])
+    return matches
+
+
+def synthetic_confidence(length, event_spacing=30000, seed=0):
+    """
+    生成合成的 [3, length] 置信度曲线 (检测/P/S)：
+    每隔约event_spacing个采样点一个事件，叠加噪声产生大量低矮的候选峰
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(length)
+    det = np.zeros(length, dtype=np.float32)
+    p = np.zeros(length, dtype=np.float32)
+    s = np.zeros(length, dtype=np.float32)
+    for onset in range(min(event_spacing // 2, length // 4), length - 4000, event_spacing):
+        onset += int(rng.integers(-2000, 2000))
+        duration = int(rng.integers(1500, 3500))
+        det[onset:onset + duration] = 0.9
+        p += (rng.uniform(0.5, 0.95) * np.exp(-0.5 * ((t - onset) / 30.0) ** 2)).astype(np.float32)
+        s += (rng.uniform(0.4, 0.9) * np.exp(-0.5 * ((t - onset - duration // 2) / 40.0) ** 2)).astype(np.float32)
+    noise = rng.uniform(0, 0.15, size=(3, length)).astype(np.float32)
+    return det + noise[0], p + noise[1], s + noise[2]
+
+
+def _same_matches(a, b):
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if x[0] != y[0]:
+            return False
+        for u, v in zip(x[1][0] + x[2][0], y[1][0] + y[2][0]):
+            if not (u == v or (np.isnan(u) and np.isnan(v))):
+                return False
+    return True
+
+
+def _best_of(func, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='postprocesser_ev_center 性能基准')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='置信度曲线长度 (采样点数) 列表')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最短耗时')
+    parser.add_argument('--skip-reference', action='store_true', help='不运行原实现 (长曲线时很慢)')
+    parser.add_argument('--output', default=None, help='将结果以JSON保存到该文件')
+    args = parser.parse_args()
+
+    params = dict(p_th=0.1, s_th=0.1, det_th=0.3)
+    print(f"--> mpd 过滤: {post_processing.mpd_filter_backend()}")
+    # 预热 (numba 首次调用需要编译)
+    postprocesser_ev_center(*synthetic_confidence(100000), **params)
+
+    all_stats = []
+    for length in args.lengths:
+        yh1, yh2, yh3 = synthetic_confidence(length)
+        fast_time, fast = _best_of(lambda: postprocesser_ev_center(yh1, yh2, yh3, **params), args.repeat)
+        peaks = _detect_peaks(yh2, mph=params['p_th'], mpd=10).size
+        stats = {'length': length, 'events': len(fast), 'p_peaks': int(peaks), 'seconds': fast_time}
+        line = f"长度 {length:9d}: 事件 {len(fast):5d}, P峰 {peaks:7d}, 当前实现 {fast_time * 1e3:9.2f} ms"
+        if not args.skip_reference:
+            ref_time, ref = _best_of(lambda: _reference_postprocesser(yh1, yh2, yh3, **params), 1)
+            stats.update({'reference_seconds': ref_time, 'speedup': ref_time / fast_time,
+                          'identical': _same_matches(ref, fast)})
+            line += (f", 原实现 {ref_time * 1e3:10.2f} ms, 加速比 {ref_time / fast_time:7.1f}x, "
+                     f"结果一致: {stats['identical']}")
+        all_stats.append(stats)
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(all_stats, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存至: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
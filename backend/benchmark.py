@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理和后处理热点路径的离线基准测试
+
+使用 resources/example_waveforms/*.mseed 和由示例波形拼接成的合成长记录，
+对以下各阶段分别计时:
+
+    read          obspy.read 解码波形文件
+    preprocess    preprocess_stream
+    assemble      assemble_waveform 组装三分量 float32 波形
+    windows       每批窗口写入 InferenceEngine 的缓冲区并原地归一化
+    session_run   每批窗口的 run_with_iobinding
+    batch_plain   原来的每批路径: _normalize_windows 新建输入数组 + session.run 新建输出数组
+    batch_iobinding  InferenceEngine.predict: 复用预先分配并绑定的输入输出缓冲区
+    postprocess   postprocesser_ev_center
+    predict       DiTing_predict_onnx 端到端 (含后处理)
+    stream        DiTing_predict_stream 分块流式推理
+
+每个阶段报告吞吐 (采样点/秒)、延迟分位数和峰值内存 (tracemalloc 统计的
+Python/NumPy 分配峰值，以及进程的最大常驻内存)。batch_plain 和 batch_iobinding
+的分配峰值即稳定运行时每批新分配的内存，两者的对比会单独打印。结果保存为JSON，
+可以用 --compare 与之前的结果对比，最短耗时变慢超过阈值的阶段会标记为回归
+(最短耗时受系统噪声影响最小)，有回归时以非零状态退出。
+
+没有真实模型时自动生成替身模型 (见 standin_model.py，需要 onnx 包)。
+
+用法:
+    python benchmark.py --output bench_results/base.json
+    python benchmark.py --compare bench_results/base.json --output bench_results/new.json
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import obspy
+
+from dt_onnx_inference_windows import (load_onnx_model, preprocess_stream, DiTing_predict_onnx,
+                                       _normalize_windows, _resolve_batch_size, _sliding_windows)
+from inference_engine import InferenceEngine
+from post_processing import postprocesser_ev_center
+from streaming_inference import WaveformChunkReader, DiTing_predict_stream
+from waveform_assembly import assemble_waveform
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+example_dir = os.path.join(os.path.dirname(base_dir), 'resources', 'example_waveforms')
+
+INFERENCE_PARAMS = dict(window_length=10000, step_size=3000, p_th=0.1, s_th=0.1, det_th=0.3)
+
+
+def synthetic_record(seconds, seed=0, gap_seconds=0):
+    """
+    由示例波形随机缩放后首尾拼接成指定时长的三分量记录
+
+    Args:
+        seconds: 记录时长 (秒)
+        seed: 随机数种子
+        gap_seconds: 相邻两段示例波形之间插入的安静段时长 (秒)，
+            安静段为与示例波形开头噪声水平相当的高斯噪声
+
+    Returns:
+        ObsPy Stream对象
+    """
+    sources = [obspy.read(path) for path in sorted(glob.glob(os.path.join(example_dir, '*.mseed')))]
+    rng = np.random.default_rng(seed)
+    sampling_rate = sources[0][0].stats.sampling_rate
+    target = int(seconds * sampling_rate)
+    gap = int(gap_seconds * sampling_rate)
+    parts = {ch: [] for ch in 'ZNE'}
+    total = 0
+    k = 0
+    while total < target:
+        src = sources[k % len(sources)]
+        gain = rng.uniform(0.3, 3.0)
+        for ch in 'ZNE':
+            data = src.select(channel=f'*H{ch}')[0].data.astype(np.float64)
+            parts[ch].append(data * gain)
+            if gap > 0:
+                # 示例波形开头5秒为事件前的噪声
+                noise = data[:int(5 * sampling_rate)]
+                parts[ch].append(np.mean(noise) + rng.normal(0, np.std(noise), gap))
+        total += sum(part.size for part in parts['Z'][-2 if gap > 0 else -1:])
+        k += 1
+    stream = obspy.Stream()
+    for ch in 'ZNE':
+        tr = sources[0].select(channel=f'*H{ch}')[0].copy()
+        tr.data = np.concatenate(parts[ch])[:target].astype(np.int32)
+        stream.append(tr)
+    return stream
+
+
+def traced_peak(func):
+    """单独执行一次func，返回tracemalloc统计的分配峰值 (字节)。跟踪开销较大，不与计时混用"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def measure(func, repeat):
+    """
+    重复执行func计时，再单独执行一次统计内存峰值
+
+    Returns:
+        (每次耗时列表, 分配峰值字节数, 最后一次计时运行的返回值)
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    return times, traced_peak(func), result
+
+
+def summarize(name, record, times, peak, samples):
+    """汇总一个阶段的计时结果"""
+    times = np.array(times)
+    median = float(np.median(times))
+    return {
+        'stage': name,
+        'record': record,
+        'samples': int(samples),
+        'runs': int(times.size),
+        'latency_p50': median,
+        'latency_p90': float(np.percentile(times, 90)),
+        'latency_p99': float(np.percentile(times, 99)),
+        'latency_min': float(times.min()),
+        'throughput_samples_per_sec': samples / median if median > 0 else 0.0,
+        'peak_traced_mb': peak / 1e6,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def bench_record(session, name, path, stream, batch_size, repeat, quiet):
+    """对单条记录运行各阶段的基准"""
+    data_len = stream[0].stats.npts
+    wl, step = INFERENCE_PARAMS['window_length'], INFERENCE_PARAMS['step_size']
+    input_name = session.get_inputs()[0].name
+    batch_size = _resolve_batch_size(session, batch_size)
+    results = []
+    silence = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+
+    times, peak, _ = measure(lambda: obspy.read(path), repeat)
+    results.append(summarize('read', name, times, peak, data_len))
+
+    times, peak, _ = measure(lambda: preprocess_stream(stream, wl), repeat)
+    results.append(summarize('preprocess', name, times, peak, data_len))
+
+    times, peak, waveform = measure(lambda: assemble_waveform(stream), repeat)
+    results.append(summarize('assemble', name, times, peak, data_len))
+
+    data_len = waveform.shape[1]
+    num_windows = max((data_len - wl) // step + 1, 1)
+    if data_len >= wl:
+        windows = _sliding_windows(waveform, wl, step, num_windows)
+        batches = [windows[b:b + batch_size] for b in range(0, num_windows, batch_size)]
+        # 每批窗口的准备和推理分别计时 (与 DiTing_predict_onnx 相同，使用 IO binding 引擎)
+        engine = InferenceEngine(session, wl, batch_size)
+        prep_times, run_times = [], []
+        for _ in range(repeat):
+            for batch in batches:
+                t0 = time.perf_counter()
+                n = engine.load_batch(batch)
+                engine.prepare(n)
+                t1 = time.perf_counter()
+                engine.run(n)
+                t2 = time.perf_counter()
+                prep_times.append(t1 - t0)
+                run_times.append(t2 - t1)
+        prep_peak = traced_peak(lambda: engine.prepare(engine.load_batch(batches[0])))
+        run_peak = traced_peak(lambda: engine.run(len(batches[0])))
+        per_batch = wl * batch_size
+        results.append(summarize('windows', name, prep_times, prep_peak, per_batch))
+        results.append(summarize('session_run', name, run_times, run_peak, per_batch))
+
+        # 原来每批新建输入输出数组的路径与 IO binding 引擎的对比
+        def plain(batch):
+            return session.run(None, {input_name: _normalize_windows(batch)})[0]
+        for label, func in (('batch_plain', plain), ('batch_iobinding', engine.predict)):
+            times = []
+            for _ in range(repeat):
+                for batch in batches:
+                    t0 = time.perf_counter()
+                    func(batch)
+                    times.append(time.perf_counter() - t0)
+            results.append(summarize(label, name, times, traced_peak(lambda: func(batches[0])), per_batch))
+
+    with silence:
+        times, peak, (events, confidence) = measure(
+            lambda: DiTing_predict_onnx(session, stream, **INFERENCE_PARAMS, batch_size=batch_size), repeat)
+    results.append(summarize('predict', name, times, peak, data_len))
+    results[-1]['windows'] = num_windows
+    results[-1]['events'] = 0 if np.isnan(events[0][0]) else len(events)
+
+    conf = confidence[0]
+    times, peak, _ = measure(lambda: postprocesser_ev_center(
+        conf[0], conf[1], conf[2], p_th=INFERENCE_PARAMS['p_th'], s_th=INFERENCE_PARAMS['s_th'],
+        det_th=INFERENCE_PARAMS['det_th']), repeat)
+    results.append(summarize('postprocess', name, times, peak, conf.shape[1]))
+
+    with silence:
+        times, peak, _ = measure(lambda: list(DiTing_predict_stream(
+            session, WaveformChunkReader(path, chunk_seconds=600), **INFERENCE_PARAMS, batch_size=batch_size)),
+            max(1, repeat // 2))
+    results.append(summarize('stream', name, times, peak, data_len))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """与之前的结果对比，返回回归列表"""
+    previous = {(r['stage'], r['record']): r for r in baseline['results']}
+    regressions = []
+    print(f"\n--> 与基线对比 ({baseline['created_at']})")
+    for r in results:
+        old = previous.get((r['stage'], r['record']))
+        if old is None:
+            continue
+        ratio = r['latency_min'] / old['latency_min'] if old['latency_min'] > 0 else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  <-- 回归'
+            regressions.append({'stage': r['stage'], 'record': r['record'], 'ratio': ratio})
+        print(f"{r['stage']:15s} {r['record']:34s} 最短 {old['latency_min'] * 1e3:10.2f} -> "
+              f"{r['latency_min'] * 1e3:10.2f} ms ({ratio:5.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DiTing 推理/后处理基准测试')
+    parser.add_argument('--model', default=None,
+                        help='ONNX模型路径，默认生成替身模型 (结果中会记录使用的模型)')
+    parser.add_argument('--synthetic-seconds', type=float, nargs='*', default=[3600, 6 * 3600],
+                        help='合成长记录的时长 (秒)')
+    parser.add_argument('--batch-size', type=int, default=16, help='批量推理的窗口数')
+    parser.add_argument('--repeat', type=int, default=5, help='每个阶段的重复次数')
+    parser.add_argument('--output', default=None, help='将结果以JSON保存到该文件')
+    parser.add_argument('--compare', default=None, help='用于对比的基线结果JSON')
+    parser.add_argument('--threshold', type=float, default=0.15, help='最短耗时变慢超过该比例视为回归')
+    parser.add_argument('--verbose', action='store_true', help='显示推理过程的输出')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='diting_bench_')
+    model_path = args.model
+    if model_path is None:
+        from standin_model import build_standin_model
+        model_path = build_standin_model(os.path.join(workdir, 'standin.onnx'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        session = load_onnx_model(model_path)
+
+    records = [(os.path.basename(path), path) for path in sorted(glob.glob(os.path.join(example_dir, '*.mseed')))]
+    for seconds in args.synthetic_seconds:
+        path = os.path.join(workdir, f'synthetic_{int(seconds)}s.mseed')
+        synthetic_record(seconds).write(path, format='MSEED')
+        records.append((f'synthetic_{int(seconds)}s', path))
+
+    results = []
+    for name, path in records:
+        stream = obspy.read(path)
+        print(f"--> {name}: {stream[0].stats.npts} 个采样点")
+        for r in bench_record(session, name, path, stream, args.batch_size, args.repeat, not args.verbose):
+            results.append(r)
+            print(f"    {r['stage']:15s} p50 {r['latency_p50'] * 1e3:10.2f} ms  p90 {r['latency_p90'] * 1e3:10.2f} ms  "
+                  f"{r['throughput_samples_per_sec'] / 1e6:8.2f} M采样点/秒  "
+                  f"峰值 {r['peak_traced_mb']:8.1f} MB")
+        stages = {r['stage']: r for r in results if r['record'] == name}
+        if 'batch_plain' in stages and 'batch_iobinding' in stages:
+            plain, bound = stages['batch_plain'], stages['batch_iobinding']
+            print(f"    IO binding: 每批 p50 {plain['latency_p50'] * 1e3:.2f} -> {bound['latency_p50'] * 1e3:.2f} ms, "
+                  f"每批分配峰值 {plain['peak_traced_mb']:.2f} -> {bound['peak_traced_mb']:.3f} MB")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'model': os.path.basename(model_path),
+        'batch_size': args.batch_size,
+        'repeat': args.repeat,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            report['regressions'] = compare(results, json.load(f), args.threshold)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存至: {args.output}")
+
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
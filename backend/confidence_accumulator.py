@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+滑动窗口置信度的低内存重叠相加累加器
+"""
+
+import numpy as np
+
+
+def window_coverage(start, stop, window_length, step_size, num_windows):
+    """
+    根据窗口几何关系计算[start, stop)内每个采样点被多少个窗口覆盖
+
+    第i个窗口覆盖[i*step_size, i*step_size+window_length)，
+    因此无需保存与记录等长的count数组。
+
+    Args:
+        start: 起始采样点
+        stop: 结束采样点 (不含)
+        window_length: 窗口长度
+        step_size: 步长
+        num_windows: 窗口总数
+
+    Returns:
+        覆盖次数数组，形状为[stop-start]
+    """
+    t = np.arange(start, stop, dtype=np.int64)
+    last = np.minimum(t // step_size, num_windows - 1)
+    # ceil((t - window_length + 1) / step_size)，负数时取0
+    first = np.maximum(-((window_length - 1 - t) // step_size), 0)
+    return np.maximum(last - first + 1, 0)
+
+
+class ConfidenceAccumulator:
+    """
+    重叠相加累加器
+
+    只保存一个窗口长度的float32缓冲区。窗口必须按顺序加入，第i个窗口加入后，
+    所有小于下一个窗口起点的采样点不会再被任何窗口覆盖，可以通过flush()
+    取出已平均的结果，因此累加器本身的内存与窗口长度相关，而与记录长度无关
+    (调用方是否保留整条输出由调用方决定，见 DiTing_predict_onnx 和 StreamingPicker)。
+    流式处理时total_length和num_windows可以先不给出，结束时调用finish()。
+
+    累加和输出都是float32 (原实现为float64): 返回的置信度类型随之变为float32，
+    置信度饱和 (接近1的平台) 时相邻采样点的值可能舍入为相等，峰值位置可能移动1-2个采样点。
+    """
+
+    def __init__(self, total_length, window_length, step_size, num_windows, channels=3):
+        """
+        Args:
+            total_length: 输出置信度的总长度，None表示尚未确定
+            window_length: 窗口长度
+            step_size: 步长
+            num_windows: 窗口总数，None表示尚未确定
+            channels: 输出通道数
+        """
+        self.total_length = total_length
+        self.window_length = window_length
+        self.step_size = step_size
+        self.num_windows = num_windows
+        self.channels = channels
+        # 缓冲区对应[base, base+window_length)
+        self.base = 0
+        self.buffer = np.zeros((channels, window_length), dtype=np.float32)
+        self.windows_added = 0
+        # 已完成但尚未被flush()取走的区域
+        self._pending = []
+
+    @property
+    def finalized_upto(self):
+        """已不会再被后续窗口修改的位置 (不含)"""
+        if self.num_windows is not None and self.windows_added >= self.num_windows:
+            return self.total_length
+        upto = self.windows_added * self.step_size
+        if self.total_length is not None:
+            upto = min(upto, self.total_length)
+        return upto
+
+    def finish(self, total_length):
+        """
+        流式处理结束时确定总长度，此后flush()会取出全部剩余区域
+
+        Args:
+            total_length: 输出置信度的总长度
+        """
+        self.total_length = total_length
+        self.num_windows = self.windows_added
+
+    def add(self, output):
+        """
+        加入下一个窗口的模型输出
+
+        Args:
+            output: 模型输出，形状为[channels, window_length]
+        """
+        start, end = self._next_window()
+        self.buffer[:, :end - start] += output[:, :end - start]
+        self.windows_added += 1
+
+    def skip(self):
+        """跳过下一个窗口: 该窗口仍计入覆盖次数，置信度按0计"""
+        self._next_window()
+        self.windows_added += 1
+
+    def _next_window(self):
+        """下一个窗口在输出中的范围[start, end)，并移出起点之前已完成的区域"""
+        if self.num_windows is not None and self.windows_added >= self.num_windows:
+            raise ValueError("加入的窗口数超过了num_windows")
+        start = self.windows_added * self.step_size
+        if start > self.base:
+            # 起点之前的区域已完成，先移出缓冲区，等待flush()取走
+            self._pending.append(self._take(start))
+        end = start + self.window_length
+        if self.total_length is not None:
+            end = min(end, self.total_length)
+        return start, end
+
+    def flush(self):
+        """
+        取出已完成区域的平均置信度
+
+        Returns:
+            (offset, chunk)：chunk为float32数组，形状为[channels, n]，
+            对应[offset, offset+n)；没有新完成的区域时n为0
+        """
+        self._pending.append(self._take(self.finalized_upto))
+        offset = self._pending[0][0]
+        chunk = np.concatenate([c for _, c in self._pending], axis=1)
+        self._pending = []
+        return offset, chunk
+
+    def _take(self, stop):
+        """取出[base, stop)的平均置信度，并将缓冲区起点移动到stop"""
+        offset = self.base
+        n = max(stop - offset, 0)
+        # 超出缓冲区的部分 (最后一个窗口之后的尾部) 没有窗口覆盖，置信度为0
+        chunk = np.zeros((self.channels, n), dtype=np.float32)
+        m = min(n, self.window_length)
+        chunk[:, :m] = self.buffer[:, :m]
+        if n:
+            num_windows = self.num_windows if self.num_windows is not None else self.windows_added
+            count = window_coverage(offset, stop, self.window_length, self.step_size, num_windows)
+            np.divide(chunk, count, out=chunk, where=count != 0)
+            keep = max(self.window_length - n, 0)
+            if keep:
+                self.buffer[:, :keep] = self.buffer[:, n:n + keep]
+            self.buffer[:, keep:] = 0
+            self.base = stop
+        return offset, chunk
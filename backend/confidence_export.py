@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+置信度曲线的紧凑二进制导出
+
+/process 的 confidence 参数使用本模块，把三条置信度曲线 (检测/P/S) 以二进制返回，
+不再经过 numpy_to_list 序列化为JSON列表。支持 float16/float32 和按块降采样。
+
+两种布局:
+
+npy
+    标准 .npy 文件 (numpy.save)，数组形状为 [3, length]，
+    可直接用 numpy.load 或 JS 的 npy 解析库读取。
+    震相结果不在其中，/process 在响应头 X-DiTing-Analysis-Id 中给出分析ID，由 /results/<analysis_id> 获取。
+
+packed (长度前缀，所有整数和浮点数均为小端序)::
+
+    偏移  长度  内容
+    0     4     魔数 b'DTCF'
+    4     1     版本号，当前为 1
+    5     1     数据类型: 1 = float16, 2 = float32
+    6     2     保留，为 0
+    8     4     uint32 通道数 (3，顺序为 检测/P/S)
+    12    4     uint32 每个通道的采样点数 length
+    16    4     uint32 降采样倍数 decimate (1 表示未降采样)
+    20    8     float64 原始采样率 (Hz)，降采样后的采样率为 sampling_rate / decimate
+    28    4     uint32 JSON 元数据的字节数 n
+    32    n     UTF-8 JSON 元数据 (与 /process 的JSON结果相同，震相索引为原始采样点索引)
+    32+n  ...   通道数 * length 个数据，按通道依次存放 (C 顺序)
+
+降采样取每 decimate 个采样点中的最大值，保证置信度峰值不会被平均掉；
+最后不足 decimate 个点的部分同样取最大值。
+"""
+
+import io
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b'DTCF'
+VERSION = 1
+DTYPES = {'float16': 1, 'float32': 2}
+_HEADER = struct.Struct('<4sBBHIIIdI')
+
+
+def encode_confidence(confidence, dtype='float16', decimate=1):
+    """
+    将置信度曲线转换为导出用的数组
+
+    Args:
+        confidence: 置信度，形状为[1, 3, length]或[3, length]
+        dtype: 'float16' 或 'float32'
+        decimate: 降采样倍数，每decimate个点取最大值
+
+    Returns:
+        形状为[3, ceil(length / decimate)]的数组
+
+    Raises:
+        ValueError: 不支持的数据类型或降采样倍数
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"不支持的数据类型: {dtype}，可选 {', '.join(DTYPES)}")
+    decimate = int(decimate)
+    if decimate < 1:
+        raise ValueError(f"降采样倍数必须为正整数: {decimate}")
+    data = np.asarray(confidence, dtype=np.float32)
+    data = data.reshape(-1, data.shape[-1])
+    if decimate > 1:
+        channels, length = data.shape
+        padded_length = -(-length // decimate) * decimate
+        if padded_length != length:
+            # 以通道内最小值补齐，不影响取最大值
+            pad = np.repeat(data.min(axis=1, keepdims=True), padded_length - length, axis=1)
+            data = np.concatenate([data, pad], axis=1)
+        data = data.reshape(channels, -1, decimate).max(axis=2)
+    return np.ascontiguousarray(data, dtype=dtype)
+
+
+def to_npy_bytes(data):
+    """将数组保存为 .npy 格式的字节串"""
+    buffer = io.BytesIO()
+    np.save(buffer, data, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def pack_confidence(data, sampling_rate, decimate=1, metadata=None):
+    """
+    按 packed 布局打包置信度和元数据
+
+    Args:
+        data: encode_confidence 返回的数组
+        sampling_rate: 原始采样率 (Hz)
+        decimate: data 使用的降采样倍数
+        metadata: 可JSON序列化的元数据字典
+
+    Returns:
+        字节串
+    """
+    meta = json.dumps(metadata or {}, ensure_ascii=False).encode('utf-8')
+    header = _HEADER.pack(MAGIC, VERSION, DTYPES[data.dtype.name], 0,
+                          data.shape[0], data.shape[1], int(decimate), float(sampling_rate), len(meta))
+    return header + meta + data.astype(data.dtype.newbyteorder('<'), copy=False).tobytes()
+
+
+def unpack_confidence(buffer):
+    """
+    解析 packed 布局，供Python客户端和测试使用
+
+    Returns:
+        (数组[通道数, length], 原始采样率, 降采样倍数, 元数据字典)
+
+    Raises:
+        ValueError: 魔数或版本不匹配
+    """
+    magic, version, dtype_code, _, channels, length, decimate, sampling_rate, meta_len = \
+        _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("不是有效的置信度数据")
+    dtype = np.dtype({code: name for name, code in DTYPES.items()}[dtype_code]).newbyteorder('<')
+    offset = _HEADER.size
+    metadata = json.loads(bytes(buffer[offset:offset + meta_len]).decode('utf-8'))
+    offset += meta_len
+    data = np.frombuffer(buffer, dtype=dtype, count=channels * length, offset=offset).reshape(channels, length)
+    return data, sampling_rate, decimate, metadata
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析结果置信度曲线的保留存储
+
+每次分析的三条置信度曲线 (检测/P/S) 以 float32 .npy 保存，键为分析ID (即结果缓存键)。
+调整阈值、峰值间距或容差时，只需读取 (内存映射) 保存的曲线重新运行 postprocesser_ev_center，
+不必重新上传文件和推理。
+
+存储方式见 lru_store.LruFileStore。
+"""
+
+import json
+import os
+
+import numpy as np
+
+from lru_store import LruFileStore
+from post_processing import postprocesser_ev_center
+
+# 可重新设置的后处理参数及其类型、取值下限和上限 (None表示不限)
+REPICK_PARAMS = {
+    'det_th': (float, 0.0, 1.0),
+    'p_th': (float, 0.0, 1.0),
+    's_th': (float, 0.0, 1.0),
+    'p_mpd': (int, 1, None),
+    's_mpd': (int, 1, None),
+    'ev_tolerance': (int, 0, None),
+    'p_tolerance': (int, 0, None),
+}
+
+# postprocesser_ev_center 的默认峰值间距和容差
+REPICK_DEFAULTS = {'p_mpd': 10, 's_mpd': 10, 'ev_tolerance': 100, 'p_tolerance': 500}
+
+
+def repick_settings(values, defaults):
+    """
+    检查并补全一组后处理参数
+
+    Args:
+        values: 请求中的参数字典
+        defaults: 未给出的参数使用的默认值
+
+    Returns:
+        包含 REPICK_PARAMS 中全部参数的字典
+
+    Raises:
+        ValueError: 参数名未知、类型错误或超出范围
+    """
+    if not isinstance(values, dict):
+        raise ValueError("后处理参数必须为JSON对象")
+    unknown = set(values) - set(REPICK_PARAMS)
+    if unknown:
+        raise ValueError(f"未知的参数: {', '.join(sorted(unknown))}，可选 {', '.join(REPICK_PARAMS)}")
+    settings = {}
+    for name, (kind, low, high) in REPICK_PARAMS.items():
+        value = values.get(name, defaults[name])
+        try:
+            if isinstance(value, bool) or (kind is int and float(value) != int(value)):
+                raise ValueError
+            value = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"参数 {name} 必须为{'整数' if kind is int else '数值'}: {value!r}")
+        if value < low or (high is not None and value > high) or (kind is float and value == low):
+            raise ValueError(f"参数 {name} 超出范围: {value}")
+        settings[name] = value
+    return settings
+
+
+def repick(confidence, settings):
+    """
+    用新的后处理参数重新拾取
+
+    Args:
+        confidence: 置信度曲线，形状为[3, length] (检测/P/S)
+        settings: repick_settings 返回的参数
+
+    Returns:
+        事件列表，结构同 DiTing_predict_onnx 返回的事件
+    """
+    # 内存映射转为普通数组视图 (不复制)，numba 实现的峰值检测不接受 np.memmap
+    confidence = np.asarray(confidence)
+    events = postprocesser_ev_center(yh1=confidence[0], yh2=confidence[1], yh3=confidence[2], **settings)
+    if len(events) == 0:
+        events = [[np.nan, [[np.nan, np.nan]], [[np.nan, np.nan]]]]
+    return events
+
+
+class ConfidenceStore(LruFileStore):
+    """
+    有大小上限、LRU淘汰、可持久化的置信度曲线存储
+    """
+
+    table = 'confidences'
+    columns = ('analysis_id TEXT NOT NULL, size INTEGER NOT NULL, metadata TEXT NOT NULL, '
+               'created_at REAL NOT NULL, last_access REAL NOT NULL')
+    key_columns = ('analysis_id',)
+
+    def __init__(self, store_dir, max_bytes=1024 * 1024 * 1024):
+        """
+        Args:
+            store_dir: 存储目录
+            max_bytes: 总大小上限 (字节)
+        """
+        super().__init__(store_dir, max_bytes)
+
+    def _paths(self, analysis_id):
+        return [os.path.join(self.store_dir, f"{analysis_id}.npy")]
+
+    def put(self, analysis_id, confidence, metadata):
+        """
+        保存一次分析的置信度曲线，超过大小上限时淘汰最久未使用的条目
+
+        Args:
+            analysis_id: 分析ID
+            confidence: 置信度，形状为[1, 3, length]或[3, length]
+            metadata: 可JSON序列化的元数据 (起始时间、采样率、推理参数等)
+        """
+        path, = self._paths(analysis_id)
+        with self._replacing(path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.asarray(confidence, dtype=np.float32).reshape(3, -1))
+        self._insert([{'analysis_id': analysis_id, 'size': os.path.getsize(path), 'metadata': json.dumps(metadata)}],
+                     keep=analysis_id)
+
+    def get(self, analysis_id):
+        """
+        读取置信度曲线
+
+        Args:
+            analysis_id: 分析ID
+
+        Returns:
+            (内存映射的置信度[3, length], 元数据字典)，不存在或已被淘汰时返回None
+        """
+        entry = self._load((analysis_id,), 'metadata', lambda paths: np.load(paths[0], mmap_mode='r'))
+        if entry is None:
+            return None
+        (metadata,), confidence = entry
+        return confidence, json.loads(metadata)
@@ -4,31 +4,125 @@
 DiTing 0.1B ONNX模型在Windows环境下的推理脚本
 """
 
+import hashlib
+import io
 import os
+import time
 import numpy as np
-import onnxruntime as ort
-import obspy
-import matplotlib.pyplot as plt
+from numpy.lib.stride_tricks import sliding_window_view
 from post_processing import postprocesser_ev_center
+import post_processing
+from confidence_accumulator import ConfidenceAccumulator
+from inference_engine import engine_pool
+from waveform_assembly import MODEL_SAMPLING_RATE, assemble_waveform, waveform_starttime
 
-def load_onnx_model(model_path):
+# onnxruntime、obspy 和 matplotlib.pyplot 在用到的函数中才导入，缩短服务的启动时间
+
+def load_onnx_model(model_path, intra_op_num_threads=0, inter_op_num_threads=0, allow_spinning=True,
+                    optimized_cache_dir=None):
     """
     加载ONNX模型
     
     Args:
         model_path: ONNX模型路径
+        intra_op_num_threads: 单个算子内部的线程数，0表示由onnxruntime决定
+        inter_op_num_threads: 算子之间并行的线程数，0表示由onnxruntime决定
+        allow_spinning: 线程空闲时是否自旋等待；多进程部署时关闭，避免空转占用其他进程的CPU
+        optimized_cache_dir: 优化后计算图的缓存目录，None表示不缓存。
+            首次加载时保存 onnxruntime 图优化后的模型，之后直接加载该文件并跳过图优化
         
     Returns:
         ONNX运行时会话对象
     """
+    import onnxruntime as ort
+
     print(f"--> 加载ONNX模型: {model_path}")
     # 创建ONNX运行时推理会话
-    session_options = ort.SessionOptions()
-    session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    def make_options(optimization_level):
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = optimization_level
+        session_options.intra_op_num_threads = intra_op_num_threads
+        session_options.inter_op_num_threads = inter_op_num_threads
+        if not allow_spinning:
+            session_options.add_session_config_entry('session.intra_op.allow_spinning', '0')
+            session_options.add_session_config_entry('session.inter_op.allow_spinning', '0')
+        return session_options
+
+    if optimized_cache_dir is None:
+        session = ort.InferenceSession(model_path, sess_options=make_options(ort.GraphOptimizationLevel.ORT_ENABLE_ALL))
+        print("加载完成")
+        return session
+
+    cached_path = os.path.join(optimized_cache_dir, optimized_model_filename(model_path))
+    if os.path.exists(cached_path):
+        try:
+            session = ort.InferenceSession(cached_path,
+                                           sess_options=make_options(ort.GraphOptimizationLevel.ORT_DISABLE_ALL))
+            print(f"加载完成 (使用已优化的计算图: {cached_path})")
+            return session
+        except Exception as e:
+            print(f"已优化的计算图无法加载，重新优化: {e}")
+            try:
+                os.remove(cached_path)
+            except OSError:
+                pass
+
+    # 先写入进程私有的临时文件再改名，多个工作进程同时启动时不会读到写了一半的文件
+    os.makedirs(optimized_cache_dir, exist_ok=True)
+    tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+    session_options = make_options(ort.GraphOptimizationLevel.ORT_ENABLE_ALL)
+    session_options.optimized_model_filepath = tmp_path
     session = ort.InferenceSession(model_path, sess_options=session_options)
-    print("加载完成")
+    try:
+        os.replace(tmp_path, cached_path)
+        print(f"加载完成，优化后的计算图已缓存至: {cached_path}")
+    except OSError as e:
+        print(f"加载完成，缓存优化后的计算图失败: {e}")
     return session
 
+def optimized_model_filename(model_path):
+    """
+    优化后计算图的缓存文件名
+
+    优化结果与模型文件、onnxruntime 版本和运行设备有关，三者任一变化都对应新的文件名
+    """
+    import onnxruntime as ort
+
+    st = os.stat(model_path)
+    identity = f"{os.path.abspath(model_path)}:{st.st_size}:{st.st_mtime_ns}:{ort.__version__}:{ort.get_device()}"
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return f"{stem}.{hashlib.sha1(identity.encode('utf-8')).hexdigest()[:16]}.optimized.onnx"
+
+def warm_up_session(session, window_length=10000, step_size=3000, batch_size=1):
+    """
+    用合成噪声运行一次完整的推理流程 (滑动窗口、session.run、后处理)
+
+    onnxruntime 在第一次 run 时才分配内存和选择算子实现，obspy.read 第一次调用时要加载
+    格式插件，后处理第一次调用时还要导入 obspy.signal 并编译 mpd 过滤；
+    预热之后第一个请求不再承担这些开销。
+    合成记录恰好包含一整批窗口，与正式请求的输入形状相同。
+
+    Returns:
+        预热耗时 (秒)
+    """
+    import obspy
+
+    t0 = time.perf_counter()
+    batch_size = _resolve_batch_size(session, batch_size)
+    npts = window_length + step_size * (batch_size - 1)
+    rng = np.random.default_rng(0)
+    stream = obspy.Stream([obspy.Trace(data=rng.normal(0, 1, npts).astype(np.float32),
+                                       header={'channel': f'HH{ch}', 'sampling_rate': 100.0})
+                           for ch in 'ZNE'])
+    # 经 MiniSEED 往返一次，obspy.read 第一次调用时加载格式插件的开销也在预热中完成
+    buffer = io.BytesIO()
+    stream.write(buffer, format='MSEED')
+    buffer.seek(0)
+    stream = obspy.read(buffer)
+    DiTing_predict_onnx(session, stream, window_length=window_length, step_size=step_size, batch_size=batch_size)
+    post_processing.warm_up()
+    return time.perf_counter() - t0
+
 def preprocess_stream(stream, window_length=10000):
     """
     预处理数据流
@@ -40,193 +134,391 @@ def preprocess_stream(stream, window_length=10000):
     Returns:
         预处理后的数据数组，形状为[1, 3, window_length]
     """
-    # 获取数据长度
-    data_len = stream[0].data.shape[0]
-    
-    # 创建三通道波形数据
-    tmp_waveform = np.zeros([data_len, 3])
-    tmp_waveform[:,0] = stream.select(channel='*HZ')[0].data
-    tmp_waveform[:,1] = stream.select(channel='*HN')[0].data
-    tmp_waveform[:,2] = stream.select(channel='*HE')[0].data
+    waveform = assemble_waveform(stream)
     
     # 截取或填充到窗口长度
-    if data_len > window_length:
-        window = tmp_waveform[:window_length, :].copy()
-    else:
-        window = tmp_waveform.copy()
-        # 填充不足的长度
-        if window.shape[0] < window_length:
-            padding = np.zeros((window_length - window.shape[0], window.shape[1]))
-            window = np.vstack((window, padding))
-    
-    # 数据归一化 (每个通道独立归一化)
-    for chdx in range(3):
-        window[:,chdx] -= np.mean(window[:,chdx])
-        window[:,chdx] /= np.std(window[:,chdx]) + 1e-8  # 避免除零错误
+    n = min(waveform.shape[1], window_length)
+    window = np.zeros((1, 3, window_length), dtype=np.float32)
+    window[0, :, :n] = waveform[:, :n]
     
-    # 转换为模型输入格式 [batch, channels, length]
-    window_tensor = window[None, :]
-    window_tensor = window_tensor.transpose(0, 2, 1)
-    window_tensor = window_tensor.astype(np.float32)
-    
-    return window_tensor
+    # 数据归一化 (每个通道独立归一化，包括填充的部分)
+    return _normalize_windows(window)
 
-def DiTing_predict_onnx(session, stream, window_length=10000, step_size=3000, p_th=0.1, s_th=0.1, det_th=0.50):
+def _resolve_batch_size(session, batch_size):
+    """
+    根据模型输入的batch维度确定实际可用的批大小
+
+    Args:
+        session: ONNX运行时会话对象
+        batch_size: 期望的批大小
+
+    Returns:
+        实际使用的批大小 (模型导出为固定batch时回退到该值)
+    """
+    batch_size = max(1, int(batch_size))
+    batch_dim = session.get_inputs()[0].shape[0]
+    if isinstance(batch_dim, int) and batch_dim > 0 and batch_dim != batch_size:
+        print(f"模型输入batch维度固定为 {batch_dim}，批大小 {batch_size} 调整为 {batch_dim}")
+        return batch_dim
+    return batch_size
+
+def _sliding_windows(waveform, window_length, step_size, num_windows):
+    """
+    以步长视图的方式构建所有滑动窗口，不复制数据
+
+    Args:
+        waveform: 三通道波形数据，形状为[3, data_len] (见assemble_waveform)
+        window_length: 窗口长度
+        step_size: 步长
+        num_windows: 窗口数量
+
+    Returns:
+        窗口视图，形状为[num_windows, 3, window_length]
+    """
+    windows = sliding_window_view(waveform, window_length, axis=1)
+    windows = windows[:, ::step_size][:, :num_windows]
+    return windows.transpose(1, 0, 2)
+
+def _normalize_windows(windows):
+    """
+    对一批窗口做向量化归一化 (每个窗口的每个通道独立归一化)
+
+    Args:
+        windows: 窗口数据，形状为[B, 3, window_length]
+
+    Returns:
+        归一化后的float32数组，形状为[B, 3, window_length]
+    """
+    batch = windows.astype(np.float64)
+    batch -= np.mean(batch, axis=2, keepdims=True)
+    batch /= np.std(batch, axis=2, keepdims=True) + 1e-8  # 避免除零错误
+    return batch.astype(np.float32)
+
+def DiTing_predict_onnx(session, stream, window_length=10000, step_size=3000, p_th=0.1, s_th=0.1, det_th=0.50, batch_size=1,
+                        progress_callback=None, timings=None, gate=None, waveform=None):
     """
     使用DiTing ONNX模型进行预测
+
+    返回整条记录的置信度，因此内存占用随记录长度线性增长: 组装后的波形 (给出内存映射的waveform时不占内存)
+    和置信度各为 12 字节/采样点 (100 Hz 一天约 200 MB)。累加器本身只占一个窗口；
+    只需要事件、不需要整条置信度曲线时，长记录应使用 streaming_inference 的分块处理。
     
     Args:
         session: ONNX运行时会话对象
-        stream: ObsPy Stream对象
+        stream: ObsPy Stream对象，给出waveform时可以为None
         window_length: 窗口长度
         step_size: 步长
         p_th: P波检测阈值
         s_th: S波检测阈值
         det_th: 事件检测阈值
+        batch_size: 每次session.run处理的窗口数，大于1时启用批量推理
+        progress_callback: 可选回调，每完成一批窗口调用 progress_callback(已完成窗口数, 窗口总数)，
+            回调抛出异常即可中止推理
+        timings: 可选字典，累加各阶段耗时 (秒): windows (窗口准备和归一化)、session_run、
+            accumulate (置信度累加)、postprocess、gate (门控)，并记录窗口数 num_windows
+            和门控跳过的窗口数 windows_skipped
+        gate: 可选的窗口门控 (如 sta_lta_gate.StaLtaGate)，只对 gate.window_mask() 选中的窗口运行模型，
+            其余窗口的置信度按0计；不足一个窗口长度的数据总是运行
+        waveform: 可选的已组装的三通道波形 [3, n] (如 WaveformStore 的内存映射)，
+            给出时直接从中取窗口，不再从stream组装
         
     Returns:
-        检测到的事件和置信度
+        检测到的事件和置信度 (float32，形状为[1, 3, 长度]，见ConfidenceAccumulator)
     """
     print("--> 开始预测")
+    t_begin = time.perf_counter()
+    if timings is None:
+        timings = {}
+    for stage in ('windows', 'session_run', 'accumulate', 'postprocess', 'gate'):
+        timings.setdefault(stage, 0.0)
     
-    # 获取输入和输出名称
-    input_name = session.get_inputs()[0].name
-    
-    # 获取数据长度
-    data_len = stream[0].data.shape[0]
-    
-    # 创建三通道波形数据
-    tmp_waveform = np.zeros([data_len, 3])
-    tmp_waveform[:,0] = stream.select(channel='*HZ')[0].data
-    tmp_waveform[:,1] = stream.select(channel='*HN')[0].data
-    tmp_waveform[:,2] = stream.select(channel='*HE')[0].data
+    # 组装三通道波形 (合并数据段、填充间断、对齐分量并统一采样率)
+    if waveform is None:
+        waveform = assemble_waveform(stream)
+    data_len = waveform.shape[1]
     
     # 如果数据长度小于窗口长度，只处理一个窗口
     if data_len < window_length:
         num_windows = 1
-        count = np.zeros((1, 3, 10000))
-        confidence = np.zeros((1, 3, 10000))
+        total_length = window_length
     else:
         # 计算窗口数量
         num_windows = (data_len - window_length) // step_size + 1
-        count = np.zeros((1, 3, tmp_waveform.shape[0]))
-        confidence = np.zeros((1, 3, tmp_waveform.shape[0]))
+        total_length = data_len
     
-    # 按窗口进行处理
-    for i in range(num_windows):
-        if i % 10 == 0:
-            print(f"处理窗口 {i+1}/{num_windows}")
-        
-        # 计算窗口起止位置
-        start = i * step_size
-        end = start + window_length
-        
-        # 窗口计数
-        count[:,:,start:end] += 1
-        
-        # 提取窗口数据
-        window = tmp_waveform[start:end, :].copy()
-        
-        # 数据归一化
-        for chdx in range(3):
-            window[:,chdx] -= np.mean(window[:,chdx])
-            window[:,chdx] /= np.std(window[:,chdx]) + 1e-8  # 避免除零错误
-        
-        # 填充不足长度的窗口
-        if window.shape[0] < window_length:
-            padding = np.zeros((window_length - window.shape[0], window.shape[1]))
-            window = np.vstack((window, padding))
-        
-        # 转换为模型输入格式
-        window_tensor = window[None, :]
-        window_tensor = window_tensor.transpose(0, 2, 1)
-        window_tensor = window_tensor.astype(np.float32)
-        
-        # 运行模型推理
-        outputs = session.run(None, {input_name: window_tensor})
-        output_np = outputs[0]  # 假设模型只有一个输出
-        
-        # 累加置信度
-        if end <= confidence.shape[2]:
-            confidence[:,:,start:end] += output_np
-        else:
-            confidence[:,:,start:] += output_np[:,:,:confidence.shape[2]-start]
+    # 置信度以float32累加，覆盖次数由窗口几何关系计算，已完成的区域逐批写出到整条记录的输出数组
+    accumulator = ConfidenceAccumulator(total_length, window_length, step_size, num_windows)
+    confidence = np.zeros((1, 3, total_length), dtype=np.float32)
     
-    # 计算平均置信度
-    with np.errstate(divide='ignore', invalid='ignore'):
-        confidence = np.divide(confidence, count, out=np.zeros_like(confidence), where=count!=0)
+    def flush_finalized():
+        offset, chunk = accumulator.flush()
+        confidence[0, :, offset:offset + chunk.shape[1]] = chunk
+    
+    if batch_size > 1:
+        batch_size = _resolve_batch_size(session, batch_size)
+    
+    # 窗口写入引擎预先分配并绑定的缓冲区，模型输出直接从绑定的输出缓冲区累加；
+    # 引擎从池中取出，处理完成后放回供下一个请求使用
+    engine = engine_pool.acquire(session, window_length, batch_size)
+    
+    num_skipped = 0
+    if data_len >= window_length:
+        # 窗口为原始数据的步长视图，每批一次归一化并送入模型 (batch_size为1时即逐窗口推理)
+        windows = _sliding_windows(waveform, window_length, step_size, num_windows)
+        if gate is None:
+            run_windows = np.arange(num_windows)
+        else:
+            t0 = time.perf_counter()
+            mask = gate.window_mask(waveform, MODEL_SAMPLING_RATE, window_length, step_size, num_windows)
+            run_windows = np.flatnonzero(mask)
+            num_skipped = num_windows - run_windows.size
+            timings['gate'] += time.perf_counter() - t0
+            print(f"门控: 运行 {run_windows.size}/{num_windows} 个窗口, 跳过 {num_skipped / num_windows:.1%}")
+        num_run = run_windows.size
+        next_window = 0
+        for b_start in range(0, num_run, batch_size):
+            b_end = min(b_start + batch_size, num_run)
+            if batch_size > 1:
+                print(f"处理窗口 {b_start+1}-{b_end}/{num_run}")
+            elif b_start % 10 == 0:
+                print(f"处理窗口 {b_start+1}/{num_run}")
+            
+            t0 = time.perf_counter()
+            batch = run_windows[b_start:b_end]
+            first, last = int(batch[0]), int(batch[-1])
+            if last - first + 1 == batch.size:
+                n = engine.load_batch(windows[first:last + 1])
+            else:
+                for k, i in enumerate(batch):
+                    engine.load(k, windows[i])
+                n = batch.size
+            engine.prepare(n)
+            t1 = time.perf_counter()
+            output_np = engine.run(n)
+            t2 = time.perf_counter()
+            
+            # 累加置信度，跳过的窗口按顺序计为0
+            for k in range(n):
+                while next_window < batch[k]:
+                    accumulator.skip()
+                    next_window += 1
+                accumulator.add(output_np[k])
+                next_window += 1
+            flush_finalized()
+            timings['windows'] += t1 - t0
+            timings['session_run'] += t2 - t1
+            timings['accumulate'] += time.perf_counter() - t2
+            if progress_callback is not None:
+                progress_callback(next_window, num_windows)
+        if next_window < num_windows:
+            while next_window < num_windows:
+                accumulator.skip()
+                next_window += 1
+            flush_finalized()
+            if progress_callback is not None:
+                progress_callback(num_windows, num_windows)
+    else:
+        # 数据不足一个窗口: 只归一化有效部分，其余补零
+        print("处理窗口 1/1")
+        t0 = time.perf_counter()
+        engine.prepare_padded(waveform)
+        t1 = time.perf_counter()
+        output_np = engine.run(1)
+        t2 = time.perf_counter()
+        accumulator.add(output_np[0])
+        flush_finalized()
+        timings['windows'] += t1 - t0
+        timings['session_run'] += t2 - t1
+        timings['accumulate'] += time.perf_counter() - t2
+        if progress_callback is not None:
+            progress_callback(1, 1)
+    engine_pool.release(engine)
+    
+    elapsed = time.perf_counter() - t_begin
+    print(f"推理完成: {num_windows} 个窗口, 批大小 {batch_size}, 耗时 {elapsed:.3f} 秒, "
+          f"吞吐 {num_windows / max(elapsed, 1e-9):.1f} 窗口/秒")
     
     # 后处理检测事件
+    t0 = time.perf_counter()
     events = postprocesser_ev_center(
         yh1=confidence[0, 0, :], yh2=confidence[0, 1, :], yh3=confidence[0, 2, :], 
         p_th=p_th, s_th=s_th, det_th=det_th)
+    timings['postprocess'] += time.perf_counter() - t0
+    timings['num_windows'] = timings.get('num_windows', 0) + num_windows
+    timings['windows_skipped'] = timings.get('windows_skipped', 0) + num_skipped
     
     if len(events) == 0:
         events = [[np.nan, [[np.nan, np.nan]], [[np.nan, np.nan]]]]
     
     return events, confidence
 
-def visualize_results(stream, events, output_file=None):
+def extract_event_slice(stream, events, pre_seconds=5, post_seconds=20, filter_pad_seconds=10):
     """
-    可视化预测结果
-    
+    截取第一个事件附近的波形并滤波，得到绘图所需的全部数据
+
+    只对事件片段 (两端各多留filter_pad_seconds以消除滤波边缘效应) 做滤波，
+    不再复制和滤波整条记录；不修改传入的events。
+
     Args:
         stream: ObsPy Stream对象
         events: 检测到的事件
-        output_file: 输出文件路径，如果为None则显示图像
+        pre_seconds: P波到时之前保留的时长
+        post_seconds: S波到时之后保留的时长
+        filter_pad_seconds: 滤波时两端额外保留的时长
+
+    Returns:
+        绘图数据字典，没有有效的P或S波到时时返回None
     """
-    # 滤波处理
-    st = stream.copy()
-    st.filter('bandpass', freqmin=1, freqmax=20)
-    
-    # 随机选择一个事件进行可视化
-    idx = 0  # 使用第一个事件
-    t_P = events[idx][1][0]
-    t_S = events[idx][2][0]
+    import obspy
+
+    # 使用第一个事件
+    idx = 0
+    p_idx = events[idx][1][0][0]
+    s_idx = events[idx][2][0][0]
     
     # 如果没有有效的P或S拾取，则返回
-    if np.isnan(t_P[0]) or np.isnan(t_S[0]):
+    if np.isnan(p_idx) or np.isnan(s_idx):
         print("未检测到有效的P或S波到时")
-        return
+        return None
     
     # 转换采样点到时间
-    t_P[0] = (obspy.UTCDateTime(st[0].stats.starttime) + t_P[0]/st[0].stats.sampling_rate)
-    t_S[0] = (obspy.UTCDateTime(st[0].stats.starttime) + t_S[0]/st[0].stats.sampling_rate)
-    
-    # 截取地震事件片段
-    st_slice = st.slice(starttime=t_P[0]-5, endtime=t_S[0]+20)
+    starttime = obspy.UTCDateTime(waveform_starttime(stream))
+    t_P = starttime + p_idx / MODEL_SAMPLING_RATE
+    t_S = starttime + s_idx / MODEL_SAMPLING_RATE
+    
+    # 截取 (带滤波余量的) 事件片段后再滤波，最后裁掉余量
+    st_slice = stream.slice(starttime=t_P - pre_seconds - filter_pad_seconds,
+                            endtime=t_S + post_seconds + filter_pad_seconds).copy()
+    st_slice.filter('bandpass', freqmin=1, freqmax=20)
+    st_slice.trim(starttime=t_P - pre_seconds, endtime=t_S + post_seconds)
+    
+    return {
+        't_P': t_P,
+        't_S': t_S,
+        'traces': [{
+            'channel': tr.stats.channel,
+            'starttime': tr.stats.starttime,
+            'sampling_rate': tr.stats.sampling_rate,
+            'data': tr.data.astype(np.float32),
+        } for tr in st_slice],
+    }
+
+def save_event_slice(event_slice, path):
+    """将extract_event_slice的结果保存为npz，供之后延迟绘图"""
+    arrays = {f'data_{i}': tr['data'] for i, tr in enumerate(event_slice['traces'])}
+    np.savez(path,
+             t_P=str(event_slice['t_P']), t_S=str(event_slice['t_S']),
+             channels=np.array([tr['channel'] for tr in event_slice['traces']]),
+             starttimes=np.array([str(tr['starttime']) for tr in event_slice['traces']]),
+             sampling_rates=np.array([tr['sampling_rate'] for tr in event_slice['traces']]),
+             **arrays)
+
+def load_event_slice(path):
+    """读取save_event_slice保存的绘图数据"""
+    import obspy
+
+    with np.load(path) as f:
+        return {
+            't_P': obspy.UTCDateTime(str(f['t_P'])),
+            't_S': obspy.UTCDateTime(str(f['t_S'])),
+            'traces': [{
+                'channel': str(channel),
+                'starttime': obspy.UTCDateTime(str(f['starttimes'][i])),
+                'sampling_rate': float(f['sampling_rates'][i]),
+                'data': f[f'data_{i}'],
+            } for i, channel in enumerate(f['channels'])],
+        }
+
+def _decimate_minmax(data, max_points):
+    """
+    按桶取最小值和最大值对波形降采样，保留波形包络
+
+    Args:
+        data: 一维波形数据
+        max_points: 降采样后的最大点数
+
+    Returns:
+        (采样点索引, 数据)
+    """
+    n = data.shape[0]
+    if max_points is None or n <= max_points:
+        return np.arange(n), data
+    num_buckets = max(max_points // 2, 1)
+    bucket = int(np.ceil(n / num_buckets))
+    usable = (n // bucket) * bucket
+    blocks = data[:usable].reshape(-1, bucket)
+    offsets = np.arange(0, usable, bucket)
+    i_min = offsets + np.argmin(blocks, axis=1)
+    i_max = offsets + np.argmax(blocks, axis=1)
+    indices = np.sort(np.concatenate([i_min, i_max, np.arange(usable, n)]))
+    return indices, data[indices]
+
+def render_event_plot(event_slice, output_file=None, dpi=300, max_points=4000):
+    """
+    绘制事件片段的三分量波形和P/S到时
+
+    Args:
+        event_slice: extract_event_slice或load_event_slice返回的绘图数据
+        output_file: 输出文件路径，如果为None则显示图像
+        dpi: 输出图像分辨率
+        max_points: 每个通道绘制的最大点数，超过时按最小/最大值降采样
+    """
+    import matplotlib.pyplot as plt
+
+    t_P = event_slice['t_P']
+    t_S = event_slice['t_S']
     
     # 绘图
     plt.figure(figsize=(12, 8))
     plt.rcParams['font.sans-serif'] = ['SimHei']  # 设置黑体或其他支持中文的字体
     plt.rcParams['axes.unicode_minus'] = False    # 解决负号显示为方块的问题
     # 绘制三个通道
-    for i in range(3):
+    for i, tr in enumerate(event_slice['traces'][:3]):
+        indices, data = _decimate_minmax(tr['data'], max_points)
         plt.subplot(3, 1, i+1)
-        plt.plot(st_slice[i].times(), st_slice[i].data, label=st_slice[i].stats.channel)
-        plt.axvline(t_P[0] - st_slice[i].stats.starttime, color='r', label='P Arrival')
-        plt.axvline(t_S[0] - st_slice[i].stats.starttime, color='g', label='S Arrival')
-        plt.title(f'Channel {st_slice[i].stats.channel}')
+        plt.plot(indices / tr['sampling_rate'], data, label=tr['channel'])
+        plt.axvline(t_P - tr['starttime'], color='r', label='P Arrival')
+        plt.axvline(t_S - tr['starttime'], color='g', label='S Arrival')
+        plt.title(f'Channel {tr["channel"]}')
         plt.legend(loc='upper right')
         
         if i == 0:
-            plt.title(f'P Arrival: {t_P[0].strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]}\n'
-                      f'S Arrival: {t_S[0].strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]}')
+            plt.title(f'P Arrival: {t_P.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]}\n'
+                      f'S Arrival: {t_S.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]}')
     
     plt.tight_layout()
     
     if output_file:
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
+        plt.savefig(output_file, dpi=dpi, bbox_inches='tight')
         print(f"结果已保存至: {output_file}")
     else:
         plt.show()
     
     plt.close()
 
+def visualize_results(stream, events, output_file=None, dpi=300, max_points=4000):
+    """
+    可视化预测结果
+    
+    Args:
+        stream: ObsPy Stream对象
+        events: 检测到的事件
+        output_file: 输出文件路径，如果为None则显示图像
+        dpi: 输出图像分辨率
+        max_points: 每个通道绘制的最大点数
+    """
+    event_slice = extract_event_slice(stream, events)
+    if event_slice is None:
+        return
+    render_event_plot(event_slice, output_file=output_file, dpi=dpi, max_points=max_points)
+
 def main():
+    import obspy
+
     # 设置模型和数据文件路径
     model_path = "DiTing0.1B_v15.onnx"
     data_path = "example_waveforms/demo_test_2.mseed"  # 修改为实际数据路径
+    batch_size = 16  # 每次推理的窗口数，设为1即逐窗口推理
     
     # 检查文件是否存在
     if not os.path.exists(model_path):
@@ -249,7 +541,7 @@ def main():
     events, confidence = DiTing_predict_onnx(
         session, stream, 
         window_length=10000, step_size=3000, 
-        p_th=0.1, s_th=0.1, det_th=0.3
+        p_th=0.1, s_th=0.1, det_th=0.3, batch_size=batch_size
     )
     
     # 输出检测结果
@@ -258,8 +550,8 @@ def main():
         if not np.isnan(event[1][0][0]) and not np.isnan(event[2][0][0]):
             p_sample = event[1][0][0]
             s_sample = event[2][0][0]
-            p_time = stream[0].stats.starttime + p_sample / stream[0].stats.sampling_rate
-            s_time = stream[0].stats.starttime + s_sample / stream[0].stats.sampling_rate
+            p_time = waveform_starttime(stream) + p_sample / MODEL_SAMPLING_RATE
+            s_time = waveform_starttime(stream) + s_sample / MODEL_SAMPLING_RATE
             print(f"事件 {i+1}:")
             print(f"  P波到时: {p_time.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]} (样本点: {p_sample:.1f})")
             print(f"  S波到时: {s_time.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]} (样本点: {s_sample:.1f})")
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+波形和置信度曲线的多分辨率包络金字塔
+
+visualize_results 生成的静态图像每次缩放都要在服务端重新绘制。这里在分析时为每个文件预先计算
+三分量波形 (Z/N/E) 和三条置信度曲线 (检测/P/S) 的最小/最大值包络:
+
+    * 第 k 级 (k >= 1) 的每个区间覆盖 factor**k 个采样点，保存区间内的最小值和最大值，
+      由上一级每 factor 个区间合并得到；区间按记录起点对齐，最后一个区间可以不满
+    * 各级依次存放在一个 float32 .npy 中，形状为 [6, 2, 总区间数]，查询时内存映射打开
+    * 查询给出时间范围和像素宽度，选取区间不大于每像素采样点数的最粗一级，
+      再把相邻区间合并为每像素一个区间 (至多 width+1 个)，读取量与记录长度无关；
+      每像素不足 factor 个采样点时改为从原始数据 (第0级) 合并
+
+合并后的区间同样按记录起点对齐，平移视图时区间边界不变。
+
+存储方式见 lru_store.LruFileStore。
+"""
+
+import json
+import os
+
+import numpy as np
+
+from lru_store import LruFileStore
+
+# 包络中各曲线的名称和顺序: 三分量波形和三条置信度曲线
+TRACE_NAMES = ('Z', 'N', 'E', 'det', 'P', 'S')
+# 生成第1级时每次处理的采样点数 (factor 的整数倍)，限制内存占用
+BUILD_CHUNK_SAMPLES = 1 << 20
+# 最粗一级的区间数不超过此值时停止
+MIN_TOP_BINS = 1024
+# float16 的最大有限值
+FLOAT16_MAX = 65504.0
+
+
+def _reduce(data, group, out_min, out_max):
+    """data[..., n] 每 group 个点取最小值和最大值 (最后一组可以不满)"""
+    starts = np.arange(0, data.shape[-1], group)
+    out_min[...] = np.minimum.reduceat(data, starts, axis=-1)
+    out_max[...] = np.maximum.reduceat(data, starts, axis=-1)
+
+
+def build_pyramid(traces, factor=8, min_top_bins=MIN_TOP_BINS):
+    """
+    计算包络金字塔
+
+    Args:
+        traces: 形状为[曲线数, npts]的数组 (可以是内存映射)
+        factor: 每一级的降采样倍数
+        min_top_bins: 最粗一级的区间数不超过此值时停止
+
+    Returns:
+        (数组[曲线数, 2, 总区间数]，第二维为 最小值/最大值, 各级的 (偏移, 区间数) 列表，从第1级开始)
+    """
+    ntraces, npts = traces.shape
+    sizes = []
+    n = npts
+    while True:
+        n = -(-n // factor)
+        sizes.append(n)
+        if n <= min_top_bins:
+            break
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(int)
+    pyramid = np.empty((ntraces, 2, int(sum(sizes))), dtype=np.float32)
+
+    chunk = BUILD_CHUNK_SAMPLES // factor * factor
+    for c0 in range(0, npts, chunk):
+        block = np.asarray(traces[:, c0:c0 + chunk], dtype=np.float32)
+        b0 = c0 // factor
+        b1 = b0 + -(-block.shape[1] // factor)
+        _reduce(block, factor, pyramid[:, 0, b0:b1], pyramid[:, 1, b0:b1])
+    for k in range(1, len(sizes)):
+        prev = slice(offsets[k - 1], offsets[k - 1] + sizes[k - 1])
+        cur = slice(offsets[k], offsets[k] + sizes[k])
+        pyramid[:, 0, cur] = np.minimum.reduceat(pyramid[:, 0, prev], np.arange(0, sizes[k - 1], factor), axis=-1)
+        pyramid[:, 1, cur] = np.maximum.reduceat(pyramid[:, 1, prev], np.arange(0, sizes[k - 1], factor), axis=-1)
+    return pyramid, [(int(o), int(s)) for o, s in zip(offsets, sizes)]
+
+
+class EnvelopePyramid:
+    """一次分析的包络金字塔"""
+
+    def __init__(self, data, metadata):
+        """
+        Args:
+            data: 内存映射的金字塔 [6, 2, 总区间数]
+            metadata: 元数据 (starttime、sampling_rate、npts、factor、levels 等)
+        """
+        self.data = data
+        self.metadata = metadata
+        self.starttime = metadata['starttime']
+        self.sampling_rate = metadata['sampling_rate']
+        self.npts = metadata['npts']
+        self.factor = metadata['factor']
+        self.levels = metadata['levels']
+
+    @property
+    def endtime(self):
+        return self.starttime + (self.npts - 1) / self.sampling_rate
+
+    def index_range(self, starttime=None, endtime=None):
+        """时间范围对应的采样点范围 [i0, i1)"""
+        i0 = 0 if starttime is None else int(np.ceil((starttime - self.starttime) * self.sampling_rate - 1e-6))
+        i1 = self.npts if endtime is None else int(np.floor((endtime - self.starttime) * self.sampling_rate + 1e-6)) + 1
+        i0 = min(max(i0, 0), self.npts)
+        return i0, min(max(i1, i0), self.npts)
+
+    def query(self, starttime=None, endtime=None, width=1000, traces=TRACE_NAMES, raw=None):
+        """
+        按像素宽度取时间范围内的包络
+
+        Args:
+            starttime, endtime: 时间范围 (UTC时间戳)，None表示记录的起点/终点
+            width: 像素宽度，每个区间不少于每像素的采样点数，区间数至多为 width+1 (区间按记录起点对齐)
+            traces: 需要的曲线名称 (见 TRACE_NAMES)
+            raw: 可选的函数 raw(rows, i0, i1)，返回原始数据中 rows 各行 (TRACE_NAMES 的下标)
+                在 [i0, i1) 的采样点；每像素不足 factor 个采样点时使用，不提供或返回None时使用第1级
+
+        Returns:
+            字典: level (0为原始数据)、bin_samples (每个区间的采样点数)、start_index (第一个区间的起点)、
+            data (float32 [曲线数, 2, 区间数])
+
+        Raises:
+            ValueError: 曲线名称未知或宽度无效
+        """
+        if width < 1:
+            raise ValueError(f"像素宽度必须为正整数: {width}")
+        unknown = [name for name in traces if name not in TRACE_NAMES]
+        if unknown:
+            raise ValueError(f"未知的曲线: {', '.join(unknown)}，可选 {', '.join(TRACE_NAMES)}")
+        rows = [TRACE_NAMES.index(name) for name in traces]
+        i0, i1 = self.index_range(starttime, endtime)
+        samples_per_pixel = max((i1 - i0) / width, 1.0)
+
+        # 区间不大于每像素采样点数的最粗一级
+        level = 0
+        while level < len(self.levels) and self.factor ** (level + 1) <= samples_per_pixel:
+            level += 1
+        values = None
+        if level == 0 and raw is not None:
+            # 原始数据: 每个输出区间合并 ceil(samples_per_pixel) 个采样点
+            group = int(np.ceil(samples_per_pixel))
+            values = raw(rows, i0 // group * group, min(-(-i1 // group) * group, self.npts))
+        if values is None:
+            level = max(level, 1)
+            # 每个输出区间合并 group 个该级区间，输出区间按记录起点对齐
+            group = int(np.ceil(samples_per_pixel / self.factor ** level))
+        bin_samples = self.factor ** level * group
+        b0, b1 = i0 // bin_samples, -(-i1 // bin_samples)
+
+        if level == 0:
+            lo = hi = np.asarray(values, dtype=np.float32)
+        else:
+            offset, size = self.levels[level - 1]
+            part = self.data[rows, :, offset + b0 * group:offset + min(b1 * group, size)]
+            lo, hi = part[:, 0], part[:, 1]
+        out = np.empty((len(rows), 2, max(b1 - b0, 0)), dtype=np.float32)
+        if out.shape[2]:
+            starts = np.arange(0, lo.shape[-1], group)
+            out[:, 0] = np.minimum.reduceat(lo, starts, axis=-1)
+            out[:, 1] = np.maximum.reduceat(hi, starts, axis=-1)
+        return {'level': level, 'bin_samples': bin_samples, 'start_index': b0 * bin_samples, 'data': out}
+
+    def info(self):
+        """元数据 (不含内部的各级偏移)"""
+        info = {name: self.metadata[name] for name in ('starttime', 'sampling_rate', 'npts', 'factor')}
+        info.update(traces=list(TRACE_NAMES), bin_samples=[self.factor ** (k + 1) for k in range(len(self.levels))],
+                    amplitude=self.metadata['amplitude'])
+        info.update({name: self.metadata.get(name) for name in ('file_key', 'station', 'channels')})
+        return info
+
+
+def float16_scales(amplitude, traces):
+    """
+    转换为float16时各曲线的缩放倍数 (2的幂)，使最大振幅不超出float16的范围
+
+    Args:
+        amplitude: 各曲线的最大绝对值 {名称: 值}
+        traces: 曲线名称列表
+    """
+    return [float(2.0 ** max(int(np.ceil(np.log2(amplitude[name] / FLOAT16_MAX))), 0))
+            if amplitude[name] > FLOAT16_MAX else 1.0 for name in traces]
+
+
+class EnvelopeStore(LruFileStore):
+    """
+    有大小上限、LRU淘汰、可持久化的包络金字塔存储
+    """
+
+    table = 'envelopes'
+    columns = ('analysis_id TEXT NOT NULL, size INTEGER NOT NULL, metadata TEXT NOT NULL, '
+               'created_at REAL NOT NULL, last_access REAL NOT NULL')
+    key_columns = ('analysis_id',)
+
+    def __init__(self, store_dir, max_bytes=1024 * 1024 * 1024, factor=8):
+        """
+        Args:
+            store_dir: 存储目录
+            max_bytes: 总大小上限 (字节)
+            factor: 每一级的降采样倍数
+        """
+        if factor < 2:
+            raise ValueError(f"降采样倍数必须不小于2: {factor}")
+        self.factor = factor
+        super().__init__(store_dir, max_bytes)
+
+    def _paths(self, analysis_id):
+        return [os.path.join(self.store_dir, f"{analysis_id}.npy")]
+
+    def put(self, analysis_id, waveform, confidence, starttime, sampling_rate, **metadata):
+        """
+        计算并保存一次分析的包络金字塔
+
+        Args:
+            analysis_id: 分析ID
+            waveform: 三分量波形 [3, npts] (可以是内存映射)
+            confidence: 置信度 [1, 3, length] 或 [3, length]，按 npts 截断或补零
+            starttime: 第一个采样点的时间 (UTC时间戳)
+            sampling_rate: 采样率 (Hz)
+            **metadata: 其他可JSON序列化的元数据 (file_key、station、channels 等)
+
+        Returns:
+            EnvelopePyramid
+        """
+        npts = waveform.shape[1]
+        confidence = np.asarray(confidence, dtype=np.float32).reshape(3, -1)[:, :npts]
+        if confidence.shape[1] < npts:
+            confidence = np.pad(confidence, ((0, 0), (0, npts - confidence.shape[1])))
+        pyramid_w, levels = build_pyramid(waveform, self.factor)
+        pyramid_c, _ = build_pyramid(confidence, self.factor)
+        pyramid = np.concatenate([pyramid_w, pyramid_c])
+        offset, size = levels[-1]
+        top = pyramid[:, :, offset:offset + size]
+        amplitude = np.maximum(np.abs(top[:, 0]).max(axis=1), np.abs(top[:, 1]).max(axis=1))
+        metadata = dict(metadata, starttime=float(starttime), sampling_rate=float(sampling_rate), npts=int(npts),
+                        factor=self.factor, levels=levels,
+                        amplitude={name: float(a) for name, a in zip(TRACE_NAMES, amplitude)})
+
+        path, = self._paths(analysis_id)
+        with self._replacing(path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, pyramid)
+        self._insert([{'analysis_id': analysis_id, 'size': os.path.getsize(path), 'metadata': json.dumps(metadata)}],
+                     keep=analysis_id)
+        return EnvelopePyramid(pyramid, metadata)
+
+    def get(self, analysis_id):
+        """
+        读取包络金字塔
+
+        Returns:
+            EnvelopePyramid (内存映射)，不存在或已被淘汰时返回None
+        """
+        entry = self._load((analysis_id,), 'metadata', lambda paths: np.load(paths[0], mmap_mode='r'))
+        if entry is None:
+            return None
+        (metadata,), data = entry
+        return EnvelopePyramid(data, json.loads(metadata))
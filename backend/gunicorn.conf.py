@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+生产环境的 gunicorn 配置
+
+用法 (在 backend 目录下):
+    gunicorn -c gunicorn.conf.py app:app
+
+每个工作进程各自导入 app 并加载一次ONNX会话 (不使用 preload_app，
+onnxruntime 会话不能在 fork 之后共享)。CPU核数在各进程间平均分配给
+onnxruntime 的算子内线程，避免 N 个进程各开满核数的线程互相抢占。
+工作进程导入 app 后在后台加载模型并预热，就绪探针应使用 /ready 而不是 /health。
+异步任务 (/jobs) 的状态写入各进程共享的 DITING_JOB_STATE_PATH (默认 cache/jobs.sqlite3)，
+查询、取结果和取消请求可以落到任一工作进程上。
+
+环境变量:
+    DITING_WORKERS: 工作进程数，默认等于CPU核数
+    DITING_INTRA_OP_THREADS: 每个进程的算子内线程数，默认 CPU核数 // 工作进程数
+    DITING_INTER_OP_THREADS: 每个进程的算子间线程数，默认 1
+    DITING_BIND: 监听地址，默认 0.0.0.0:8080
+    DITING_TIMEOUT: 单个请求的超时时间 (秒)，默认 300
+"""
+
+import os
+
+cpu_count = os.cpu_count() or 1
+
+workers = int(os.environ.get('DITING_WORKERS', cpu_count))
+bind = os.environ.get('DITING_BIND', '0.0.0.0:8080')
+timeout = int(os.environ.get('DITING_TIMEOUT', '300'))
+worker_class = 'sync'
+preload_app = False
+
+# 在 master 进程中设置，fork 出的工作进程导入 app 时读取
+os.environ.setdefault('DITING_INTRA_OP_THREADS', str(max(1, cpu_count // workers)))
+os.environ.setdefault('DITING_INTER_OP_THREADS', '1')
+os.environ.setdefault('DITING_ORT_ALLOW_SPINNING', '0')
+# numpy/BLAS 的线程同样按进程限制
+os.environ.setdefault('OMP_NUM_THREADS', os.environ['DITING_INTRA_OP_THREADS'])
+os.environ.setdefault('OPENBLAS_NUM_THREADS', os.environ['DITING_INTRA_OP_THREADS'])
+os.environ.setdefault('MKL_NUM_THREADS', os.environ['DITING_INTRA_OP_THREADS'])
+os.environ.setdefault('FLASK_DEBUG', '0')
+
+accesslog = '-'
+errorlog = '-'
+loglevel = 'info'
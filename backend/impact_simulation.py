@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+地震影响模拟 (服务端)
+
+与前端 src/services/mockImpactSimulator.ts 使用相同的简化烈度衰减模型和影响人口系数，
+但人口由网格化的人口栅格估算，并在服务端向量化计算:
+
+    * 人口栅格预处理为只包含有人口的格网，格网中心的单位向量 xyz[3, n] 和人口 population[n]
+      保存为 .npy，查询时内存映射打开
+    * 震中距只影响烈度，而烈度随距离单调递减，因此只需把各烈度等级 (四舍五入后) 的边界半径
+      换算为弦长平方，对每个格网计算到震中的弦长平方 (三次减法和乘加，无三角函数)
+      后用 searchsorted 归入烈度等级，再用 bincount 按等级累加人口
+    * 格网按瓦片存放，整个瓦片都落在同一烈度等级内时直接累加瓦片人口 (见PopulationGrid)，
+      只有跨越等级边界的瓦片才逐个格网计算
+    * 城市和设施列表用KD树 (scipy.spatial.cKDTree，单位向量的欧氏距离即弦长) 查询影响半径内的点
+
+结果的结构与前端的 SimulationResult 相同 (驼峰命名)，另外给出各烈度等级的人口。
+
+预处理人口栅格 (ESRI ASCII .asc、带地理参数的 .npy，或安装了 rasterio 时的 GeoTIFF):
+    python impact_simulation.py convert worldpop_chn_1km.asc data/population_grid
+    python impact_simulation.py synthetic data/population_grid     # 生成合成栅格用于演示和测试
+    python impact_simulation.py simulate --grid data/population_grid --lat 30.6 --lng 104.1 --magnitude 7
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+# 影响半径上限: 半个大圆
+MAX_RADIUS_KM = EARTH_RADIUS_KM * np.pi
+# 绘制影响圈的烈度等级 (等级, 颜色, 标签)，与前端一致
+INTENSITY_LEVELS = (
+    (12, '#7c0000', 'XII 毁灭'),
+    (11, '#a00000', 'XI 极灾'),
+    (10, '#c40000', 'X 灾难'),
+    (9, '#dc143c', 'IX 毁坏'),
+    (8, '#ff4500', 'VIII 严重破坏'),
+    (7, '#ff8c00', 'VII 破坏'),
+    (6, '#ffa500', 'VI 轻微破坏'),
+    (5, '#ffd700', 'V 惊醒'),
+    (4, '#ffff00', 'IV 普遍有感'),
+)
+# 从该烈度 (四舍五入后) 开始计入影响人口，系数从 MIN_FACTOR 线性增加到烈度12时的 MAX_FACTOR
+POPULATION_INTENSITY_THRESHOLD = 5
+MIN_FACTOR = 0.01
+MAX_FACTOR = 0.8
+
+# 前端模拟器中的示例城市和设施，未配置列表文件时使用
+DEFAULT_CITIES = [
+    {'name': '北京', 'lat': 39.9042, 'lng': 116.4074, 'population': 21540000},
+    {'name': '天津', 'lat': 39.0842, 'lng': 117.2000, 'population': 13860000},
+    {'name': '上海', 'lat': 31.2304, 'lng': 121.4737, 'population': 24870000},
+    {'name': '广州', 'lat': 23.1291, 'lng': 113.2644, 'population': 18670000},
+    {'name': '深圳', 'lat': 22.5431, 'lng': 114.0579, 'population': 17560000},
+    {'name': '成都', 'lat': 30.5728, 'lng': 104.0668, 'population': 20930000},
+    {'name': '重庆', 'lat': 29.5630, 'lng': 106.5515, 'population': 32050000},
+    {'name': '武汉', 'lat': 30.5928, 'lng': 114.3055, 'population': 12320000},
+    {'name': '西安', 'lat': 34.3416, 'lng': 108.9402, 'population': 12950000},
+    {'name': '东京', 'lat': 35.6895, 'lng': 139.6917, 'population': 37430000},
+    {'name': '旧金山', 'lat': 37.7749, 'lng': -122.4194, 'population': 883305},
+]
+DEFAULT_FACILITIES = [
+    {'name': '三峡大坝', 'type': 'dam', 'lat': 30.8230, 'lng': 111.0036},
+    {'name': '大亚湾核电站', 'type': 'nuclear', 'lat': 22.5989, 'lng': 114.5444},
+    {'name': '首都国际机场', 'type': 'airport', 'lat': 40.0799, 'lng': 116.5855},
+    {'name': '浦东国际机场', 'type': 'airport', 'lat': 31.1443, 'lng': 121.8083},
+]
+
+
+def intensity_at(magnitude, distance_km):
+    """
+    简化的烈度衰减模型 (仅用于演示，与前端相同): I = 1.5M - 2log10(R+1) + 1.5，限制在1-12
+
+    Args:
+        magnitude: 震级
+        distance_km: 震中距 (km)，可以是数组
+
+    Returns:
+        烈度 (与distance_km形状相同)
+    """
+    return np.clip(magnitude * 1.5 - 2.0 * np.log10(np.asarray(distance_km, dtype=np.float64) + 1) + 1.5, 1, 12)
+
+
+def radius_for_intensity(magnitude, intensity):
+    """烈度衰减模型的逆运算: 烈度不低于intensity的最大震中距 (km)"""
+    radius = 10 ** ((magnitude * 1.5 - intensity + 1.5) / 2.0) - 1
+    return float(min(MAX_RADIUS_KM, max(0.0, radius)))
+
+
+def population_factor(intensity):
+    """
+    四舍五入后的烈度对应的影响人口系数，低于 POPULATION_INTENSITY_THRESHOLD 时为0
+
+    Args:
+        intensity: 整数烈度，可以是数组
+    """
+    intensity = np.asarray(intensity, dtype=np.float64)
+    relative = (intensity - POPULATION_INTENSITY_THRESHOLD) / (12 - POPULATION_INTENSITY_THRESHOLD)
+    factor = np.clip(MIN_FACTOR + (MAX_FACTOR - MIN_FACTOR) * relative, MIN_FACTOR, MAX_FACTOR)
+    return np.where(intensity >= POPULATION_INTENSITY_THRESHOLD, factor, 0.0)
+
+
+def round_half_up(value):
+    """与 JavaScript 的 Math.round 相同的四舍五入"""
+    return np.floor(np.asarray(value) + 0.5)
+
+
+def unit_vectors(lat, lng, dtype=np.float64):
+    """经纬度 (度) 转为单位球面上的坐标，返回形状为[3, n]的数组 (标量时为[3])"""
+    phi = np.radians(np.asarray(lat, dtype=np.float64))
+    lam = np.radians(np.asarray(lng, dtype=np.float64))
+    cos_phi = np.cos(phi)
+    return np.stack([cos_phi * np.cos(lam), cos_phi * np.sin(lam), np.sin(phi)]).astype(dtype, copy=False)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """两点间的球面距离 (km)，参数可以是可广播的数组"""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    a = (np.sin((phi2 - phi1) / 2) ** 2
+         + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(np.asarray(lng2) - np.asarray(lng1)) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def chord_squared(distance_km):
+    """球面距离对应的单位球弦长平方 (与haversine中的 4a 相同)"""
+    return (2 * np.sin(np.minimum(np.asarray(distance_km), MAX_RADIUS_KM) / (2 * EARTH_RADIUS_KM))) ** 2
+
+
+def intensity_band_radii(magnitude):
+    """
+    四舍五入后烈度为 12, 11, ..., POPULATION_INTENSITY_THRESHOLD 的外边界半径 (km，递增)
+
+    四舍五入后的烈度不低于k等价于震中距不超过 radius_for_intensity(M, k - 0.5)
+    """
+    levels = np.arange(12, POPULATION_INTENSITY_THRESHOLD - 1, -1)
+    radii = np.array([radius_for_intensity(magnitude, k - 0.5) for k in levels])
+    return levels, radii
+
+
+class PointIndex:
+    """带KD树的点列表 (城市或设施)"""
+
+    def __init__(self, points):
+        """
+        Args:
+            points: 字典列表，每项至少包含 name、lat、lng
+        """
+        from scipy.spatial import cKDTree
+
+        self.points = list(points)
+        lat = np.array([p['lat'] for p in self.points], dtype=np.float64)
+        lng = np.array([p['lng'] for p in self.points], dtype=np.float64)
+        self.xyz = unit_vectors(lat, lng).T if self.points else np.zeros((0, 3))
+        self.lat, self.lng = lat, lng
+        self.tree = cKDTree(self.xyz) if self.points else None
+
+    def __len__(self):
+        return len(self.points)
+
+    def within(self, lat, lng, radius_km):
+        """
+        查询震中距不超过radius_km的点
+
+        Returns:
+            (点的下标数组, 震中距数组 km)
+        """
+        if self.tree is None or radius_km <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        center = unit_vectors(lat, lng)
+        # 弦长单调对应球面距离，稍放宽以免浮点误差漏掉边界上的点
+        indices = np.array(self.tree.query_ball_point(center, np.sqrt(chord_squared(radius_km)) * (1 + 1e-9)),
+                           dtype=np.int64)
+        distances = haversine_km(lat, lng, self.lat[indices], self.lng[indices])
+        keep = distances <= radius_km
+        return indices[keep], distances[keep]
+
+
+def load_points(path, default):
+    """从JSON文件读取点列表 (字典数组)，path为空时返回default"""
+    if not path:
+        return list(default)
+    with open(path, 'r', encoding='utf-8') as f:
+        points = json.load(f)
+    for p in points:
+        if 'name' not in p or 'lat' not in p or 'lng' not in p:
+            raise ValueError(f"{path}: 每个点需要包含 name、lat、lng")
+    return points
+
+
+class PopulationGrid:
+    """
+    内存映射的人口栅格 (只保存有人口的格网)
+
+    格网按 tile_cells x tile_cells 分块 (瓦片) 存放。查询时先用瓦片中心的距离和瓦片半径判断，
+    整个瓦片都落在同一烈度等级内 (绝大多数) 时直接累加瓦片人口，只有跨越等级边界的瓦片
+    才逐个格网计算距离，因此耗时与边界附近的格网数相关，而不是与栅格大小相关。
+
+    目录结构:
+        meta.json            栅格的地理参数 (北边界纬度、西边界经度、格网大小、行列数、瓦片大小) 和总人口
+        tile_ptr.npy         int64 [瓦片数 + 1]，第i个瓦片的格网为 [tile_ptr[i], tile_ptr[i+1])
+        tile_center.npy      float64 [3, 瓦片数]，瓦片中心的单位向量
+        tile_radius.npy      float64 [瓦片数]，瓦片中心到瓦片角点的最大角距离 (弧度)
+        tile_population.npy  float64 [瓦片数]
+        xyz.npy              float32 [3, n]，格网中心的单位向量
+        population.npy       float32 [n]
+    """
+
+    def __init__(self, grid_dir):
+        """
+        Args:
+            grid_dir: build() 生成的目录
+        """
+        self.grid_dir = grid_dir
+        with open(os.path.join(grid_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.tile_ptr = np.load(os.path.join(grid_dir, 'tile_ptr.npy'))
+        self.tile_center = np.load(os.path.join(grid_dir, 'tile_center.npy'))
+        self.tile_radius = np.load(os.path.join(grid_dir, 'tile_radius.npy'))
+        self.tile_population = np.load(os.path.join(grid_dir, 'tile_population.npy'))
+        self.xyz = np.load(os.path.join(grid_dir, 'xyz.npy'), mmap_mode='r')
+        self.population = np.load(os.path.join(grid_dir, 'population.npy'), mmap_mode='r')
+
+    @property
+    def cells(self):
+        return self.population.shape[0]
+
+    def exposure(self, lat, lng, magnitude):
+        """
+        各烈度等级 (四舍五入后) 内的人口
+
+        Args:
+            lat, lng: 震中 (度)
+            magnitude: 震级
+
+        Returns:
+            (烈度等级数组 [12, 11, ..., POPULATION_INTENSITY_THRESHOLD], 对应的人口数组)
+        """
+        levels, radii = intensity_band_radii(magnitude)
+        nbands = len(levels) + 1
+        # 距离不超过第k个边界的归入第k个等级，超过最外边界的归入 len(levels) (不计)
+        angles = radii / EARTH_RADIUS_KM
+        center = unit_vectors(lat, lng)
+        chord = np.sqrt(np.square(self.tile_center - center[:, None]).sum(axis=0))
+        distance = 2 * np.arcsin(np.minimum(chord / 2, 1.0))
+        lo = np.searchsorted(angles, distance - self.tile_radius, side='left')
+        hi = np.searchsorted(angles, distance + self.tile_radius, side='left')
+        whole = lo == hi
+        population = np.bincount(lo[whole], weights=self.tile_population[whole], minlength=nbands).astype(np.float64)
+
+        # 跨越等级边界 (且不完全在最外边界之外) 的瓦片逐个格网计算
+        partial = np.flatnonzero(~whole & (lo < len(levels)))
+        if partial.size:
+            starts = self.tile_ptr[partial]
+            lengths = self.tile_ptr[partial + 1] - starts
+            offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+            index = np.arange(int(lengths.sum())) + offsets
+            xyz = self.xyz[:, index]
+            center32 = center.astype(np.float32)
+            d2 = np.square(xyz[0] - center32[0])
+            d2 += np.square(xyz[1] - center32[1])
+            d2 += np.square(xyz[2] - center32[2])
+            bands = np.searchsorted(chord_squared(radii).astype(np.float32), d2, side='left')
+            population += np.bincount(bands, weights=self.population[index], minlength=nbands)
+        return levels, population[:len(levels)]
+
+    @staticmethod
+    def build(raster, north, west, cell_size, grid_dir, nodata=None, tile_cells=16):
+        """
+        由人口栅格生成内存映射目录
+
+        Args:
+            raster: 二维数组 (可以是内存映射)，第0行为最北
+            north: 栅格北边界的纬度
+            west: 栅格西边界的经度
+            cell_size: 格网大小 (度)
+            grid_dir: 输出目录
+            nodata: 无数据值，按0处理
+            tile_cells: 瓦片的边长 (格网数)
+        """
+        os.makedirs(grid_dir, exist_ok=True)
+        nrows, ncols = raster.shape
+        # 第一遍只统计每个瓦片行的有人口格网数，用于预分配输出
+        block_counts = []
+        for r in range(0, nrows, tile_cells):
+            block = _clean_block(np.asarray(raster[r:r + tile_cells], dtype=np.float64), nodata)
+            block_counts.append(int((block > 0).sum()))
+        n = sum(block_counts)
+        xyz = np.lib.format.open_memmap(os.path.join(grid_dir, 'xyz.npy'), mode='w+', dtype=np.float32,
+                                        shape=(3, n))
+        population = np.lib.format.open_memmap(os.path.join(grid_dir, 'population.npy'), mode='w+',
+                                               dtype=np.float32, shape=(n,))
+        lng_centers = west + (np.arange(ncols) + 0.5) * cell_size
+        tile_ptr, tile_lat, tile_lng, tile_population = [], [], [], []
+        start = 0
+        for r in range(0, nrows, tile_cells):
+            block = _clean_block(np.asarray(raster[r:r + tile_cells], dtype=np.float64), nodata)
+            rows, cols = np.nonzero(block > 0)
+            # 同一瓦片的格网相邻存放
+            order = np.lexsort((cols, rows, cols // tile_cells))
+            rows, cols = rows[order], cols[order]
+            values = block[rows, cols]
+            stop = start + values.shape[0]
+            xyz[:, start:stop] = unit_vectors(north - (r + rows + 0.5) * cell_size, lng_centers[cols],
+                                              dtype=np.float32)
+            population[start:stop] = values
+            tiles, first = np.unique(cols // tile_cells, return_index=True)
+            tile_ptr.append(start + first)
+            tile_population.append(np.add.reduceat(values, first) if values.size else values)
+            tile_lat.append(np.full(tiles.shape, north - (r + min(tile_cells, nrows - r) / 2) * cell_size))
+            tile_lng.append(west + (tiles * tile_cells + np.minimum(tile_cells, ncols - tiles * tile_cells) / 2)
+                            * cell_size)
+            start = stop
+        xyz.flush()
+        population.flush()
+        del xyz, population
+
+        tile_lat, tile_lng = np.concatenate(tile_lat), np.concatenate(tile_lng)
+        # 瓦片半径: 中心到四个角点的最大距离
+        half = tile_cells * cell_size / 2
+        corners = [haversine_km(tile_lat, tile_lng, tile_lat + dy, tile_lng + dx)
+                   for dy in (-half, half) for dx in (-half, half)]
+        np.save(os.path.join(grid_dir, 'tile_ptr.npy'), np.concatenate(tile_ptr + [[n]]).astype(np.int64))
+        np.save(os.path.join(grid_dir, 'tile_center.npy'), unit_vectors(tile_lat, tile_lng))
+        np.save(os.path.join(grid_dir, 'tile_radius.npy'), np.max(corners, axis=0) / EARTH_RADIUS_KM * (1 + 1e-6))
+        tile_population = np.concatenate(tile_population)
+        np.save(os.path.join(grid_dir, 'tile_population.npy'), tile_population)
+        meta = {'north': float(north), 'west': float(west), 'cell_size': float(cell_size),
+                'nrows': int(nrows), 'ncols': int(ncols), 'tile_cells': int(tile_cells),
+                'cells': n, 'tiles': int(tile_lat.shape[0]), 'total_population': float(tile_population.sum())}
+        with open(os.path.join(grid_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        return PopulationGrid(grid_dir)
+
+
+def _clean_block(block, nodata):
+    if nodata is not None:
+        block[block == nodata] = 0
+    block[~np.isfinite(block)] = 0
+    return block
+
+
+class ImpactSimulator:
+    """影响模拟: 烈度圈、影响范围内的城市和设施、影响人口"""
+
+    def __init__(self, grid=None, cities=None, facilities=None):
+        """
+        Args:
+            grid: PopulationGrid，None时按城市人口估算 (与前端模拟器相同)
+            cities: 城市列表 (含 population)，None表示 DEFAULT_CITIES
+            facilities: 设施列表 (含 type)，None表示 DEFAULT_FACILITIES
+        """
+        self.grid = grid
+        self.cities = PointIndex(DEFAULT_CITIES if cities is None else cities)
+        self.facilities = PointIndex(DEFAULT_FACILITIES if facilities is None else facilities)
+
+    def simulate(self, lat, lng, magnitude):
+        """
+        Args:
+            lat, lng: 震中 (度)
+            magnitude: 震级
+
+        Returns:
+            结构与前端 SimulationResult 相同的字典，另有 populationByIntensity、populationSource
+        """
+        circles = []
+        for level, color, label in INTENSITY_LEVELS:
+            radius_km = radius_for_intensity(magnitude, level)
+            if radius_km > 0:
+                circles.append({'center': {'lat': lat, 'lng': lng}, 'radius': radius_km * 1000,
+                                'intensity': level, 'color': color, 'label': label})
+        circles.sort(key=lambda c: -c['radius'])
+        max_radius_km = circles[0]['radius'] / 1000 if circles else 0.0
+
+        cities = self._affected(self.cities, lat, lng, magnitude, max_radius_km)
+        facilities = self._affected(self.facilities, lat, lng, magnitude, max_radius_km)
+
+        if self.grid is not None:
+            levels, population = self.grid.exposure(lat, lng, magnitude)
+            source = 'grid'
+        else:
+            # 没有人口栅格时与前端相同: 按城市所在位置的烈度估算整个城市的人口
+            levels = np.arange(12, POPULATION_INTENSITY_THRESHOLD - 1, -1)
+            population = np.zeros(len(levels))
+            for city in cities:
+                if city['estimatedIntensity'] >= POPULATION_INTENSITY_THRESHOLD:
+                    population[12 - city['estimatedIntensity']] += city.get('population', 0)
+            source = 'cities'
+        affected = population * population_factor(levels)
+
+        return {
+            'epicenter': {'lat': lat, 'lng': lng},
+            'magnitude': magnitude,
+            'intensityCircles': circles,
+            'affectedCities': cities,
+            'affectedFacilities': facilities,
+            'estimatedAffectedPopulation': int(np.round(affected).sum()),
+            'populationByIntensity': [{'intensity': int(level), 'population': int(round(p)),
+                                       'affected': int(round(a))}
+                                      for level, p, a in zip(levels, population, affected)],
+            'populationSource': source,
+        }
+
+    @staticmethod
+    def _affected(index, lat, lng, magnitude, radius_km):
+        indices, distances = index.within(lat, lng, radius_km)
+        intensities = round_half_up(intensity_at(magnitude, distances)).astype(int)
+        affected = [dict(index.points[i], estimatedIntensity=int(intensity))
+                    for i, intensity in zip(indices, intensities)]
+        affected.sort(key=lambda p: -p['estimatedIntensity'])
+        return affected
+
+
+def read_raster(path, north=None, west=None, cell_size=None):
+    """
+    读取人口栅格
+
+    Args:
+        path: ESRI ASCII (.asc)、GeoTIFF (.tif，需要rasterio) 或 .npy (需给出地理参数)
+        north, west, cell_size: .npy 的北边界纬度、西边界经度和格网大小 (度)
+
+    Returns:
+        (二维数组, north, west, cell_size, nodata)
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.asc':
+        header = {}
+        with open(path, 'r') as f:
+            while len(header) < 6:
+                pos = f.tell()
+                line = f.readline()
+                key = line.split()[0].lower() if line.strip() else ''
+                if not key or key[0].isdigit() or key[0] in '-.':
+                    f.seek(pos)
+                    break
+                header[key] = float(line.split()[1])
+            data = np.loadtxt(f, dtype=np.float32, ndmin=2)
+        nrows, ncols = int(header['nrows']), int(header['ncols'])
+        cell_size = header['cellsize']
+        west = header.get('xllcorner', header.get('xllcenter', 0) - cell_size / 2)
+        south = header.get('yllcorner', header.get('yllcenter', 0) - cell_size / 2)
+        return data.reshape(nrows, ncols), south + nrows * cell_size, west, cell_size, header.get('nodata_value')
+    if ext in ('.tif', '.tiff'):
+        import rasterio
+
+        with rasterio.open(path) as src:
+            transform = src.transform
+            return src.read(1), transform.f, transform.c, transform.a, src.nodata
+    if None in (north, west, cell_size):
+        raise ValueError(".npy 栅格需要给出 --north、--west 和 --cell-size")
+    return np.load(path, mmap_mode='r'), north, west, cell_size, None
+
+
+def synthetic_raster(south=18.0, north=54.0, west=73.0, east=135.0, cell_size=1 / 120, seed=0):
+    """
+    合成人口栅格 (用于演示和性能测试): 在示例城市周围叠加人口中心，加上随机的农村人口
+
+    Returns:
+        (float32二维数组, north, west, cell_size)
+    """
+    rng = np.random.default_rng(seed)
+    nrows, ncols = int(round((north - south) / cell_size)), int(round((east - west) / cell_size))
+    lat = north - (np.arange(nrows) + 0.5) * cell_size
+    lng = west + (np.arange(ncols) + 0.5) * cell_size
+    raster = np.zeros((nrows, ncols), dtype=np.float32)
+    for r in range(0, nrows, 256):
+        rows = slice(r, r + 256)
+        block = rng.lognormal(3.0, 1.5, size=(lat[rows].shape[0], ncols)).astype(np.float32)
+        # 约一半的格网无人居住
+        block[rng.random(block.shape) < 0.5] = 0
+        for city in DEFAULT_CITIES:
+            d = haversine_km(lat[rows, None], lng[None, :], city['lat'], city['lng'])
+            block += (city['population'] / (2 * np.pi * 15.0 ** 2) * np.exp(-0.5 * (d / 15.0) ** 2)).astype(np.float32)
+        raster[rows] = block
+    return raster, north, west, cell_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='地震影响模拟的人口栅格预处理与测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    c = sub.add_parser('convert', help='把人口栅格转换为内存映射目录')
+    c.add_argument('raster', help='ESRI ASCII (.asc)、GeoTIFF (.tif) 或 .npy 栅格')
+    c.add_argument('output', help='输出目录')
+    c.add_argument('--north', type=float, default=None, help='.npy 栅格北边界的纬度')
+    c.add_argument('--west', type=float, default=None, help='.npy 栅格西边界的经度')
+    c.add_argument('--cell-size', type=float, default=None, help='.npy 栅格的格网大小 (度)')
+    c.add_argument('--tile-cells', type=int, default=16, help='瓦片的边长 (格网数)')
+
+    s = sub.add_parser('synthetic', help='生成合成人口栅格的内存映射目录')
+    s.add_argument('output', help='输出目录')
+    s.add_argument('--cell-size', type=float, default=1 / 120, help='格网大小 (度)，默认30角秒')
+    s.add_argument('--seed', type=int, default=0, help='随机种子')
+    s.add_argument('--tile-cells', type=int, default=16, help='瓦片的边长 (格网数)')
+
+    m = sub.add_parser('simulate', help='运行一次模拟并计时')
+    m.add_argument('--grid', default=None, help='人口栅格目录，不给出时按城市人口估算')
+    m.add_argument('--lat', type=float, required=True, help='震中纬度')
+    m.add_argument('--lng', type=float, required=True, help='震中经度')
+    m.add_argument('--magnitude', type=float, required=True, help='震级')
+    m.add_argument('--repeat', type=int, default=5, help='计时重复次数')
+    args = parser.parse_args()
+
+    if args.command in ('convert', 'synthetic'):
+        t0 = time.perf_counter()
+        if args.command == 'convert':
+            raster, north, west, cell_size, nodata = read_raster(args.raster, args.north, args.west, args.cell_size)
+        else:
+            (raster, north, west, cell_size), nodata = synthetic_raster(cell_size=args.cell_size, seed=args.seed), None
+        grid = PopulationGrid.build(raster, north, west, cell_size, args.output, nodata=nodata,
+                                    tile_cells=args.tile_cells)
+        print(f"已生成 {args.output}: {raster.shape[0]}x{raster.shape[1]} 格网，其中 {grid.cells} 个有人口 "
+              f"({grid.meta['tiles']} 个瓦片)，"
+              f"总人口 {grid.meta['total_population']:.0f}，耗时 {time.perf_counter() - t0:.1f} 秒")
+        return
+
+    simulator = ImpactSimulator(PopulationGrid(args.grid) if args.grid else None)
+    timings = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        result = simulator.simulate(args.lat, args.lng, args.magnitude)
+        timings.append(time.perf_counter() - t0)
+    print(f"影响人口 {result['estimatedAffectedPopulation']} ({result['populationSource']})，"
+          f"最短耗时 {min(timings) * 1000:.1f} ms，首次 {timings[0] * 1000:.1f} ms")
+    for row in result['populationByIntensity']:
+        print(f"    烈度 {row['intensity']:2d}: 人口 {row['population']:>12d}  影响 {row['affected']:>12d}")
+    print(f"    城市: {[(c['name'], c['estimatedIntensity']) for c in result['affectedCities']]}")
+    print(f"    设施: {[(f['name'], f['estimatedIntensity']) for f in result['affectedFacilities']]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+使用 onnxruntime IO binding 的推理引擎
+
+InferenceEngine 持有会话和一组预先分配的缓冲区:
+
+    work     float64 [batch_size, 3, window_length]  窗口归一化的工作区
+    input    float32 [batch_size, 3, window_length]  绑定为模型输入
+    output   float32 [batch_size, 3, window_length]  绑定为模型输出
+
+窗口数据直接写入工作区并原地归一化，再转换写入绑定的输入缓冲区；
+run_with_iobinding 把结果写入绑定的输出缓冲区，调用方直接从中累加置信度。
+每种批大小 (通常只有满批和最后一个不满的批) 的绑定只创建一次，
+稳定运行时每批不再分配新的数组。
+
+归一化与 _normalize_windows 使用相同的 float64 运算顺序，结果逐位相同。
+
+EnginePool 按 (会话, 窗口长度, 批大小) 缓存空闲的引擎，各请求用完后放回，
+不必每次分配缓冲区和创建IO binding；并发的请求各自取得不同的引擎。
+"""
+
+import threading
+
+import numpy as np
+
+
+def normalize_windows_inplace(work, scratch, stats):
+    """
+    原地归一化一批窗口 (每个窗口的每个通道独立归一化)
+
+    与 batch -= mean; batch /= std + 1e-8 (np.mean/np.std 的实现) 的运算顺序相同，
+    但所有中间结果都写入预先分配的缓冲区。
+
+    Args:
+        work: 窗口数据，float64，形状为[n, 3, window_length]，原地修改
+        scratch: 与work形状相同的float64缓冲区
+        stats: float64缓冲区，形状为[n, 3, 1]
+    """
+    length = work.shape[2]
+    # 均值
+    np.sum(work, axis=2, keepdims=True, out=stats)
+    np.true_divide(stats, length, out=stats)
+    np.subtract(work, stats, out=work)
+    # np.std 对去均值后的数据再求一次均值，平方和除以长度后开方
+    np.sum(work, axis=2, keepdims=True, out=stats)
+    np.true_divide(stats, length, out=stats)
+    np.subtract(work, stats, out=scratch)
+    np.multiply(scratch, scratch, out=scratch)
+    np.sum(scratch, axis=2, keepdims=True, out=stats)
+    np.true_divide(stats, length, out=stats)
+    np.sqrt(stats, out=stats)
+    np.add(stats, 1e-8, out=stats)  # 避免除零错误
+    np.true_divide(work, stats, out=work)
+
+
+class InferenceEngine:
+    """
+    持有ONNX会话并通过IO binding复用输入输出缓冲区的推理引擎
+
+    run()返回的是输出缓冲区的视图，下一次run()时会被覆盖，调用方需在此之前用完。
+    同一个引擎不能被多个线程同时使用。
+    """
+
+    def __init__(self, session, window_length=10000, batch_size=16):
+        """
+        Args:
+            session: ONNX运行时会话对象，输入输出形状为[batch, 3, window_length]
+            window_length: 窗口长度
+            batch_size: 每批最多的窗口数 (已按模型的batch维度调整，见_resolve_batch_size)
+        """
+        self.session = session
+        self.window_length = window_length
+        self.batch_size = batch_size
+        self.input_name = session.get_inputs()[0].name
+        self.output_name = session.get_outputs()[0].name
+        shape = (batch_size, 3, window_length)
+        self.work = np.zeros(shape, dtype=np.float64)
+        self.scratch = np.zeros(shape, dtype=np.float64)
+        self.stats = np.zeros((batch_size, 3, 1), dtype=np.float64)
+        self.input = np.zeros(shape, dtype=np.float32)
+        self.output = np.zeros(shape, dtype=np.float32)
+        # 批大小 -> IO binding
+        self._bindings = {}
+
+    def _binding(self, n):
+        binding = self._bindings.get(n)
+        if binding is None:
+            # 前n个窗口在C顺序的缓冲区中是连续的，直接绑定其地址
+            shape = [n, 3, self.window_length]
+            binding = self.session.io_binding()
+            binding.bind_input(self.input_name, 'cpu', 0, np.float32, shape, self.input.ctypes.data)
+            binding.bind_output(self.output_name, 'cpu', 0, np.float32, shape, self.output.ctypes.data)
+            self._bindings[n] = binding
+        return binding
+
+    def load(self, k, window):
+        """
+        将第k个窗口的原始数据写入工作区
+
+        Args:
+            k: 批内位置
+            window: 原始数据，形状为[3, window_length] (可以是步长视图)
+        """
+        np.copyto(self.work[k], window)
+
+    def load_batch(self, windows):
+        """
+        将一批窗口的原始数据写入工作区
+
+        Args:
+            windows: 原始数据，形状为[n, 3, window_length] (可以是步长视图)
+
+        Returns:
+            窗口数n
+        """
+        n = windows.shape[0]
+        np.copyto(self.work[:n], windows)
+        return n
+
+    def prepare(self, n):
+        """原地归一化工作区中的前n个窗口，并写入绑定的输入缓冲区"""
+        normalize_windows_inplace(self.work[:n], self.scratch[:n], self.stats[:n])
+        np.copyto(self.input[:n], self.work[:n], casting='same_kind')
+
+    def run(self, n):
+        """
+        对已准备好的前n个窗口运行模型
+
+        Returns:
+            输出缓冲区的视图，形状为[n, 3, window_length]
+        """
+        self.session.run_with_iobinding(self._binding(n))
+        return self.output[:n]
+
+    def predict(self, windows):
+        """
+        归一化并推理一批完整长度的窗口
+
+        Args:
+            windows: 原始数据，形状为[n, 3, window_length]，n不超过batch_size
+
+        Returns:
+            输出缓冲区的视图，形状为[n, 3, window_length]
+        """
+        n = self.load_batch(windows)
+        self.prepare(n)
+        return self.run(n)
+
+    def prepare_padded(self, waveform):
+        """
+        准备不足一个窗口长度的数据: 只对有效部分归一化，其余补零，作为批内唯一的窗口
+
+        Args:
+            waveform: 原始数据，形状为[3, n]，n不超过window_length
+        """
+        n = waveform.shape[1]
+        self.work[0, :, n:] = 0
+        np.copyto(self.work[0, :, :n], waveform)
+        normalize_windows_inplace(self.work[:1, :, :n], self.scratch[:1, :, :n], self.stats[:1])
+        np.copyto(self.input[:1], self.work[:1], casting='same_kind')
+
+    def predict_padded(self, waveform):
+        """
+        推理不足一个窗口长度的数据
+
+        Returns:
+            输出缓冲区的视图，形状为[1, 3, window_length]
+        """
+        self.prepare_padded(waveform)
+        return self.run(1)
+
+
+class EnginePool:
+    """
+    按 (会话, 窗口长度, 批大小) 复用的 InferenceEngine 池
+
+    acquire()取出一个空闲的引擎 (没有时新建)，用完后由release()放回。
+    每种配置最多保留max_idle个空闲引擎，超出的由垃圾回收释放。
+    """
+
+    def __init__(self, max_idle=4):
+        """
+        Args:
+            max_idle: 每种配置保留的空闲引擎数
+        """
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, session, window_length, batch_size):
+        """
+        取出一个引擎，使用期间归调用方独占
+
+        Returns:
+            InferenceEngine
+        """
+        key = (id(session), window_length, batch_size)
+        with self._lock:
+            idle = self._idle.get(key)
+            # 会话被释放后id可能被新的会话重用，只复用同一个会话的引擎
+            while idle:
+                engine = idle.pop()
+                if engine.session is session:
+                    return engine
+        return InferenceEngine(session, window_length, batch_size)
+
+    def release(self, engine):
+        """放回引擎；推理出错时不必放回"""
+        key = (id(engine.session), engine.window_length, engine.batch_size)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(engine)
+
+
+# 整体推理和多台站推理共用的引擎池
+engine_pool = EnginePool()
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+波形分析的异步任务管理
+
+提交任务后立即返回任务ID，由固定数量的工作线程处理；
+支持查询进度 (已完成窗口数/窗口总数)、获取结果和取消任务，
+排队任务数超过上限时拒绝新的提交。
+
+多进程部署 (gunicorn 多个工作进程) 时，查询和取消请求可能落到没有运行该任务的进程上。
+给出 state_path 时任务状态、进度和结果同时写入SQLite，各进程都能查询；
+取消其他进程的任务时只在SQLite中做标记，运行该任务的进程在报告进度时读取标记并中止。
+持有任务的进程定期写入心跳，进程退出 (超时被杀、内存不足) 后任务停止心跳，
+查询时超过 STALE_SECONDS 没有心跳的未结束任务标记为失败。
+SQLite 读写都在释放进程内的锁之后进行，写入争用不会阻塞提交和查询。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+import logging
+from collections import OrderedDict
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+# 运行中的任务最多每隔这么久 (秒) 把进度写入SQLite并检查取消标记
+PROGRESS_SYNC_SECONDS = 1.0
+# 持有任务的进程写入心跳的间隔 (秒)，超过 STALE_SECONDS 没有心跳的未结束任务视为进程已退出
+HEARTBEAT_SECONDS = 10.0
+STALE_SECONDS = 60.0
+
+
+class QueueFullError(Exception):
+    """排队任务数已达上限"""
+
+
+class JobCancelled(Exception):
+    """任务在运行中被取消"""
+
+
+class Job:
+    """单个分析任务的状态"""
+
+    def __init__(self, payload, cleanup=None):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.cleanup = cleanup
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.windows_done = 0
+        self.windows_total = None
+        self.result = None
+        self.error = None
+        self._cancel_requested = threading.Event()
+        # 由JobManager设置: 报告进度时同步持久化的状态，返回True表示其他进程请求了取消
+        self._sync = None
+        self._synced_at = 0.0
+
+    @classmethod
+    def from_row(cls, row):
+        """由SQLite中的一行恢复任务状态 (其他进程的任务，只用于查询)"""
+        job = cls(None)
+        (job.id, job.status, job.created_at, job.started_at, job.finished_at, job.windows_done,
+         job.windows_total, job.error, result) = row
+        job.result = json.loads(result) if result is not None else None
+        return job
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_requested.is_set()
+
+    def report_progress(self, windows_done, windows_total):
+        """
+        由处理函数调用，更新进度；任务已被取消时抛出JobCancelled以中止处理
+
+        Args:
+            windows_done: 已完成的窗口数
+            windows_total: 窗口总数
+        """
+        self.windows_done = windows_done
+        self.windows_total = windows_total
+        now = time.monotonic()
+        if self._sync is not None and now - self._synced_at >= PROGRESS_SYNC_SECONDS:
+            self._synced_at = now
+            if self._sync(self):
+                self._cancel_requested.set()
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def to_dict(self):
+        """任务状态，用于状态查询接口"""
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'windows_done': self.windows_done,
+            'windows_total': self.windows_total,
+            'progress': (self.windows_done / self.windows_total) if self.windows_total else 0.0,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+        }
+
+
+class JobManager:
+    """
+    有界的任务队列与工作线程池
+
+    handler(job)在工作线程中执行并返回结果 (给出state_path时需可序列化为JSON)，
+    可通过job.report_progress()报告进度；已结束的任务最多保留max_finished个，超出时淘汰最早的。
+    排队任务数的上限按进程计算。
+    """
+
+    def __init__(self, handler, max_workers=2, max_pending=8, max_finished=200, state_path=None,
+                 stale_seconds=STALE_SECONDS):
+        """
+        Args:
+            handler: 处理函数，参数为Job，返回值作为任务结果
+            max_workers: 工作线程数
+            max_pending: 允许排队等待的任务数 (不含正在运行的)
+            max_finished: 保留的已结束任务数
+            state_path: 可选的SQLite文件路径，多个进程共享任务状态
+            stale_seconds: 其他进程的未结束任务超过这么久没有心跳时标记为失败
+        """
+        self.handler = handler
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self.stale_seconds = stale_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._heartbeat_thread = None
+        self.state_path = state_path
+        if state_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+            with closing(self._connect()) as conn, conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        status TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        started_at REAL,
+                        finished_at REAL,
+                        windows_done INTEGER NOT NULL DEFAULT 0,
+                        windows_total INTEGER,
+                        error TEXT,
+                        result TEXT,
+                        cancel_requested INTEGER NOT NULL DEFAULT 0,
+                        owner_pid INTEGER,
+                        heartbeat REAL
+                    )
+                """)
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+                for column, kind in (('owner_pid', 'INTEGER'), ('heartbeat', 'REAL')):
+                    if column not in columns:
+                        conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+                conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.state_path, timeout=30)
+
+    def active_count(self):
+        """排队和运行中的任务数"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status in (QUEUED, RUNNING))
+
+    def submit(self, payload, cleanup=None):
+        """
+        提交任务
+
+        Args:
+            payload: 传给处理函数的数据，保存在job.payload中
+            cleanup: 可选回调，任务结束 (包括取消和失败) 后调用，用于清理临时文件
+
+        Returns:
+            新任务
+
+        Raises:
+            QueueFullError: 排队和运行中的任务数已达上限
+        """
+        job = Job(payload, cleanup=cleanup)
+        with self._lock:
+            active = sum(1 for j in self._jobs.values() if j.status in (QUEUED, RUNNING))
+            if active >= self.max_workers + self.max_pending:
+                raise QueueFullError(f"任务队列已满 ({active} 个任务进行中)")
+            self._jobs[job.id] = job
+            self._evict_finished()
+        if self.state_path is not None:
+            job._sync = self._sync_progress
+            try:
+                self._save(job)
+            except Exception:
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+                raise
+            self._start_heartbeat()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """按ID查找任务 (本进程的任务，或SQLite中其他进程的任务状态)，不存在时返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.state_path is not None:
+            job = self._load(job_id)
+            if job is not None and job.status not in FINISHED_STATES:
+                job = self._expire_stale(job_id) or job
+        return job
+
+    def cancel(self, job_id):
+        """
+        取消任务。排队中的任务直接取消，运行中的任务在下一次报告进度时中止
+
+        Returns:
+            任务，不存在时返回None
+        """
+        cleanup = None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status not in FINISHED_STATES:
+                job._cancel_requested.set()
+                if job.status == QUEUED:
+                    cleanup = self._mark_finished(job, CANCELLED)
+        if job is None:
+            return self._cancel_remote(job_id) if self.state_path is not None else None
+        if cleanup is not None:
+            self._after_finish(job, cleanup)
+        return job
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job):
+        with self._lock:
+            if job.status != QUEUED:
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+        if self.state_path is not None and not self._mark_running(job):
+            # 排队期间被其他进程取消
+            job._cancel_requested.set()
+            self._finish(job, CANCELLED)
+            return
+        logger.info(f"开始处理任务 {job.id}")
+        try:
+            result = self.handler(job)
+        except JobCancelled:
+            logger.info(f"任务 {job.id} 已取消")
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            logger.error(f"任务 {job.id} 处理失败: {str(e)}")
+            traceback.print_exc()
+            self._finish(job, FAILED, error=str(e))
+        else:
+            logger.info(f"任务 {job.id} 处理完成")
+            self._finish(job, DONE, result=result)
+
+    def _finish(self, job, status, result=None, error=None):
+        """标记任务结束，释放锁之后执行清理和持久化"""
+        with self._lock:
+            job.result = result
+            job.error = error
+            cleanup = self._mark_finished(job, status)
+        self._after_finish(job, cleanup)
+
+    def _mark_finished(self, job, status):
+        """修改任务状态，需在持有锁时调用；返回需要在锁外执行的清理回调"""
+        job.status = status
+        job.finished_at = time.time()
+        job.payload = None
+        cleanup, job.cleanup = job.cleanup, None
+        return cleanup
+
+    def _after_finish(self, job, cleanup):
+        """任务结束后的清理和持久化，不持有锁"""
+        if cleanup is not None:
+            try:
+                cleanup()
+            except Exception as e:
+                logger.warning(f"任务 {job.id} 清理失败: {str(e)}")
+        if self.state_path is not None:
+            try:
+                self._save(job)
+            except Exception as e:
+                logger.warning(f"任务 {job.id} 状态写入失败: {str(e)}")
+
+    def _evict_finished(self):
+        """已结束的任务超过上限时，淘汰最早的，需在持有锁时调用"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
+
+    def _save(self, job):
+        """写入任务的完整状态"""
+        result = json.dumps(job.result) if job.result is not None else None
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, created_at, started_at, finished_at, windows_done, "
+                "windows_total, error, result, cancel_requested, owner_pid, heartbeat) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.status, job.created_at, job.started_at, job.finished_at, job.windows_done,
+                 job.windows_total, job.error, result, int(job.cancel_requested), os.getpid(), time.time()))
+            if job.status in FINISHED_STATES:
+                conn.execute(
+                    "DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE finished_at IS NOT NULL "
+                    "ORDER BY finished_at DESC LIMIT -1 OFFSET ?)", (self.max_finished,))
+
+    def _load(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id, status, created_at, started_at, finished_at, windows_done, windows_total, error, result "
+                "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row is not None else None
+
+    def _expire_stale(self, job_id):
+        """其他进程的未结束任务超过 stale_seconds 没有心跳时标记为失败，返回更新后的状态"""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? "
+                "WHERE id = ? AND status IN (?, ?) AND COALESCE(heartbeat, created_at) < ?",
+                (FAILED, now, "运行该任务的工作进程已退出", job_id, QUEUED, RUNNING, now - self.stale_seconds))
+        if cursor.rowcount == 0:
+            return None
+        logger.warning(f"任务 {job_id} 超过 {self.stale_seconds:g} 秒没有心跳，标记为失败")
+        return self._load(job_id)
+
+    def _mark_running(self, job):
+        """任务开始运行，已被其他进程取消时返回False"""
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, heartbeat = ? WHERE id = ? AND status = ?",
+                (RUNNING, job.started_at, time.time(), job.id, QUEUED))
+        return cursor.rowcount > 0
+
+    def _sync_progress(self, job):
+        """写入运行中任务的进度，返回是否有其他进程请求取消"""
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("UPDATE jobs SET windows_done = ?, windows_total = ?, heartbeat = ? WHERE id = ?",
+                             (job.windows_done, job.windows_total, time.time(), job.id))
+                row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job.id,)).fetchone()
+        except Exception as e:
+            logger.warning(f"任务 {job.id} 进度写入失败: {str(e)}")
+            return False
+        return bool(row and row[0])
+
+    def _cancel_remote(self, job_id):
+        """取消其他进程的任务: 排队中的直接标记为已取消，运行中的由该进程在报告进度时中止"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN (?, ?)",
+                         (job_id, QUEUED, RUNNING))
+            conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                         (CANCELLED, time.time(), job_id, QUEUED))
+        return self._load(job_id)
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat_thread is not None:
+                return
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name='job-heartbeat',
+                                                      daemon=True)
+        self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        """定期为本进程排队和运行中的任务写入心跳 (处理函数长时间不报告进度时同样有效)"""
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            with self._lock:
+                ids = [job_id for job_id, job in self._jobs.items() if job.status in (QUEUED, RUNNING)]
+            if not ids:
+                continue
+            try:
+                with closing(self._connect()) as conn, conn:
+                    conn.executemany("UPDATE jobs SET heartbeat = ? WHERE id = ?",
+                                     [(time.time(), job_id) for job_id in ids])
+            except Exception as e:
+                logger.warning(f"任务心跳写入失败: {str(e)}")
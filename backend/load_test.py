@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/process 接口的并发压测脚本
+
+以不同的并发数向后端重复上传同一个波形文件，输出每个并发数下的
+吞吐 (请求/秒) 和延迟分位数，用于观察多进程部署时吞吐随核数的扩展情况。
+每次上传的内容相同，默认在地址上附加 no_cache=1 跳过结果缓存，否则预热之后的请求都是缓存命中，
+测到的不是推理；--allow-cache 时保留缓存，测量缓存命中的吞吐。
+
+用法:
+    python load_test.py --url http://localhost:8080/process \\
+        --file ../resources/example_waveforms/demo_test_2.mseed \\
+        --concurrency 1 2 4 8 --requests 32
+"""
+
+import argparse
+import json
+import os
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def build_multipart(file_path):
+    """构造 multipart/form-data 请求体"""
+    boundary = uuid.uuid4().hex
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    filename = os.path.basename(file_path)
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode('utf-8') + content + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def send_request(url, body, content_type, timeout):
+    """发送一次请求，返回 (是否成功, 耗时秒数)"""
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': content_type}, method='POST')
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            ok = resp.status == 200
+    except Exception:
+        ok = False
+    return ok, time.perf_counter() - t0
+
+
+def run_level(url, body, content_type, concurrency, num_requests, timeout):
+    """以给定并发数发送num_requests个请求，返回统计结果"""
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: send_request(url, body, content_type, timeout), range(num_requests)))
+    wall = time.perf_counter() - t0
+    latencies = np.array([lat for ok, lat in results if ok])
+    failed = sum(1 for ok, _ in results if not ok)
+    stats = {
+        'concurrency': concurrency,
+        'requests': num_requests,
+        'failed': failed,
+        'wall_seconds': wall,
+        'requests_per_second': (num_requests - failed) / wall if wall > 0 else 0.0,
+    }
+    if latencies.size:
+        stats.update({
+            'latency_p50': float(np.percentile(latencies, 50)),
+            'latency_p90': float(np.percentile(latencies, 90)),
+            'latency_p99': float(np.percentile(latencies, 99)),
+        })
+    return stats
+
+
+def bypass_cache_url(url):
+    """在接口地址上附加 no_cache=1"""
+    return url + ('&' if '?' in url else '?') + 'no_cache=1'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DiTing 后端并发压测')
+    parser.add_argument('--url', default='http://localhost:8080/process', help='接口地址')
+    parser.add_argument('--file', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                                                       'resources', 'example_waveforms', 'demo_test_2.mseed'),
+                        help='上传的波形文件')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8], help='并发数列表')
+    parser.add_argument('--requests', type=int, default=32, help='每个并发数下的请求总数')
+    parser.add_argument('--timeout', type=float, default=300, help='单个请求超时时间 (秒)')
+    parser.add_argument('--output', default=None, help='将结果以JSON保存到该文件')
+    parser.add_argument('--allow-cache', action='store_true', help='不跳过结果缓存 (测量缓存命中的吞吐)')
+    args = parser.parse_args()
+    if not args.allow_cache:
+        args.url = bypass_cache_url(args.url)
+
+    body, content_type = build_multipart(args.file)
+    print(f"--> 压测 {args.url}，文件 {args.file} ({len(body) / 1e6:.2f} MB)")
+
+    # 预热，避免首个请求的初始化开销计入结果
+    send_request(args.url, body, content_type, args.timeout)
+
+    all_stats = []
+    baseline = None
+    for concurrency in args.concurrency:
+        stats = run_level(args.url, body, content_type, concurrency, args.requests, args.timeout)
+        if baseline is None:
+            baseline = stats['requests_per_second']
+        stats['speedup'] = stats['requests_per_second'] / baseline if baseline else 0.0
+        all_stats.append(stats)
+        print(f"并发 {concurrency:3d}: {stats['requests_per_second']:7.2f} 请求/秒 "
+              f"(加速比 {stats['speedup']:.2f}x), "
+              f"p50 {stats.get('latency_p50', float('nan')):.3f}s, "
+              f"p99 {stats.get('latency_p99', float('nan')):.3f}s, 失败 {stats['failed']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(all_stats, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存至: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+有大小上限、LRU淘汰、可持久化的文件存储基类
+
+结果缓存、波形存储、置信度曲线存储和包络金字塔存储都把每个条目保存为存储目录下的一个或多个文件，
+索引 (大小、最近访问时间等) 存放在SQLite中，多个工作进程可以共享同一个目录，重启后依然有效；
+总大小超过上限时按最近最少使用 (LRU) 淘汰。文件先写入临时文件再原子替换，
+读取时文件丢失或损坏的条目视为不存在。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+
+class LruFileStore:
+    """
+    SQLite索引的LRU文件存储
+
+    子类需要给出:
+        table: 索引表名
+        columns: 建表时的列定义，必须包含 size (字节)、created_at 和 last_access 三列
+        key_columns: 主键列，_paths 按相同顺序接收主键值；淘汰时的 keep 与第一列比较
+        indexes: 除 last_access 外需要建立的索引，{索引名后缀: 列}
+        _paths(*key): 条目对应的文件路径
+    """
+
+    table = None
+    columns = None
+    key_columns = ('key',)
+    indexes = {}
+
+    def __init__(self, store_dir, max_bytes):
+        """
+        Args:
+            store_dir: 存储目录
+            max_bytes: 总大小上限 (字节)
+        """
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(store_dir, 'index.sqlite3')
+        self._lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table} ({self.columns}, '
+                         f'PRIMARY KEY ({", ".join(self.key_columns)}))')
+            for suffix, columns in dict(self.indexes, last_access='last_access').items():
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{self.table}_{suffix} ON {self.table} ({columns})')
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @contextmanager
+    def _transaction(self):
+        """打开连接，正常结束时提交、异常时回滚，最后关闭连接"""
+        with closing(self._connect()) as conn, conn:
+            yield conn
+
+    def _paths(self, *key):
+        raise NotImplementedError
+
+    @contextmanager
+    def _replacing(self, path):
+        """
+        原子地写入文件: 产生临时文件路径，正常结束时替换目标文件，异常时删除临时文件
+        """
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            yield tmp_path
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+
+    def _where(self):
+        return ' AND '.join(f'{column} = ?' for column in self.key_columns)
+
+    def _insert(self, rows, keep=None):
+        """
+        写入索引行，然后淘汰超出上限的条目
+
+        Args:
+            rows: 索引行列表，每行为 {列名: 值} (不含 created_at 和 last_access)
+            keep: 不淘汰的条目 (主键第一列的值)，通常为刚写入的条目
+        """
+        now = time.time()
+        with self._lock, self._transaction() as conn:
+            for row in rows:
+                row = dict(row, created_at=now, last_access=now)
+                conn.execute(f'INSERT OR REPLACE INTO {self.table} ({", ".join(row)}) '
+                             f'VALUES ({", ".join("?" * len(row))})', tuple(row.values()))
+            self._evict(conn, keep=keep)
+
+    def _load(self, key, columns, load):
+        """
+        读取一个条目并更新最近访问时间
+
+        Args:
+            key: 主键值元组
+            columns: 需要返回的索引列 (SQL列表)
+            load: 以文件路径列表为参数读取条目的函数，文件丢失或损坏时抛出OSError或ValueError
+
+        Returns:
+            (索引行, load的返回值)，条目不存在或文件丢失、损坏时返回None
+        """
+        with self._lock, self._transaction() as conn:
+            row = conn.execute(f'SELECT {columns} FROM {self.table} WHERE {self._where()}', key).fetchone()
+            if row is None:
+                return None
+            try:
+                value = load(self._paths(*key))
+            except (OSError, ValueError):
+                # 文件丢失或损坏，视为不存在
+                self._remove(conn, key)
+                return None
+            conn.execute(f'UPDATE {self.table} SET last_access = ? WHERE {self._where()}', (time.time(),) + key)
+        return row, value
+
+    def _remove(self, conn, key):
+        """删除一个条目的文件和索引行"""
+        for path in self._paths(*key):
+            if os.path.exists(path):
+                os.remove(path)
+        conn.execute(f'DELETE FROM {self.table} WHERE {self._where()}', key)
+
+    def _evict(self, conn, keep=None):
+        """
+        按最近访问时间从旧到新淘汰条目，直到总大小不超过上限
+
+        Returns:
+            淘汰的条目数
+        """
+        total = conn.execute(f'SELECT COALESCE(SUM(size), 0) FROM {self.table}').fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        evicted = 0
+        for *key, size in conn.execute(
+                f'SELECT {", ".join(self.key_columns)}, size FROM {self.table} '
+                f'WHERE {self.key_columns[0]} != ? ORDER BY last_access', (keep or '',)).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._remove(conn, tuple(key))
+            total -= size
+            evicted += 1
+        return evicted
+
+    def stats(self):
+        """条目数和占用大小"""
+        with self._transaction() as conn:
+            entries, total = conn.execute(f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}').fetchone()
+        return {'entries': entries, 'size_bytes': total, 'max_bytes': self.max_bytes}
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多台站批量推理
+
+将多台站数据流按台站分组，把所有台站的滑动窗口依次装入共享的批次中送入模型，
+每个台站各自累加置信度并做后处理。台站记录较短时，单台站逐个处理凑不满一个批次，
+合并后每次session.run都能用满批大小。
+"""
+
+import io
+import os
+import tarfile
+import time
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+from post_processing import postprocesser_ev_center
+from confidence_accumulator import ConfidenceAccumulator
+from inference_engine import engine_pool
+from dt_onnx_inference_windows import _normalize_windows, _resolve_batch_size, _sliding_windows
+from waveform_assembly import CHANNELS, assemble_waveform
+
+
+def station_id(trace):
+    """台站标识 网络.台站.位置码"""
+    stats = trace.stats
+    return f"{stats.network}.{stats.station}.{stats.location}"
+
+
+def group_by_station(stream):
+    """
+    按台站分组，只保留 *HZ/*HN/*HE 三个通道齐全的台站
+
+    Args:
+        stream: 包含多个台站的ObsPy Stream对象
+
+    Returns:
+        (台站标识 -> Stream 的有序字典, 台站标识 -> 跳过原因 的字典)
+    """
+    from obspy import Stream
+
+    grouped = OrderedDict()
+    for trace in stream:
+        grouped.setdefault(station_id(trace), []).append(trace)
+
+    stations = OrderedDict()
+    skipped = {}
+    for sid, traces in grouped.items():
+        st = Stream(traces=traces)
+        missing = [ch for ch in CHANNELS if not st.select(channel=ch)]
+        if missing:
+            skipped[sid] = f"缺少通道: {', '.join(missing)}"
+            continue
+        stations[sid] = st
+    return stations, skipped
+
+
+def read_waveforms(filename, path):
+    """
+    读取上传的单个波形文件或压缩包 (.zip/.tar/.tar.gz)，压缩包内的每个文件分别解码
+
+    Args:
+        filename: 上传的文件名
+        path: 文件路径 (单个波形文件直接从路径解码，不整体读入内存)
+
+    Returns:
+        (合并后的Stream, 文件名 -> 读取失败原因 的字典)
+    """
+    import obspy
+
+    members = None
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            members = [(f"{filename}/{info.filename}", archive.read(info))
+                       for info in archive.infolist() if not info.is_dir()]
+    else:
+        try:
+            with tarfile.open(path) as archive:
+                members = [(f"{filename}/{info.name}", archive.extractfile(info).read())
+                           for info in archive.getmembers() if info.isfile()]
+        except tarfile.TarError:
+            pass
+
+    stream = obspy.Stream()
+    errors = {}
+    if members is None:
+        try:
+            stream += obspy.read(path)
+        except Exception as e:
+            errors[filename] = str(e)
+        return stream, errors
+    for name, content in members:
+        if os.path.basename(name).startswith('.'):
+            continue
+        try:
+            stream += obspy.read(io.BytesIO(content))
+        except Exception as e:
+            errors[name] = str(e)
+    return stream, errors
+
+
+class _StationState:
+    """单个台站的窗口和置信度累加状态"""
+
+    def __init__(self, stream, window_length, step_size):
+        self.stream = stream
+        waveform = assemble_waveform(stream)
+        data_len = waveform.shape[1]
+        if data_len < window_length:
+            # 与逐窗口推理一致: 先对实际数据归一化，再补零到窗口长度
+            self.num_windows = 1
+            total_length = window_length
+            window = np.zeros((1, 3, window_length), dtype=np.float32)
+            window[:, :, :data_len] = _normalize_windows(waveform[None])
+            self.windows = window
+            self.normalized = True
+        else:
+            self.num_windows = (data_len - window_length) // step_size + 1
+            total_length = data_len
+            self.windows = _sliding_windows(waveform, window_length, step_size, self.num_windows)
+            self.normalized = False
+        self.accumulator = ConfidenceAccumulator(total_length, window_length, step_size, self.num_windows)
+        self.confidence = np.zeros((1, 3, total_length), dtype=np.float32)
+
+    def add(self, output):
+        self.accumulator.add(output)
+
+    def flush(self):
+        offset, chunk = self.accumulator.flush()
+        self.confidence[0, :, offset:offset + chunk.shape[1]] = chunk
+
+
+def DiTing_predict_multi_station(session, stations, window_length=10000, step_size=3000, p_th=0.1, s_th=0.1,
+                                 det_th=0.50, batch_size=16, progress_callback=None, timings=None):
+    """
+    对多个台站进行批量推理，各台站的窗口共享推理批次
+
+    Args:
+        session: ONNX运行时会话对象
+        stations: 台站标识 -> 单台站Stream 的有序字典 (见group_by_station)
+        window_length: 窗口长度
+        step_size: 步长
+        p_th: P波检测阈值
+        s_th: S波检测阈值
+        det_th: 事件检测阈值
+        batch_size: 每次session.run处理的窗口数
+        progress_callback: 可选回调，每完成一批窗口调用 progress_callback(已完成窗口数, 窗口总数)
+        timings: 可选字典，累加各阶段耗时，同 DiTing_predict_onnx
+
+    Returns:
+        (台站标识 -> (events, confidence) 的有序字典, 台站标识 -> 跳过原因 的字典)，
+        events 和 confidence 的格式与 DiTing_predict_onnx 相同
+    """
+    print(f"--> 开始多台站预测: {len(stations)} 个台站")
+    t_begin = time.perf_counter()
+    if timings is None:
+        timings = {}
+    for stage in ('windows', 'session_run', 'accumulate', 'postprocess'):
+        timings.setdefault(stage, 0.0)
+    batch_size = _resolve_batch_size(session, batch_size)
+    engine = engine_pool.acquire(session, window_length, batch_size)
+
+    states = OrderedDict()
+    skipped = {}
+    for sid, stream in stations.items():
+        try:
+            states[sid] = _StationState(stream, window_length, step_size)
+        except (ValueError, IndexError) as e:
+            # 例如数据段无法重采样到模型采样率
+            skipped[sid] = f"无法组装三通道波形: {str(e)}"
+
+    # 所有台站的窗口依次排列，同一台站的窗口保持顺序以便累加器按序完成
+    queue = [(state, i) for state in states.values() for i in range(state.num_windows)]
+    num_windows = len(queue)
+    for b_start in range(0, num_windows, batch_size):
+        items = queue[b_start:b_start + batch_size]
+        t0 = time.perf_counter()
+        for k, (state, i) in enumerate(items):
+            if not state.normalized:
+                engine.load(k, state.windows[i])
+        engine.prepare(len(items))
+        # 短于一个窗口的台站已归一化并补零，直接覆盖输入缓冲区中对应的位置
+        for k, (state, i) in enumerate(items):
+            if state.normalized:
+                engine.input[k] = state.windows[i]
+
+        t1 = time.perf_counter()
+        output_np = engine.run(len(items))
+        t2 = time.perf_counter()
+        touched = []
+        for k, (state, _) in enumerate(items):
+            state.add(output_np[k])
+            if not touched or touched[-1] is not state:
+                touched.append(state)
+        for state in touched:
+            state.flush()
+        timings['windows'] += t1 - t0
+        timings['session_run'] += t2 - t1
+        timings['accumulate'] += time.perf_counter() - t2
+        if progress_callback is not None:
+            progress_callback(min(b_start + batch_size, num_windows), num_windows)
+    engine_pool.release(engine)
+
+    elapsed = time.perf_counter() - t_begin
+    print(f"推理完成: {len(states)} 个台站, {num_windows} 个窗口, 批大小 {batch_size}, 耗时 {elapsed:.3f} 秒, "
+          f"吞吐 {num_windows / max(elapsed, 1e-9):.1f} 窗口/秒")
+
+    results = OrderedDict()
+    t0 = time.perf_counter()
+    for sid, state in states.items():
+        confidence = state.confidence
+        events = postprocesser_ev_center(
+            yh1=confidence[0, 0, :], yh2=confidence[0, 1, :], yh3=confidence[0, 2, :],
+            p_th=p_th, s_th=s_th, det_th=det_th)
+        if len(events) == 0:
+            events = [[np.nan, [[np.nan, np.nan]], [[np.nan, np.nan]]]]
+        results[sid] = (events, confidence)
+    timings['postprocess'] += time.perf_counter() - t0
+    timings['num_windows'] = timings.get('num_windows', 0) + num_windows
+    return results, skipped
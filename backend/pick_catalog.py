@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+持久化的震相拾取目录
+
+每次分析得到的事件及其 P/S 震相按台站、绝对时间 (UTC时间戳) 和置信度保存在SQLite中，
+之后按时间范围、台站和置信度查询历史拾取，不必重新处理波形。
+
+    * events 表: 每个事件一行 (分析ID、来源、文件名、台站、事件时间)
+    * picks 表: 每个震相一行 (所属事件、台站、震相 P/S、到时、置信度)，
+      按 (time) 和 (station, time) 建索引
+
+查询按 (time, id) 排序并用游标分页 (从上一页最后一条之后继续)，
+不使用 OFFSET，翻到多深都只需沿索引读取一页的行，百万级拾取下也是毫秒级。
+SQLite的查询规划总是沿时间索引扫描，高阈值下符合条件的拾取很稀疏时要扫描整个索引，
+因此先用置信度索引估计数量，稀疏时改为从置信度索引取出再排序；按分析ID查询时从事件索引取出。
+同一分析ID和台站再次写入时替换原有记录，重复分析同一文件不会产生重复拾取。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import numpy as np
+
+# 查询返回的列
+PICK_COLUMNS = ('id', 'event_id', 'analysis_id', 'source', 'station', 'phase', 'time', 'confidence')
+# 置信度阈值以上的拾取少于此数时改用置信度索引 (取出后排序)，否则沿时间索引扫描
+SPARSE_CONFIDENCE_ROWS = 10000
+
+
+def encode_cursor(pick):
+    """由一页最后一条拾取生成下一页的游标"""
+    return f"{pick['time']!r}:{pick['id']}"
+
+
+def decode_cursor(cursor):
+    """
+    Raises:
+        ValueError: 游标格式错误
+    """
+    try:
+        t, pick_id = cursor.rsplit(':', 1)
+        return float(t), int(pick_id)
+    except (AttributeError, ValueError):
+        raise ValueError(f"无效的游标: {cursor!r}")
+
+
+class PickCatalog:
+    """
+    基于SQLite的震相拾取目录，多个工作进程可以共享同一个数据库文件
+    """
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            # WAL模式下写入不阻塞并发查询
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS events ('
+                         'id INTEGER PRIMARY KEY, analysis_id TEXT, source TEXT NOT NULL, filename TEXT, '
+                         'station TEXT NOT NULL, time REAL, created_at REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS picks ('
+                         'id INTEGER PRIMARY KEY, event_id INTEGER NOT NULL, station TEXT NOT NULL, '
+                         'phase TEXT NOT NULL, time REAL NOT NULL, confidence REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_events_analysis ON events (analysis_id, station)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_picks_time ON picks (time)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_picks_station_time ON picks (station, time)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_picks_event ON picks (event_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_picks_confidence ON picks (confidence)')
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def record(self, analysis_id, station, starttime, sampling_rate, events_matches, source='process',
+               filename=None):
+        """
+        保存一次分析中一个台站的事件和震相，替换同一分析ID和台站已有的记录
+
+        Args:
+            analysis_id: 分析ID (结果缓存键)
+            station: 台站标识 (network.station.location)
+            starttime: 第一个采样点的时间 (UTCDateTime或UTC时间戳)
+            sampling_rate: 采样率 (Hz)
+            events_matches: 后处理得到的事件，结构: [[bg, [[p_idx, p_prob]], [[s_idx, s_prob]]], ...]，
+                无事件时为 NaN 占位事件
+            source: 来源 (process/batch/stream/realtime)
+            filename: 源文件名
+
+        Returns:
+            保存的事件数
+        """
+        t0 = float(starttime)
+        events = []
+        for bg, candidate_Ps, candidate_Ss in events_matches:
+            p_idx, p_prob = candidate_Ps[0]
+            if np.isnan(p_idx):
+                continue
+            s_idx, s_prob = candidate_Ss[0]
+            picks = [('P', t0 + p_idx / sampling_rate, float(p_prob))]
+            if not np.isnan(s_idx):
+                picks.append(('S', t0 + s_idx / sampling_rate, float(s_prob)))
+            events.append((None if np.isnan(bg) else t0 + bg / sampling_rate, picks))
+
+        with self._lock, closing(self._connect()) as conn, conn:
+            if analysis_id is not None:
+                conn.execute('DELETE FROM picks WHERE event_id IN '
+                             '(SELECT id FROM events WHERE analysis_id = ? AND station = ?)', (analysis_id, station))
+                conn.execute('DELETE FROM events WHERE analysis_id = ? AND station = ?', (analysis_id, station))
+            self._insert(conn, analysis_id, source, filename, station, events)
+        return len(events)
+
+    def record_picks(self, picks, source='realtime'):
+        """
+        保存实时拾取等已换算为绝对时间的震相 (每个字典为一个事件)
+
+        Args:
+            picks: 字典列表，含 station、p_arrival_utc、p_confidence，可选 s_arrival_utc、s_confidence
+                (时间为ISO 8601字符串、UTCDateTime或UTC时间戳)
+            source: 来源
+        """
+        from obspy import UTCDateTime
+
+        def timestamp(value):
+            return float(value) if isinstance(value, (int, float)) else UTCDateTime(value).timestamp
+
+        with self._lock, closing(self._connect()) as conn, conn:
+            for pick in picks:
+                phases = [('P', timestamp(pick['p_arrival_utc']), float(pick['p_confidence']))]
+                if pick.get('s_arrival_utc') is not None:
+                    phases.append(('S', timestamp(pick['s_arrival_utc']), float(pick['s_confidence'])))
+                self._insert(conn, None, source, None, pick['station'], [(phases[0][1], phases)])
+
+    @staticmethod
+    def _insert(conn, analysis_id, source, filename, station, events):
+        now = time.time()
+        for event_time, picks in events:
+            event_id = conn.execute('INSERT INTO events (analysis_id, source, filename, station, time, created_at) '
+                                    'VALUES (?, ?, ?, ?, ?, ?)',
+                                    (analysis_id, source, filename, station, event_time, now)).lastrowid
+            conn.executemany('INSERT INTO picks (event_id, station, phase, time, confidence) VALUES (?, ?, ?, ?, ?)',
+                             [(event_id, station, phase, t, confidence) for phase, t, confidence in picks])
+
+    @staticmethod
+    def _where(stations=None, starttime=None, endtime=None, phase=None, min_confidence=None, analysis_id=None,
+               after=None):
+        clauses, params = [], []
+        if stations:
+            clauses.append(f"p.station IN ({', '.join('?' * len(stations))})")
+            params.extend(stations)
+        if starttime is not None:
+            clauses.append('p.time >= ?')
+            params.append(starttime)
+        if endtime is not None:
+            clauses.append('p.time <= ?')
+            params.append(endtime)
+        if phase is not None:
+            clauses.append('p.phase = ?')
+            params.append(phase)
+        if min_confidence is not None:
+            clauses.append('p.confidence >= ?')
+            params.append(min_confidence)
+        if analysis_id is not None:
+            clauses.append('p.event_id IN (SELECT id FROM events WHERE analysis_id = ?)')
+            params.append(analysis_id)
+        if after is not None:
+            clauses.append('(p.time, p.id) > (?, ?)')
+            params.extend(after)
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ''), params
+
+    _SELECT = ('SELECT p.id, p.event_id, e.analysis_id, e.source, p.station, p.phase, p.time, p.confidence '
+               'FROM picks p {index} JOIN events e ON e.id = p.event_id')
+
+    @staticmethod
+    def _choose_index(conn, analysis_id=None, min_confidence=None, **_):
+        """选择驱动查询的索引 (见模块说明)，返回 INDEXED BY 子句或空字符串"""
+        if analysis_id is not None:
+            return 'INDEXED BY idx_picks_event'
+        if min_confidence is not None:
+            rows = conn.execute('SELECT COUNT(*) FROM (SELECT 1 FROM picks INDEXED BY idx_picks_confidence '
+                                'WHERE confidence >= ? LIMIT ?)', (min_confidence, SPARSE_CONFIDENCE_ROWS)).fetchone()[0]
+            if rows < SPARSE_CONFIDENCE_ROWS:
+                return 'INDEXED BY idx_picks_confidence'
+        return ''
+
+    def query(self, limit=100, cursor=None, **filters):
+        """
+        按时间顺序查询一页拾取
+
+        Args:
+            limit: 每页条数
+            cursor: 上一页返回的游标，None表示第一页
+            **filters: stations (台站标识列表)、starttime/endtime (UTC时间戳)、phase ('P'/'S')、
+                min_confidence、analysis_id
+
+        Returns:
+            (拾取字典列表, 下一页的游标，已是最后一页时为None)
+
+        Raises:
+            ValueError: 游标格式错误
+        """
+        after = decode_cursor(cursor) if cursor is not None else None
+        where, params = self._where(after=after, **filters)
+        with closing(self._connect()) as conn, conn:
+            select = self._SELECT.format(index=self._choose_index(conn, **filters))
+            rows = conn.execute(f'{select} {where} ORDER BY p.time, p.id LIMIT ?',
+                                params + [int(limit) + 1]).fetchall()
+        picks = [dict(zip(PICK_COLUMNS, row)) for row in rows[:limit]]
+        next_cursor = encode_cursor(picks[-1]) if len(rows) > limit else None
+        return picks, next_cursor
+
+    def iter_picks(self, batch_size=10000, **filters):
+        """
+        按时间顺序遍历所有符合条件的拾取 (批量导出)，每次从数据库读取 batch_size 条
+
+        Yields:
+            拾取字典
+        """
+        where, params = self._where(**filters)
+        conn = self._connect()
+        try:
+            select = self._SELECT.format(index=self._choose_index(conn, **filters))
+            rows = conn.execute(f'{select} {where} ORDER BY p.time, p.id', params)
+            while True:
+                batch = rows.fetchmany(batch_size)
+                if not batch:
+                    break
+                for row in batch:
+                    yield dict(zip(PICK_COLUMNS, row))
+        finally:
+            conn.close()
+
+    def count(self, **filters):
+        """符合条件的拾取数"""
+        where, params = self._where(**filters)
+        with closing(self._connect()) as conn, conn:
+            return conn.execute(f'SELECT COUNT(*) FROM picks p {where}', params).fetchone()[0]
+
+    def stats(self):
+        """事件数、拾取数、台站数和时间范围"""
+        with closing(self._connect()) as conn, conn:
+            events = conn.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+            picks, first, last = conn.execute('SELECT COUNT(*), MIN(time), MAX(time) FROM picks').fetchone()
+            stations = conn.execute('SELECT COUNT(DISTINCT station) FROM picks').fetchone()[0]
+        return {'events': events, 'picks': picks, 'stations': stations, 'first_time': first, 'last_time': last}
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+结果图像及其绘图数据的存储
+
+/process 为每个结果图像保存截取并滤波后的事件片段 (.npz)，图像在请求时 (或后台) 才绘制，
+?dpi= 请求的其他分辨率另存为 <名称>_<dpi>dpi.png。同一结果图像的事件片段和各分辨率图像
+作为一个条目计算大小、一起淘汰，存储方式见 lru_store.LruFileStore。
+"""
+
+import os
+import re
+import time
+
+from lru_store import LruFileStore
+
+
+def event_slice_path(store_dir, plot_filename):
+    """结果图像对应的事件片段的保存路径"""
+    return os.path.join(store_dir, os.path.splitext(os.path.basename(plot_filename))[0] + '.npz')
+
+
+class PlotStore(LruFileStore):
+    """
+    有大小上限、LRU淘汰、可持久化的结果图像存储
+    """
+
+    table = 'plots'
+    columns = 'plot_filename TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL'
+    key_columns = ('plot_filename',)
+
+    def __init__(self, store_dir, pictures_dir, max_bytes=1024 * 1024 * 1024):
+        """
+        Args:
+            store_dir: 事件片段和索引的存储目录
+            pictures_dir: 结果图像目录
+            max_bytes: 总大小上限 (字节)
+        """
+        self.pictures_dir = pictures_dir
+        super().__init__(store_dir, max_bytes)
+
+    def _paths(self, plot_filename):
+        plot_filename = os.path.basename(plot_filename)
+        variant = re.compile(re.escape(os.path.splitext(plot_filename)[0]) + r'_\d+dpi\.png')
+        try:
+            variants = sorted(name for name in os.listdir(self.pictures_dir) if variant.fullmatch(name))
+        except OSError:
+            variants = []
+        return ([event_slice_path(self.store_dir, plot_filename), os.path.join(self.pictures_dir, plot_filename)]
+                + [os.path.join(self.pictures_dir, name) for name in variants])
+
+    def add(self, plot_filename):
+        """
+        登记 (或在绘制了新的分辨率后更新) 一个结果图像，超过大小上限时淘汰最久未使用的条目
+
+        Args:
+            plot_filename: 默认分辨率的图像文件名
+        """
+        size = sum(os.path.getsize(path) for path in self._paths(plot_filename) if os.path.exists(path))
+        self._insert([{'plot_filename': plot_filename, 'size': size}], keep=plot_filename)
+
+    def touch(self, plot_filename):
+        """更新结果图像的最近访问时间"""
+        with self._lock, self._transaction() as conn:
+            conn.execute(f'UPDATE {self.table} SET last_access = ? WHERE plot_filename = ?',
+                         (time.time(), plot_filename))
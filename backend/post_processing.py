@@ -1,6 +1,65 @@
-from obspy.signal.trigger import trigger_onset
 import numpy as np
 
+# obspy.signal (连带 scipy) 和 numba 的导入都较慢，推迟到第一次后处理时进行
+_mpd_filter_impl = None
+
+
+def _mpd_filter_py(x, ind, order, mpd, kpsh):
+    """
+    按峰值高度从高到低依次保留峰值，并删除其左右mpd范围内的其他峰值
+
+    ind按位置升序排列，order为按高度降序的处理顺序 (高度相同时位置靠后的在前)，
+    每个峰值的删除范围用searchsorted确定，只需O(n log n)。
+    """
+    idel = np.zeros(ind.size, dtype=np.bool_)
+    for k in range(order.size):
+        i = order[k]
+        if idel[i]:
+            continue
+        lo = np.searchsorted(ind, ind[i] - mpd, side='left')
+        hi = np.searchsorted(ind, ind[i] + mpd, side='right')
+        if kpsh:
+            # keep peaks with the same height if kpsh is True
+            idel[lo:hi] |= x[ind[i]] > x[ind[lo:hi]]
+        else:
+            idel[lo:hi] = True
+        idel[i] = False  # Keep current peak
+    return idel
+
+
+def mpd_filter_backend():
+    """
+    返回 mpd 过滤使用的实现: 'numba' 或 'numpy'
+
+    第一次调用时导入 numba 并编译 (cache=True，编译结果缓存在 __pycache__ 中)；
+    numba 为可选依赖，没有时使用纯 NumPy 实现。
+    """
+    global _mpd_filter_impl
+    if _mpd_filter_impl is None:
+        try:
+            from numba import njit
+            _mpd_filter_impl = njit(cache=True)(_mpd_filter_py)
+        except ImportError:
+            _mpd_filter_impl = _mpd_filter_py
+    return 'numpy' if _mpd_filter_impl is _mpd_filter_py else 'numba'
+
+
+def _mpd_filter(x, ind, order, mpd, kpsh):
+    if _mpd_filter_impl is None:
+        mpd_filter_backend()
+    return _mpd_filter_impl(x, ind, order, mpd, kpsh)
+
+
+def warm_up():
+    """
+    用一段很短的合成置信度运行一次后处理，完成 trigger_onset 的导入和 mpd 过滤的编译，
+    避免由第一个请求承担这部分开销
+    """
+    x = np.zeros(200)
+    x[[20, 25, 100, 160]] = [0.6, 0.9, 0.8, 0.7]
+    postprocesser_ev_center(x, x, x, det_th=0.5, p_th=0.5, s_th=0.5)
+
+
 def _detect_peaks(x, mph=None, mpd=1, threshold=0, edge='rising', kpsh=False, valley=False):
 
     """
@@ -58,7 +117,10 @@ def _detect_peaks(x, mph=None, mpd=1, threshold=0, edge='rising', kpsh=False, va
             ire = np.where((np.hstack((dx, 0)) <= 0) & (np.hstack((0, dx)) > 0))[0]
         if edge.lower() in ['falling', 'both']:
             ife = np.where((np.hstack((dx, 0)) < 0) & (np.hstack((0, dx)) >= 0))[0]
-    ind = np.unique(np.hstack((ine, ire, ife)))
+    # 各部分均已有序，排序后去重即可 (比np.unique的哈希去重快)
+    ind = np.sort(np.hstack((ine, ire, ife)))
+    if ind.size:
+        ind = ind[np.hstack((True, ind[1:] != ind[:-1]))]
     # handle NaN's
     if ind.size and indnan.size:
         # NaN's and values close to NaN's cannot be peaks
@@ -77,16 +139,12 @@ def _detect_peaks(x, mph=None, mpd=1, threshold=0, edge='rising', kpsh=False, va
         ind = np.delete(ind, np.where(dx < threshold)[0])
     # detect small peaks closer than minimum peak distance
     if ind.size and mpd > 1:
-        ind = ind[np.argsort(x[ind])][::-1]  # sort ind by peak height
-        idel = np.zeros(ind.size, dtype=bool)
-        for i in range(ind.size):
-            if not idel[i]:
-                # keep peaks with the same height if kpsh is True
-                idel = idel | (ind >= ind[i] - mpd) & (ind <= ind[i] + mpd) \
-                    & (x[ind[i]] > x[ind] if kpsh else True)
-                idel[i] = 0  # Keep current peak
-        # remove the small peaks and sort back the indices by their occurrence
-        ind = np.sort(ind[~idel])
+        # sort ind by peak height; 稳定排序使等高峰值的处理顺序只取决于位置，
+        # 对截取的一段 (流式处理) 和整条记录的结果相同
+        order = np.argsort(x[ind], kind='stable')[::-1]
+        idel = _mpd_filter(x, ind, np.ascontiguousarray(order), mpd, kpsh)
+        # remove the small peaks (ind is already sorted by occurrence)
+        ind = ind[~idel]
 
     return ind
 
@@ -97,32 +155,25 @@ def postprocesser_ev_center(yh1, yh2, yh3, det_th=0.3, p_th=0.3, p_mpd=10, s_th=
     """ 
     modified from https://github.com/smousavi05/EQTransformer
     Postprocessing to detection and phase picking
+
+    P/S picks are kept as sorted arrays and matched to each detection with
+    searchsorted instead of scanning every pick for every event.
     """         
+    from obspy.signal.trigger import trigger_onset
              
     detection = trigger_onset(yh1, det_th, det_th)
     pp_arr = _detect_peaks(yh2, mph=p_th, mpd=p_mpd)
     ss_arr = _detect_peaks(yh3, mph=s_th, mpd=s_mpd)
-          
-    P_PICKS = {}
-    S_PICKS = {}
+
+    # picks at sample 0 are ignored, as in the original dict-based version
+    pp_arr = pp_arr[pp_arr != 0]
+    ss_arr = ss_arr[ss_arr != 0]
+    p_probs = np.round(yh2[pp_arr], 3)
+    s_probs = np.round(yh3[ss_arr], 3)
+
     EVENTS = {}
     matches = list()
 
-    # P
-    if len(pp_arr) > 0:
-        for pick in range(len(pp_arr)): 
-            pauto = pp_arr[pick]
-            if pauto: 
-                P_prob = np.round(yh2[int(pauto)], 3) 
-                P_PICKS.update({pauto : [P_prob]})                 
-    # S         
-    if len(ss_arr) > 0:            
-        for pick in range(len(ss_arr)):        
-            sauto = ss_arr[pick]
-            if sauto: 
-                S_prob = np.round(yh3[int(sauto)], 3) 
-                S_PICKS.update({sauto : [S_prob]})             
-            
     if len(detection) > 0:
         # merge close detections
         for ev in range(1,len(detection)):
@@ -131,50 +182,30 @@ def postprocesser_ev_center(yh1, yh2, yh3, det_th=0.3, p_th=0.3, p_mpd=10, s_th=
                 detection[ev][0] = -1
                 detection[ev][1] = -1
 
-        for ev in range(len(detection)):                                 
-            D_prob = np.mean(yh1[detection[ev][0]:detection[ev][1]])
-            D_prob = np.round(D_prob, 3)
-            EVENTS.update({ detection[ev][0] : [D_prob, detection[ev][1]]})            
+        for ev in range(len(detection)):
+            EVENTS.update({ detection[ev][0] : detection[ev][1]})
     
     # matching the detection and picks
-    for ev in EVENTS:
-        bg = ev
-        ed = EVENTS[ev][1]
-
+    for bg, ed in EVENTS.items():
         if int(ed-bg) >= ev_tolerance:
-            candidate_Ps = list()
-            for Ps, P_val in P_PICKS.items():
-                if Ps > bg - p_tolerance and Ps < bg + p_tolerance:
-                    candidate_Ps.append([Ps, P_val[0]])
-            
-            candidate_Ss = list()
-            for Ss, S_val in S_PICKS.items():
-                if Ss > bg and Ss < ed:
-                    candidate_Ss.append([Ss, S_val[0]])
-            
-
-            if len(candidate_Ps) == 0:
+            # P picks in (bg - p_tolerance, bg + p_tolerance)
+            lo = np.searchsorted(pp_arr, bg - p_tolerance, side='right')
+            hi = np.searchsorted(pp_arr, bg + p_tolerance, side='left')
+            if hi <= lo:
                 continue
+            #keep the max prob P pick (first one on ties)
+            k = lo + np.argmax(p_probs[lo:hi])
+            candidate_Ps = [[pp_arr[k], p_probs[k]]]
+
+            # S picks in (bg, ed)
+            lo = np.searchsorted(ss_arr, bg, side='right')
+            hi = np.searchsorted(ss_arr, ed, side='left')
+            if hi <= lo:
+                candidate_Ss = [[np.nan, np.nan]]
             else:
-                #keep the max prob P pick
-                max_prob = -10
-                for Ps, P_val in candidate_Ps:
-                    if P_val > max_prob:
-                        max_prob = P_val
-                candidate_Ps = [[Ps, P_val] for Ps, P_val in candidate_Ps if P_val == max_prob]
-                candidate_Ps = [candidate_Ps[0]]
-
-            if len(candidate_Ss) == 0:
-                candidate_Ss.append([np.nan, np.nan])
-            else:
-                #keep the max prob S pick
-                max_prob = -10
-                for Ss, S_val in candidate_Ss:
-                    if S_val > max_prob:
-                        max_prob = S_val
-                candidate_Ss = [[Ss, S_val] for Ss, S_val in candidate_Ss if S_val == max_prob]
-                candidate_Ss = [candidate_Ss[0]]
-                
-            if len(candidate_Ps) != 0 and len(candidate_Ss) != 0:
-                matches.append([bg, candidate_Ps, candidate_Ss])
-    return matches  
+                #keep the max prob S pick (first one on ties)
+                k = lo + np.argmax(s_probs[lo:hi])
+                candidate_Ss = [[ss_arr[k], s_probs[k]]]
+
+            matches.append([bg, candidate_Ps, candidate_Ss])
+    return matches
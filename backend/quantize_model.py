@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DiTing 模型的 INT8 量化与精度/速度评估
+
+模型变体与文件名的对应关系 (与FP32模型在同一目录):
+
+    fp32          DiTing0.1B_v15.onnx
+    int8-dynamic  DiTing0.1B_v15.int8-dynamic.onnx   动态量化: 权重离线量化为INT8，激活值在运行时量化
+    int8-static   DiTing0.1B_v15.int8-static.onnx    静态量化: 激活值的量化参数由示例波形校准，QDQ格式
+
+app.py 通过环境变量 DITING_MODEL_VARIANT 选择变体 (默认 fp32)。
+动态量化的卷积使用 ConvInteger 算子，在CPU上可能比FP32更慢，卷积网络一般应选择静态量化，
+是否可用于生产以 evaluate 的结果为准。
+
+evaluate 子命令在示例波形 (和可选的合成长记录) 上分别用FP32模型和变体推理，报告:
+    - 推理耗时和加速比 (DiTing_predict_onnx 端到端，取最短耗时)
+    - 置信度曲线的最大/平均绝对误差
+    - 按P波到时匹配的事件: 漏检 (FP32有、变体没有)、多检 (变体有、FP32没有)，
+      匹配事件的P/S到时偏差 (采样点)，以及S波拾取的缺失/新增
+
+用法:
+    python quantize_model.py quantize --mode dynamic
+    python quantize_model.py quantize --mode static --calibration ../resources/example_waveforms/*.mseed
+    python quantize_model.py evaluate --variant int8-dynamic --output quant_report.json
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+from dt_onnx_inference_windows import load_onnx_model, DiTing_predict_onnx, _normalize_windows, _sliding_windows
+from waveform_assembly import assemble_waveform
+
+MODEL_VARIANTS = ('fp32', 'int8-dynamic', 'int8-static')
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+default_model_path = os.path.join(base_dir, 'DiTing0.1B_v15.onnx')
+example_dir = os.path.join(os.path.dirname(base_dir), 'resources', 'example_waveforms')
+
+INFERENCE_PARAMS = dict(window_length=10000, step_size=3000, p_th=0.1, s_th=0.1, det_th=0.3)
+
+
+def model_variant_path(model_path, variant):
+    """
+    模型变体的文件路径
+
+    Args:
+        model_path: FP32模型路径
+        variant: MODEL_VARIANTS 之一
+
+    Returns:
+        变体模型路径
+
+    Raises:
+        ValueError: 未知的变体
+    """
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"未知的模型变体: {variant}，可选 {', '.join(MODEL_VARIANTS)}")
+    if variant == 'fp32':
+        return model_path
+    stem, ext = os.path.splitext(model_path)
+    return f"{stem}.{variant}{ext}"
+
+
+def calibration_windows(paths, window_length=10000, step_size=3000, max_windows=256, seed=0):
+    """
+    从波形文件中取出归一化后的窗口，用于静态量化的校准
+
+    Args:
+        paths: 波形文件路径列表
+        window_length: 窗口长度
+        step_size: 步长
+        max_windows: 最多使用的窗口数，超过时随机抽取
+        seed: 随机种子
+
+    Returns:
+        float32数组，形状为[n, 3, window_length]
+    """
+    import obspy
+
+    windows = []
+    for path in paths:
+        stream = obspy.read(path)
+        waveform = assemble_waveform(stream)
+        if waveform.shape[1] < window_length:
+            continue
+        num_windows = (waveform.shape[1] - window_length) // step_size + 1
+        windows.append(_normalize_windows(_sliding_windows(waveform, window_length, step_size, num_windows)))
+    if not windows:
+        raise ValueError("没有长度足够一个窗口的校准波形")
+    windows = np.concatenate(windows)
+    if len(windows) > max_windows:
+        rng = np.random.default_rng(seed)
+        windows = windows[np.sort(rng.choice(len(windows), max_windows, replace=False))]
+    return windows
+
+
+def quantize(model_path, mode, output_path=None, calibration_paths=None, max_windows=256,
+             calibrate_method='minmax', per_channel=True):
+    """
+    生成INT8量化模型
+
+    Args:
+        model_path: FP32模型路径
+        mode: 'dynamic' 或 'static'
+        output_path: 输出路径，默认为对应变体的路径 (见model_variant_path)
+        calibration_paths: 静态量化的校准波形文件，默认使用示例波形
+        max_windows: 校准使用的最多窗口数
+        calibrate_method: 静态量化的校准方法: minmax、entropy 或 percentile
+        per_channel: 权重是否按输出通道量化
+
+    Returns:
+        输出路径
+    """
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    output_path = output_path or model_variant_path(model_path, f'int8-{mode}')
+    # 先做形状推断和图优化，量化工具依赖完整的形状信息
+    # (DiTing 是卷积网络，ONNX 自带的形状推断即可，不需要依赖 sympy 的符号形状推断)
+    prepared_path = f"{output_path}.prep.onnx"
+    quant_pre_process(model_path, prepared_path, skip_symbolic_shape=True)
+    try:
+        if mode == 'dynamic':
+            quantize_dynamic(prepared_path, output_path, per_channel=per_channel, weight_type=QuantType.QInt8)
+        elif mode == 'static':
+            windows = calibration_windows(calibration_paths or sorted(glob.glob(os.path.join(example_dir, '*.mseed'))),
+                                          INFERENCE_PARAMS['window_length'], INFERENCE_PARAMS['step_size'],
+                                          max_windows)
+            print(f"--> 使用 {len(windows)} 个窗口校准")
+            input_name = load_onnx_model(prepared_path).get_inputs()[0].name
+
+            class WindowReader(CalibrationDataReader):
+                def __init__(self):
+                    self._iter = iter(windows)
+
+                def get_next(self):
+                    window = next(self._iter, None)
+                    return None if window is None else {input_name: window[None]}
+
+            methods = {'minmax': CalibrationMethod.MinMax, 'entropy': CalibrationMethod.Entropy,
+                       'percentile': CalibrationMethod.Percentile}
+            quantize_static(prepared_path, output_path, WindowReader(), quant_format=QuantFormat.QDQ,
+                            per_channel=per_channel, activation_type=QuantType.QUInt8,
+                            weight_type=QuantType.QInt8, calibrate_method=methods[calibrate_method])
+        else:
+            raise ValueError(f"未知的量化方式: {mode}")
+    finally:
+        if os.path.exists(prepared_path):
+            os.remove(prepared_path)
+    return output_path
+
+
+def _valid_events(events):
+    """去掉没有事件时的NaN占位，返回 [(P采样点, S采样点或NaN)] (按P排序)"""
+    picks = [(float(ev[1][0][0]), float(ev[2][0][0])) for ev in events if not np.isnan(ev[1][0][0])]
+    return sorted(picks)
+
+
+def compare_events(reference, candidate, tolerance):
+    """
+    按P波到时匹配两组事件
+
+    Args:
+        reference: FP32模型的事件 (postprocesser_ev_center的返回值)
+        candidate: 变体模型的事件
+        tolerance: P波到时相差不超过该采样点数视为同一事件
+
+    Returns:
+        统计字典
+    """
+    ref = _valid_events(reference)
+    cand = _valid_events(candidate)
+    # 所有候选配对按P到时偏差从小到大贪心匹配，每个事件只匹配一次
+    pairs = sorted((abs(c[0] - r[0]), i, j) for i, r in enumerate(ref) for j, c in enumerate(cand)
+                   if abs(c[0] - r[0]) <= tolerance)
+    used_ref, used_cand, matched = set(), set(), []
+    for _, i, j in pairs:
+        if i not in used_ref and j not in used_cand:
+            used_ref.add(i)
+            used_cand.add(j)
+            matched.append((ref[i], cand[j]))
+
+    p_offsets = np.array([c[0] - r[0] for r, c in matched])
+    s_pairs = [(r[1], c[1]) for r, c in matched]
+    s_offsets = np.array([c - r for r, c in s_pairs if not np.isnan(r) and not np.isnan(c)])
+
+    def offset_stats(offsets):
+        if offsets.size == 0:
+            return {'count': 0}
+        return {'count': int(offsets.size), 'mean_abs': float(np.mean(np.abs(offsets))),
+                'median_abs': float(np.median(np.abs(offsets))), 'max_abs': float(np.max(np.abs(offsets))),
+                'exact': int(np.sum(offsets == 0))}
+
+    return {
+        'reference_events': len(ref),
+        'candidate_events': len(cand),
+        'matched': len(matched),
+        'missed': len(ref) - len(matched),
+        'extra': len(cand) - len(matched),
+        'p_offset': offset_stats(p_offsets),
+        's_offset': offset_stats(s_offsets),
+        's_missed': sum(1 for r, c in s_pairs if not np.isnan(r) and np.isnan(c)),
+        's_extra': sum(1 for r, c in s_pairs if np.isnan(r) and not np.isnan(c)),
+    }
+
+
+def _timed_predict(session, stream, batch_size, repeat):
+    """重复推理，返回 (最短耗时, 事件, 置信度)"""
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            events, confidence = DiTing_predict_onnx(session, stream, **INFERENCE_PARAMS, batch_size=batch_size)
+            best = min(best, time.perf_counter() - t0)
+    return best, events, confidence
+
+
+def evaluate(reference_path, variant_path, records, batch_size=16, repeat=3, tolerance=100):
+    """
+    对比FP32模型和变体模型
+
+    Args:
+        reference_path: FP32模型路径
+        variant_path: 变体模型路径
+        records: [(名称, ObsPy Stream)]
+        batch_size: 批大小
+        repeat: 计时重复次数
+        tolerance: 事件匹配的P波到时容差 (采样点)
+
+    Returns:
+        报告字典
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        reference = load_onnx_model(reference_path)
+        variant = load_onnx_model(variant_path)
+    rows = []
+    for name, stream in records:
+        ref_time, ref_events, ref_conf = _timed_predict(reference, stream, batch_size, repeat)
+        var_time, var_events, var_conf = _timed_predict(variant, stream, batch_size, repeat)
+        diff = np.abs(ref_conf - var_conf)
+        rows.append(dict(compare_events(ref_events, var_events, tolerance), record=name,
+                         samples=int(stream[0].stats.npts), reference_seconds=ref_time, variant_seconds=var_time,
+                         speedup=ref_time / var_time if var_time > 0 else 0.0,
+                         confidence_max_abs_diff=float(diff.max()),
+                         confidence_mean_abs_diff=float(diff.mean())))
+
+    total = {key: sum(r[key] for r in rows) for key in
+             ('reference_events', 'candidate_events', 'matched', 'missed', 'extra', 's_missed', 's_extra')}
+    total['speedup'] = sum(r['reference_seconds'] for r in rows) / max(sum(r['variant_seconds'] for r in rows), 1e-12)
+    total['p_offset_max_abs'] = max((r['p_offset'].get('max_abs', 0.0) for r in rows), default=0.0)
+    total['s_offset_max_abs'] = max((r['s_offset'].get('max_abs', 0.0) for r in rows), default=0.0)
+    return {'reference_model': os.path.basename(reference_path), 'variant_model': os.path.basename(variant_path),
+            'batch_size': batch_size, 'match_tolerance_samples': tolerance, 'records': rows, 'total': total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DiTing 模型 INT8 量化与评估')
+    parser.add_argument('--model', default=default_model_path, help='FP32模型路径')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    q = sub.add_parser('quantize', help='生成INT8量化模型')
+    q.add_argument('--mode', choices=['dynamic', 'static'], default='dynamic', help='量化方式')
+    q.add_argument('--output', default=None, help='输出路径，默认按变体命名保存在FP32模型旁边')
+    q.add_argument('--calibration', nargs='*', default=None, help='静态量化的校准波形文件，默认使用示例波形')
+    q.add_argument('--calibration-windows', type=int, default=256, help='校准使用的最多窗口数')
+    q.add_argument('--calibrate-method', choices=['minmax', 'entropy', 'percentile'], default='minmax',
+                   help='静态量化的校准方法')
+    q.add_argument('--per-tensor', action='store_true', help='权重按整个张量量化 (默认按输出通道)')
+
+    e = sub.add_parser('evaluate', help='对比变体与FP32模型的速度和拾取结果')
+    e.add_argument('--variant', default='int8-dynamic', help='变体名称 (见MODEL_VARIANTS) 或模型文件路径')
+    e.add_argument('--waveforms', nargs='*', default=None, help='评估用的波形文件，默认使用示例波形')
+    e.add_argument('--synthetic-seconds', type=float, nargs='*', default=[3600],
+                   help='另外评估的合成长记录时长 (秒)，见 benchmark.synthetic_record')
+    e.add_argument('--batch-size', type=int, default=16, help='批大小')
+    e.add_argument('--repeat', type=int, default=3, help='计时重复次数')
+    e.add_argument('--tolerance', type=int, default=100, help='事件匹配的P波到时容差 (采样点)')
+    e.add_argument('--output', default=None, help='将报告以JSON保存到该文件')
+    args = parser.parse_args()
+
+    if args.command == 'quantize':
+        output = quantize(args.model, args.mode, args.output, args.calibration, args.calibration_windows,
+                          args.calibrate_method, per_channel=not args.per_tensor)
+        print(f"量化模型已保存至: {output}")
+        return
+
+    import obspy
+    from benchmark import synthetic_record
+
+    variant_path = model_variant_path(args.model, args.variant) if args.variant in MODEL_VARIANTS else args.variant
+    paths = args.waveforms or sorted(glob.glob(os.path.join(example_dir, '*.mseed')))
+    records = [(os.path.basename(path), obspy.read(path)) for path in paths]
+    records += [(f'synthetic_{int(seconds)}s', synthetic_record(seconds)) for seconds in args.synthetic_seconds]
+    report = evaluate(args.model, variant_path, records, args.batch_size, args.repeat, args.tolerance)
+
+    print(f"--> {report['variant_model']} 对比 {report['reference_model']} (P到时容差 {args.tolerance} 个采样点)")
+    for r in report['records']:
+        print(f"    {r['record']:34s} 加速 {r['speedup']:5.2f}x  事件 {r['reference_events']:4d} -> "
+              f"{r['candidate_events']:4d}  漏检 {r['missed']:3d}  多检 {r['extra']:3d}  "
+              f"P偏差 最大 {r['p_offset'].get('max_abs', 0):5.0f}  S偏差 最大 {r['s_offset'].get('max_abs', 0):5.0f}  "
+              f"置信度最大误差 {r['confidence_max_abs_diff']:.4f}")
+    t = report['total']
+    print(f"    合计: 加速 {t['speedup']:.2f}x, 匹配 {t['matched']}/{t['reference_events']}, 漏检 {t['missed']}, "
+          f"多检 {t['extra']}, S缺失 {t['s_missed']}, S新增 {t['s_extra']}, "
+          f"P偏差最大 {t['p_offset_max_abs']:.0f}, S偏差最大 {t['s_offset_max_abs']:.0f} 个采样点")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存至: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
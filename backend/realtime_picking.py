@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+实时连续拾取
+
+从本地数据源 (TCP 或不断追加的文件) 接收波形数据包，每个台站的每个通道
+写入环形缓冲区，三个通道都到齐的采样点交给该台站的 StreamingPicker。
+StreamingPicker 只对新数据补齐的窗口做推理，已处理的数据不会重复计算；
+事件确定后立即发布，并记录从采样点到达到震相发布的延迟。
+
+数据包格式 (小端序)::
+
+    uint32 头部JSON的字节数 n
+    n 字节 UTF-8 JSON: {"station": "NET.STA.LOC", "channel": "BHZ",
+                         "starttime": "ISO8601", "sampling_rate": 100.0, "npts": m}
+    m 个 float32 采样值
+
+用法 (离线测试):
+    # 以10倍速把波形文件按1秒一包发送到TCP端口
+    python realtime_picking.py replay --file ../resources/example_waveforms/demo_test_2.mseed --port 18000 --speed 10
+    # 连接数据源并实时拾取
+    python realtime_picking.py pick --tcp 127.0.0.1:18000
+    # 或者使用文件作为数据源
+    python realtime_picking.py replay --file ... --output /tmp/feed.bin
+    python realtime_picking.py pick --tail /tmp/feed.bin
+"""
+
+import argparse
+import bisect
+import fnmatch
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from dt_onnx_inference_windows import _resolve_batch_size
+from inference_engine import InferenceEngine
+from streaming_inference import CHANNELS, StreamingPicker
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct('<I')
+
+
+def encode_packet(station, channel, starttime, sampling_rate, data):
+    """将单个通道的一段波形编码为数据包"""
+    import obspy
+
+    data = np.asarray(data, dtype='<f4')
+    header = json.dumps({
+        'station': station,
+        'channel': channel,
+        'starttime': obspy.UTCDateTime(starttime).isoformat(),
+        'sampling_rate': float(sampling_rate),
+        'npts': int(data.size),
+    }).encode('utf-8')
+    return _LENGTH.pack(len(header)) + header + data.tobytes()
+
+
+class PacketDecoder:
+    """从字节流中逐个解析数据包，数据可以分多次到达"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Args:
+            data: 新到达的字节
+
+        Returns:
+            已完整到达的数据包列表，每个数据包为 (头部字典, float32数组)
+        """
+        self._buffer += data
+        packets = []
+        while len(self._buffer) >= _LENGTH.size:
+            header_len = _LENGTH.unpack_from(self._buffer, 0)[0]
+            header_end = _LENGTH.size + header_len
+            if len(self._buffer) < header_end:
+                break
+            header = json.loads(bytes(self._buffer[_LENGTH.size:header_end]).decode('utf-8'))
+            packet_end = header_end + 4 * header['npts']
+            if len(self._buffer) < packet_end:
+                break
+            data = np.frombuffer(bytes(self._buffer[header_end:packet_end]), dtype='<f4')
+            del self._buffer[:packet_end]
+            packets.append((header, data))
+        return packets
+
+
+def tcp_packets(host, port, stop_event=None, reconnect_interval=2.0):
+    """
+    连接TCP数据源并逐个返回数据包，断开后自动重连
+
+    Yields:
+        (头部字典, float32数组)
+    """
+    while stop_event is None or not stop_event.is_set():
+        try:
+            with socket.create_connection((host, port), timeout=5) as sock:
+                sock.settimeout(1.0)
+                logger.info(f"已连接数据源 {host}:{port}")
+                decoder = PacketDecoder()
+                while stop_event is None or not stop_event.is_set():
+                    try:
+                        data = sock.recv(65536)
+                    except socket.timeout:
+                        continue
+                    if not data:
+                        break
+                    for packet in decoder.feed(data):
+                        yield packet
+        except OSError as e:
+            logger.warning(f"数据源 {host}:{port} 连接失败: {str(e)}")
+        if stop_event is None:
+            return
+        stop_event.wait(reconnect_interval)
+
+
+def tail_packets(path, stop_event=None, poll_interval=0.2, from_start=True):
+    """
+    跟踪不断追加的数据包文件 (类似 tail -f)
+
+    Yields:
+        (头部字典, float32数组)
+    """
+    while not os.path.exists(path):
+        if stop_event is not None and stop_event.wait(poll_interval):
+            return
+        if stop_event is None:
+            time.sleep(poll_interval)
+    with open(path, 'rb') as f:
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        decoder = PacketDecoder()
+        while stop_event is None or not stop_event.is_set():
+            data = f.read(65536)
+            if not data:
+                time.sleep(poll_interval)
+                continue
+            for packet in decoder.feed(data):
+                yield packet
+
+
+class ChannelRing:
+    """
+    单个通道的环形缓冲区，以相对于台站起点的全局采样点索引寻址
+
+    缓冲区保存 [end - capacity, end) 范围内的采样点。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity)
+        self.end = 0
+
+    def write(self, start, data):
+        """
+        写入从全局索引start开始的数据。与已有数据重叠的部分被丢弃，
+        与已有数据之间的空缺补零
+        """
+        if start < self.end:
+            data = data[self.end - start:]
+            start = self.end
+        if start > self.end:
+            self._put(np.zeros(start - self.end))
+        self._put(data)
+
+    def read(self, start, stop):
+        """读取 [start, stop) 范围的数据 (需在缓冲区范围内)"""
+        assert self.end - self.capacity <= start <= stop <= self.end
+        i, j = start % self.capacity, stop % self.capacity
+        if stop - start == 0:
+            return np.zeros(0)
+        if i < j:
+            return self.buffer[i:j].copy()
+        return np.concatenate([self.buffer[i:], self.buffer[:j]])
+
+    def _put(self, data):
+        total = data.size
+        # 超出容量的部分只保留最后capacity个采样点
+        self.end += total - min(total, self.capacity)
+        data = data[total - min(total, self.capacity):]
+        i = self.end % self.capacity
+        n = min(data.size, self.capacity - i)
+        self.buffer[i:i + n] = data[:n]
+        self.buffer[:data.size - n] = data[n:]
+        self.end += data.size
+
+
+class StationBuffer:
+    """单个台站的三通道环形缓冲区和增量拾取器"""
+
+    def __init__(self, station, starttime, sampling_rate, picker, capacity):
+        self.station = station
+        self.starttime = starttime
+        self.sampling_rate = sampling_rate
+        self.picker = picker
+        self.capacity = capacity
+        self.rings = [ChannelRing(capacity) for _ in CHANNELS]
+        # 已交给拾取器的采样点数
+        self.fed = 0
+        # (三通道都已到达的采样点数, 到达时间)，用于计算延迟
+        self._ready_times = deque()
+
+    def push(self, chdx, starttime, data, arrival_time):
+        """
+        写入一个通道的一段数据，返回新确定的事件 (全局索引)
+        """
+        start = int(round((starttime - self.starttime) * self.sampling_rate))
+        events = []
+        # 数据包较大时分段写入，保证未处理的数据不会被覆盖
+        step = max(self.capacity // 2, 1)
+        for offset in range(0, data.size, step):
+            piece = data[offset:offset + step]
+            stop = start + offset + piece.size
+            if stop - self.fed > self.capacity:
+                # 某些通道落后太多: 补零后强制推进，避免覆盖未处理的数据
+                limit = stop - self.capacity
+                for ring in self.rings:
+                    if ring.end < limit:
+                        logger.warning(f"台站 {self.station} 通道数据缺失，补零 {limit - ring.end} 个采样点")
+                        ring.write(ring.end, np.zeros(limit - ring.end))
+                events += self._advance(arrival_time)
+            self.rings[chdx].write(start + offset, piece)
+            events += self._advance(arrival_time)
+        return events
+
+    def _advance(self, arrival_time):
+        ready = min(ring.end for ring in self.rings)
+        if ready <= self.fed:
+            return []
+        block = np.stack([ring.read(self.fed, ready) for ring in self.rings])
+        self._ready_times.append((ready, arrival_time))
+        self.fed = ready
+        # 只保留缓冲区范围内的到达时间
+        while len(self._ready_times) > 1 and self._ready_times[1][0] < self.fed - self.capacity:
+            self._ready_times.popleft()
+        return self.picker.feed(block)
+
+    def arrival_time_of(self, index):
+        """采样点index三通道到齐的时间，已不在记录范围内时返回最早的记录"""
+        ends = [end for end, _ in self._ready_times]
+        k = bisect.bisect_right(ends, index)
+        k = min(k, len(ends) - 1)
+        return self._ready_times[k][1]
+
+    def close(self):
+        return self.picker.close()
+
+
+class RealtimePicker:
+    """
+    多台站实时拾取
+
+    ingest()接收数据包，返回新确定的震相；每个台站在首个数据包到达时创建。
+    """
+
+    def __init__(self, session, window_length=10000, step_size=3000, p_th=0.1, s_th=0.1, det_th=0.50,
+                 batch_size=1, buffer_seconds=600.0, on_pick=None, max_latencies=10000):
+        """
+        Args:
+            session: ONNX运行时会话对象
+            window_length, step_size, p_th, s_th, det_th, batch_size: 推理参数，同StreamingPicker
+            buffer_seconds: 每个通道环形缓冲区的时长 (秒)，决定通道之间允许的最大时间差
+            on_pick: 可选回调，每确定一个震相调用 on_pick(震相字典)
+            max_latencies: 用于统计的延迟记录数上限
+        """
+        self.session = session
+        self.picker_params = dict(window_length=window_length, step_size=step_size, p_th=p_th, s_th=s_th,
+                                  det_th=det_th, batch_size=batch_size)
+        # 各台站在锁内依次推理，共享同一个引擎的缓冲区
+        self.engine = InferenceEngine(session, window_length,
+                                      _resolve_batch_size(session, batch_size) if batch_size > 1 else 1)
+        self.buffer_seconds = buffer_seconds
+        self.on_pick = on_pick
+        self.stations = {}
+        self.packets = 0
+        self.latencies = deque(maxlen=max_latencies)
+        self._lock = threading.Lock()
+
+    def ingest(self, header, data, arrival_time=None):
+        """
+        处理一个数据包
+
+        Args:
+            header: 数据包头部字典 (station, channel, starttime, sampling_rate)
+            data: 采样值
+            arrival_time: 数据包到达时间 (time.time())，默认为当前时间
+
+        Returns:
+            新确定的震相列表
+        """
+        import obspy
+
+        arrival_time = time.time() if arrival_time is None else arrival_time
+        chdx = next((k for k, pattern in enumerate(CHANNELS) if fnmatch.fnmatch(header['channel'], pattern)), None)
+        if chdx is None:
+            return []
+        starttime = obspy.UTCDateTime(header['starttime'])
+        sampling_rate = float(header['sampling_rate'])
+        with self._lock:
+            self.packets += 1
+            station = self.stations.get(header['station'])
+            if station is None:
+                capacity = max(int(self.buffer_seconds * sampling_rate), self.picker_params['window_length'])
+                station = StationBuffer(header['station'], starttime, sampling_rate,
+                                        StreamingPicker(self.session, **self.picker_params, engine=self.engine),
+                                        capacity)
+                self.stations[header['station']] = station
+                logger.info(f"新台站: {header['station']} ({sampling_rate} Hz)")
+            elif sampling_rate != station.sampling_rate:
+                logger.warning(f"台站 {header['station']} 采样率变化 ({station.sampling_rate} -> {sampling_rate})，丢弃数据包")
+                return []
+            events = station.push(chdx, starttime, np.asarray(data, dtype=np.float64), arrival_time)
+            return self._publish(station, events)
+
+    def close(self):
+        """数据结束，返回各台站剩余的震相"""
+        with self._lock:
+            picks = []
+            for station in self.stations.values():
+                picks += self._publish(station, station.close())
+            return picks
+
+    def latency_stats(self):
+        """从采样点到达到震相发布的延迟统计 (秒)"""
+        latencies = np.array(self.latencies)
+        stats = {'picks': int(latencies.size), 'packets': self.packets, 'stations': len(self.stations)}
+        if latencies.size:
+            stats.update({
+                'latency_p50': float(np.percentile(latencies, 50)),
+                'latency_p90': float(np.percentile(latencies, 90)),
+                'latency_max': float(latencies.max()),
+            })
+        return stats
+
+    def _publish(self, station, events):
+        now = time.time()
+        picks = []
+        for bg, candidate_Ps, candidate_Ss in events:
+            p_idx, p_prob = candidate_Ps[0]
+            s_idx, s_prob = candidate_Ss[0]
+            latency = now - station.arrival_time_of(int(p_idx))
+            self.latencies.append(latency)
+            pick = {
+                'station': station.station,
+                'p_arrival_index': int(p_idx),
+                'p_arrival_utc': (station.starttime + p_idx / station.sampling_rate).isoformat(),
+                'p_confidence': float(p_prob),
+                's_arrival_index': None if np.isnan(s_idx) else int(s_idx),
+                's_arrival_utc': None if np.isnan(s_idx) else
+                    (station.starttime + s_idx / station.sampling_rate).isoformat(),
+                's_confidence': None if np.isnan(s_prob) else float(s_prob),
+                'latency_seconds': latency,
+            }
+            picks.append(pick)
+            if self.on_pick is not None:
+                self.on_pick(pick)
+        return picks
+
+
+def replay(files, packet_seconds=1.0, speed=1.0, port=None, output=None):
+    """
+    把波形文件按数据包实时回放，作为离线测试用的数据源
+
+    Args:
+        files: 波形文件列表 (可包含多个台站)
+        packet_seconds: 每个数据包的时长 (秒)
+        speed: 回放倍速，0表示不等待
+        port: 监听的TCP端口，等待一个客户端连接后开始发送
+        output: 追加写入的数据包文件
+    """
+    import obspy
+
+    stream = obspy.Stream()
+    for path in files:
+        stream += obspy.read(path)
+    stream.merge(method=1, fill_value=0)
+    t0 = min(tr.stats.starttime for tr in stream)
+    t1 = max(tr.stats.endtime for tr in stream)
+
+    if port is not None:
+        server = socket.create_server(('127.0.0.1', port))
+        print(f"--> 等待客户端连接 127.0.0.1:{port}")
+        conn, _ = server.accept()
+        send = conn.sendall
+    else:
+        out = open(output, 'ab')
+
+        def send(data):
+            out.write(data)
+            out.flush()
+
+    print(f"--> 开始回放 {len(stream)} 条记录, {t1 - t0:.1f} 秒, {speed}x")
+    wall_start = time.time()
+    t = t0
+    try:
+        while t <= t1:
+            for tr in stream:
+                sr = tr.stats.sampling_rate
+                i = max(int(round((t - tr.stats.starttime) * sr)), 0)
+                j = max(int(round((t + packet_seconds - tr.stats.starttime) * sr)), 0)
+                if j <= i or i >= tr.stats.npts:
+                    continue
+                station = f"{tr.stats.network}.{tr.stats.station}.{tr.stats.location}"
+                send(encode_packet(station, tr.stats.channel, tr.stats.starttime + i / sr, sr,
+                                   tr.data[i:min(j, tr.stats.npts)]))
+            t += packet_seconds
+            if speed > 0:
+                delay = wall_start + (t - t0) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+    finally:
+        if port is not None:
+            conn.close()
+            server.close()
+        else:
+            out.close()
+    print("--> 回放结束")
+
+
+def main():
+    from dt_onnx_inference_windows import load_onnx_model
+
+    parser = argparse.ArgumentParser(description='DiTing 实时连续拾取')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_replay = sub.add_parser('replay', help='回放波形文件作为数据源')
+    p_replay.add_argument('--file', nargs='+', required=True, help='波形文件')
+    p_replay.add_argument('--packet-seconds', type=float, default=1.0, help='每个数据包的时长 (秒)')
+    p_replay.add_argument('--speed', type=float, default=1.0, help='回放倍速，0表示不等待')
+    target = p_replay.add_mutually_exclusive_group(required=True)
+    target.add_argument('--port', type=int, help='监听的TCP端口')
+    target.add_argument('--output', help='追加写入的数据包文件')
+
+    p_pick = sub.add_parser('pick', help='连接数据源实时拾取')
+    source = p_pick.add_mutually_exclusive_group(required=True)
+    source.add_argument('--tcp', help='数据源地址 host:port')
+    source.add_argument('--tail', help='跟踪的数据包文件')
+    p_pick.add_argument('--model', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                        'DiTing0.1B_v15.onnx'), help='ONNX模型路径')
+    p_pick.add_argument('--batch-size', type=int, default=16, help='批量推理的窗口数')
+    p_pick.add_argument('--idle-timeout', type=float, default=None,
+                        help='数据源空闲超过该秒数后结束 (仅用于测试)')
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        replay(args.file, packet_seconds=args.packet_seconds, speed=args.speed, port=args.port, output=args.output)
+        return
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    session = load_onnx_model(args.model)
+    picker = RealtimePicker(session, det_th=0.3, batch_size=args.batch_size,
+                            on_pick=lambda pick: print(json.dumps(pick, ensure_ascii=False), flush=True))
+    stop_event = threading.Event()
+    if args.tcp:
+        host, port = args.tcp.rsplit(':', 1)
+        packets = tcp_packets(host, int(port), stop_event=None)
+    else:
+        packets = tail_packets(args.tail, stop_event=stop_event)
+
+    last_packet = [time.time()]
+    if args.idle_timeout:
+        def watchdog():
+            while not stop_event.wait(0.5):
+                if time.time() - last_packet[0] > args.idle_timeout:
+                    stop_event.set()
+        threading.Thread(target=watchdog, daemon=True).start()
+
+    try:
+        for header, data in packets:
+            last_packet[0] = time.time()
+            picker.ingest(header, data)
+            if stop_event.is_set():
+                break
+    except KeyboardInterrupt:
+        pass
+    picker.close()
+    print(json.dumps(picker.latency_stats(), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
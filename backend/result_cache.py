@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按内容寻址的分析结果缓存
+
+以 (文件内容, 推理参数, 模型标识) 的哈希为键，保存 /process 返回的JSON和结果图像。
+存储方式见 lru_store.LruFileStore。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+from lru_store import LruFileStore
+
+
+def content_digest(data=None, path=None, chunk_size=1 << 20):
+    """
+    计算文件内容的哈希
+
+    Args:
+        data: 文件内容 (bytes)，与path二选一
+        path: 文件路径，按块读取计算哈希
+        chunk_size: 按块读取的大小
+
+    Returns:
+        十六进制的SHA-256字符串
+    """
+    hasher = hashlib.sha256()
+    if data is not None:
+        hasher.update(data)
+    else:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(chunk_size), b''):
+                hasher.update(block)
+    return hasher.hexdigest()
+
+
+def cache_key(params, data=None, path=None, digest=None):
+    """
+    计算缓存键
+
+    Args:
+        params: 影响结果的参数 (窗口长度、步长、阈值、模型标识等)，需可JSON序列化
+        data: 文件内容 (bytes)，与path、digest三选一
+        path: 文件路径，按块读取计算哈希
+        digest: 已计算好的content_digest，避免对同一文件重复求哈希
+
+    Returns:
+        十六进制的SHA-256字符串
+    """
+    if digest is None:
+        digest = content_digest(data=data, path=path)
+    hasher = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8'))
+    hasher.update(digest.encode('ascii'))
+    return hasher.hexdigest()
+
+
+def model_identity(model_path):
+    """以文件名、大小和修改时间标识模型文件，避免每次启动都对整个模型求哈希"""
+    try:
+        st = os.stat(model_path)
+        return f"{os.path.basename(model_path)}:{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        return os.path.basename(model_path)
+
+
+class ResultCache(LruFileStore):
+    """
+    有大小上限、LRU淘汰、可持久化的结果缓存
+    """
+
+    table = 'entries'
+    columns = ('key TEXT NOT NULL, size INTEGER NOT NULL, '
+               'created_at REAL NOT NULL, last_access REAL NOT NULL, has_plot INTEGER NOT NULL')
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限 (字节)
+        """
+        super().__init__(cache_dir, max_bytes)
+        with self._transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0), ('evictions', 0)")
+
+    def _paths(self, key):
+        return os.path.join(self.store_dir, f"{key}.json"), os.path.join(self.store_dir, f"{key}.png")
+
+    def _count(self, name, value=1):
+        with self._lock, self._transaction() as conn:
+            conn.execute('UPDATE counters SET value = value + ? WHERE name = ?', (value, name))
+
+    def get(self, key):
+        """
+        查询缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            命中时返回 (结果字典, 图像路径或None)，未命中返回None
+        """
+        def load(paths):
+            with open(paths[0], 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        entry = self._load((key,), 'has_plot', load)
+        self._count('misses' if entry is None else 'hits')
+        if entry is None:
+            return None
+        (has_plot,), result = entry
+        _, plot_path = self._paths(key)
+        return result, (plot_path if has_plot and os.path.exists(plot_path) else None)
+
+    def put(self, key, result, plot_file=None):
+        """
+        写入缓存，超过大小上限时淘汰最久未使用的条目
+
+        Args:
+            key: 缓存键
+            result: 可JSON序列化的结果字典
+            plot_file: 结果图像路径，会复制一份到缓存目录
+        """
+        json_path, plot_path = self._paths(key)
+        with self._replacing(json_path) as tmp_json:
+            with open(tmp_json, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+        size = os.path.getsize(json_path)
+        has_plot = plot_file is not None and os.path.exists(plot_file)
+        if has_plot:
+            with self._replacing(plot_path) as tmp_plot:
+                shutil.copyfile(plot_file, tmp_plot)
+            size += os.path.getsize(plot_path)
+        self._insert([{'key': key, 'size': size, 'has_plot': int(has_plot)}])
+
+    def _evict(self, conn, keep=None):
+        evicted = super()._evict(conn, keep=keep)
+        if evicted:
+            conn.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'", (evicted,))
+        return evicted
+
+    def stats(self):
+        """命中/未命中次数、条目数和占用大小"""
+        with self._transaction() as conn:
+            counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+        lookups = counters.get('hits', 0) + counters.get('misses', 0)
+        return dict({
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'evictions': counters.get('evictions', 0),
+            'hit_rate': counters.get('hits', 0) / lookups if lookups else 0.0,
+        }, **super().stats())
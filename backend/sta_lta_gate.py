@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+STA/LTA 预触发门控
+
+连续记录中大部分窗口只有噪声。门控先用 obspy 的 classic_sta_lta 计算三个通道的
+特征函数 (取各通道的最大值)，只对与触发区间 (两侧各扩展 margin_seconds) 重叠的窗口
+运行模型，其余窗口跳过，其置信度按0计入重叠相加。
+
+扩展后的触发区间内每个采样点都只被运行了模型的窗口覆盖，置信度与不门控时完全相同；
+跳过的窗口只会影响距离触发区间超过 margin_seconds 的位置。
+记录开头 lta_seconds 内 LTA 尚未填满，特征函数无效，这一段按触发处理。
+
+evaluate (本模块的命令行) 在示例波形和插入了安静段的合成长记录上对比门控与不门控的结果，
+报告跳过的窗口比例、召回率 (不门控时的事件中被门控结果匹配到的比例)、多检、P/S到时偏差和加速比。
+
+用法:
+    python sta_lta_gate.py --synthetic-seconds 21600 --gap-seconds 600 --output gate_report.json
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+
+class StaLtaGate:
+    """STA/LTA 窗口门控"""
+
+    def __init__(self, sta_seconds=1.0, lta_seconds=30.0, on=2.5, off=1.0, margin_seconds=30.0):
+        """
+        Args:
+            sta_seconds: 短时窗长度 (秒)
+            lta_seconds: 长时窗长度 (秒)
+            on: 触发阈值
+            off: 解除触发阈值
+            margin_seconds: 触发区间两侧各扩展的时长 (秒)
+        """
+        if not 0 < sta_seconds < lta_seconds:
+            raise ValueError(f"STA/LTA 时窗长度无效: sta={sta_seconds}, lta={lta_seconds}")
+        self.sta_seconds = sta_seconds
+        self.lta_seconds = lta_seconds
+        self.on = on
+        self.off = off
+        self.margin_seconds = margin_seconds
+
+    def config(self):
+        """门控参数，用于结果缓存键和报告"""
+        return {'sta_seconds': self.sta_seconds, 'lta_seconds': self.lta_seconds, 'on': self.on,
+                'off': self.off, 'margin_seconds': self.margin_seconds}
+
+    def characteristic(self, waveform, sampling_rate):
+        """
+        计算特征函数
+
+        Args:
+            waveform: 三通道波形数据，形状为[3, data_len] (见assemble_waveform)
+            sampling_rate: 采样率 (Hz)
+
+        Returns:
+            各通道 STA/LTA 比值的最大值，形状为[data_len]
+        """
+        from obspy.signal.trigger import classic_sta_lta
+
+        nsta = max(int(round(self.sta_seconds * sampling_rate)), 1)
+        nlta = max(int(round(self.lta_seconds * sampling_rate)), nsta + 1)
+        cft = None
+        for channel in waveform:
+            trace = channel.astype(np.float64)
+            trace -= np.mean(trace)
+            ratio = classic_sta_lta(trace, nsta, nlta)
+            cft = ratio if cft is None else np.maximum(cft, ratio, out=cft)
+        return cft
+
+    def triggered_intervals(self, waveform, sampling_rate):
+        """
+        触发区间 (未扩展)
+
+        Returns:
+            形状为[n, 2]的数组，每行为 [起点, 终点] (含)，记录开头 LTA 未填满的部分作为第一个区间
+        """
+        from obspy.signal.trigger import trigger_onset
+
+        data_len = waveform.shape[1]
+        nlta = min(int(round(self.lta_seconds * sampling_rate)), data_len)
+        intervals = [[0, max(nlta - 1, 0)]]
+        onsets = trigger_onset(self.characteristic(waveform, sampling_rate), self.on, self.off)
+        if len(onsets):
+            intervals += np.asarray(onsets, dtype=np.int64).tolist()
+        return np.array(intervals, dtype=np.int64)
+
+    def window_mask(self, waveform, sampling_rate, window_length, step_size, num_windows):
+        """
+        需要运行模型的窗口
+
+        Args:
+            waveform: 三通道波形数据，形状为[3, data_len]
+            sampling_rate: 采样率 (Hz)
+            window_length: 窗口长度
+            step_size: 步长
+            num_windows: 窗口数量
+
+        Returns:
+            布尔数组，形状为[num_windows]，True表示运行模型
+        """
+        margin = int(round(self.margin_seconds * sampling_rate))
+        intervals = self.triggered_intervals(waveform, sampling_rate)
+        lo = intervals[:, 0] - margin
+        hi = intervals[:, 1] + margin
+        # 第i个窗口覆盖[i*step_size, i*step_size+window_length)，与[lo, hi]重叠的窗口编号范围
+        first = np.maximum(-((window_length - 1 - lo) // step_size), 0)
+        last = np.minimum(hi // step_size, num_windows - 1)
+        valid = first <= last
+        # 差分标记后累加，得到每个窗口被多少个区间覆盖
+        marks = np.zeros(num_windows + 1, dtype=np.int64)
+        np.add.at(marks, first[valid], 1)
+        np.add.at(marks, last[valid] + 1, -1)
+        return np.cumsum(marks[:-1]) > 0
+
+
+def evaluate(session, gate, records, batch_size=16, tolerance=100):
+    """
+    对比门控与不门控的推理结果
+
+    Args:
+        session: ONNX运行时会话对象
+        gate: StaLtaGate
+        records: [(名称, ObsPy Stream)]
+        batch_size: 批大小
+        tolerance: 事件匹配的P波到时容差 (采样点)
+
+    Returns:
+        报告字典
+    """
+    from dt_onnx_inference_windows import DiTing_predict_onnx
+    from quantize_model import INFERENCE_PARAMS, compare_events
+
+    # 先完整运行一次，避免首次推理的初始化开销计入基线
+    with contextlib.redirect_stdout(io.StringIO()):
+        DiTing_predict_onnx(session, records[0][1], **INFERENCE_PARAMS, batch_size=batch_size)
+
+    rows = []
+    for name, stream in records:
+        results = {}
+        for label, g in (('baseline', None), ('gated', gate)):
+            timings = {}
+            with contextlib.redirect_stdout(io.StringIO()):
+                t0 = time.perf_counter()
+                events, _ = DiTing_predict_onnx(session, stream, **INFERENCE_PARAMS, batch_size=batch_size,
+                                                timings=timings, gate=g)
+                results[label] = (time.perf_counter() - t0, events, timings)
+        base_time, base_events, _ = results['baseline']
+        gated_time, gated_events, timings = results['gated']
+        stats = compare_events(base_events, gated_events, tolerance)
+        rows.append(dict(stats, record=name, samples=int(stream[0].stats.npts),
+                         windows=timings['num_windows'], windows_skipped=timings['windows_skipped'],
+                         skipped_fraction=timings['windows_skipped'] / max(timings['num_windows'], 1),
+                         recall=stats['matched'] / stats['reference_events'] if stats['reference_events'] else 1.0,
+                         baseline_seconds=base_time, gated_seconds=gated_time,
+                         speedup=base_time / gated_time if gated_time > 0 else 0.0))
+
+    windows = sum(r['windows'] for r in rows)
+    reference = sum(r['reference_events'] for r in rows)
+    matched = sum(r['matched'] for r in rows)
+    total = {
+        'windows': windows,
+        'windows_skipped': sum(r['windows_skipped'] for r in rows),
+        'skipped_fraction': sum(r['windows_skipped'] for r in rows) / max(windows, 1),
+        'reference_events': reference,
+        'matched': matched,
+        'recall': matched / reference if reference else 1.0,
+        'extra': sum(r['extra'] for r in rows),
+        'speedup': sum(r['baseline_seconds'] for r in rows) / max(sum(r['gated_seconds'] for r in rows), 1e-12),
+    }
+    return {'gate': gate.config(), 'batch_size': batch_size, 'match_tolerance_samples': tolerance,
+            'records': rows, 'total': total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='STA/LTA 门控的跳过比例与召回率评估')
+    parser.add_argument('--model', default=None, help='ONNX模型路径，默认使用 DiTing0.1B_v15.onnx')
+    parser.add_argument('--waveforms', nargs='*', default=None, help='评估用的波形文件，默认使用示例波形')
+    parser.add_argument('--synthetic-seconds', type=float, nargs='*', default=[6 * 3600],
+                        help='另外评估的合成长记录时长 (秒)')
+    parser.add_argument('--gap-seconds', type=float, default=600,
+                        help='合成记录中相邻事件之间插入的安静段时长 (秒)')
+    parser.add_argument('--sta', type=float, default=1.0, help='短时窗长度 (秒)')
+    parser.add_argument('--lta', type=float, default=30.0, help='长时窗长度 (秒)')
+    parser.add_argument('--on', type=float, default=2.5, help='触发阈值')
+    parser.add_argument('--off', type=float, default=1.0, help='解除触发阈值')
+    parser.add_argument('--margin', type=float, default=30.0, help='触发区间两侧扩展的时长 (秒)')
+    parser.add_argument('--batch-size', type=int, default=16, help='批大小')
+    parser.add_argument('--tolerance', type=int, default=100, help='事件匹配的P波到时容差 (采样点)')
+    parser.add_argument('--output', default=None, help='将报告以JSON保存到该文件')
+    args = parser.parse_args()
+
+    import obspy
+    from benchmark import example_dir, synthetic_record
+    from dt_onnx_inference_windows import load_onnx_model
+    from quantize_model import default_model_path
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        session = load_onnx_model(args.model or default_model_path)
+    gate = StaLtaGate(args.sta, args.lta, args.on, args.off, args.margin)
+    paths = args.waveforms or sorted(glob.glob(os.path.join(example_dir, '*.mseed')))
+    records = [(os.path.basename(path), obspy.read(path)) for path in paths]
+    records += [(f'synthetic_{int(seconds)}s_gap{int(args.gap_seconds)}s',
+                 synthetic_record(seconds, gap_seconds=args.gap_seconds)) for seconds in args.synthetic_seconds]
+    report = evaluate(session, gate, records, args.batch_size, args.tolerance)
+
+    print(f"--> STA/LTA 门控 {gate.config()}")
+    for r in report['records']:
+        print(f"    {r['record']:34s} 跳过 {r['windows_skipped']:6d}/{r['windows']:6d} ({r['skipped_fraction']:6.1%})  "
+              f"召回 {r['matched']:4d}/{r['reference_events']:4d} ({r['recall']:6.1%})  多检 {r['extra']:3d}  "
+              f"P偏差 最大 {r['p_offset'].get('max_abs', 0):5.0f}  加速 {r['speedup']:5.2f}x")
+    t = report['total']
+    print(f"    合计: 跳过 {t['skipped_fraction']:.1%} 的窗口, 召回率 {t['recall']:.1%} "
+          f"({t['matched']}/{t['reference_events']}), 多检 {t['extra']}, 加速 {t['speedup']:.2f}x")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存至: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用于离线测试和基准测试的替身ONNX模型
+
+输入输出形状与 DiTing0.1B_v15.onnx 相同: [batch, 3, length] -> [batch, 3, length]，
+batch 和 length 均为动态维度。模型对归一化后的波形求能量并做两层卷积平滑，
+经 sigmoid 输出0~1之间的 检测/P/S 置信度，能量突增处会产生峰值，
+足以驱动后处理和整个推理流程，但不具备实际的拾取能力。
+
+需要安装 onnx 包 (pip install onnx)。
+
+用法:
+    python standin_model.py --output standin.onnx
+"""
+
+import argparse
+
+import numpy as np
+
+
+def build_standin_model(path, kernel_size=101, hidden=8, seed=0):
+    """
+    生成替身模型并保存
+
+    Args:
+        path: 保存路径
+        kernel_size: 卷积核长度 (奇数)
+        hidden: 中间层通道数
+        seed: 随机种子
+
+    Returns:
+        path
+    """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(seed)
+    pad = kernel_size // 2
+    # 第一层: 对三个通道的能量做滑动平均，各输出通道使用不同的阈值
+    w1 = np.full((hidden, 3, kernel_size), 1.0 / (3 * kernel_size), dtype=np.float32)
+    w1 *= rng.uniform(0.8, 1.2, size=(hidden, 1, 1)).astype(np.float32)
+    b1 = -np.geomspace(1.5, 20.0, hidden).astype(np.float32)
+    # 第二层: 检测取平滑后的能量，P/S 取能量的上升沿和下降沿
+    ramp = np.linspace(-1.0, 1.0, kernel_size, dtype=np.float32)
+    w2 = np.zeros((3, hidden, kernel_size), dtype=np.float32)
+    w2[0] = 4.0 / kernel_size
+    w2[1] = 40.0 * ramp / kernel_size
+    w2[2] = -40.0 * ramp / kernel_size
+    w2 += rng.normal(0, 0.01, size=w2.shape).astype(np.float32)
+    b2 = np.array([-4.0, -6.0, -6.0], dtype=np.float32)
+
+    nodes = [
+        helper.make_node('Mul', ['input', 'input'], ['energy']),
+        helper.make_node('Conv', ['energy', 'w1', 'b1'], ['hidden'], pads=[pad, pad]),
+        helper.make_node('Relu', ['hidden'], ['hidden_relu']),
+        helper.make_node('Conv', ['hidden_relu', 'w2', 'b2'], ['logits'], pads=[pad, pad]),
+        helper.make_node('Sigmoid', ['logits'], ['output']),
+    ]
+    graph = helper.make_graph(
+        nodes, 'diting_standin',
+        [helper.make_tensor_value_info('input', TensorProto.FLOAT, ['batch', 3, 'length'])],
+        [helper.make_tensor_value_info('output', TensorProto.FLOAT, ['batch', 3, 'length'])],
+        [numpy_helper.from_array(w1, 'w1'), numpy_helper.from_array(b1, 'b1'),
+         numpy_helper.from_array(w2, 'w2'), numpy_helper.from_array(b2, 'b2')])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成替身ONNX模型')
+    parser.add_argument('--output', default='standin.onnx', help='保存路径')
+    parser.add_argument('--kernel-size', type=int, default=101, help='卷积核长度')
+    args = parser.parse_args()
+    print(f"替身模型已保存至: {build_standin_model(args.output, kernel_size=args.kernel_size)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任意长度波形文件的流式推理
+
+按时间分块读取波形，窗口之间的重叠部分保留在内存中衔接相邻分块，
+置信度由ConfidenceAccumulator逐段完成，后处理只在已确定的区域上进行，
+因此内存占用与记录长度无关，且分块边界附近的事件不会重复或丢失。
+"""
+
+import numpy as np
+from post_processing import postprocesser_ev_center
+from confidence_accumulator import ConfidenceAccumulator
+from dt_onnx_inference_windows import _resolve_batch_size, _sliding_windows
+from inference_engine import InferenceEngine
+from multi_station import station_id
+from waveform_assembly import (CHANNELS, MODEL_SAMPLING_RATE, assemble_waveform, select_station, waveform_npts,
+                               waveform_starttime)
+
+# 需要重采样时，每个分块两端多读取的时长 (秒)，避免重采样的边缘效应落入分块内
+RESAMPLE_PAD_SECONDS = 10.0
+
+
+class WaveformChunkReader:
+    """
+    按时间分块读取三分量波形文件
+
+    只读取文件头确定时间范围，之后每次只解码一个分块，
+    相邻分块按模型采样率的采样点首尾相接，不重叠也不遗漏。
+    每个分块的组装方式与整体读取时相同 (见assemble_waveform)；
+    文件包含多个台站时只读取第一个三分量齐全的台站 (见select_station)。
+    """
+
+    def __init__(self, path, chunk_seconds=3600.0):
+        """
+        Args:
+            path: 波形文件路径
+            chunk_seconds: 每个分块的时长 (秒)
+        """
+        import obspy
+
+        self.path = path
+        header = select_station(obspy.read(path, headonly=True))
+        traces = [tr for ch in CHANNELS for tr in header.select(channel=ch)]
+        if not traces:
+            raise ValueError("文件中没有找到 *HZ/*HN/*HE 通道")
+        self.station = station_id(traces[0])
+        self.sampling_rate = MODEL_SAMPLING_RATE
+        self.resample = any(tr.stats.sampling_rate != self.sampling_rate for tr in traces)
+        self.starttime = waveform_starttime(header)
+        self.npts = waveform_npts(header, self.sampling_rate, self.starttime)
+        self.endtime = self.starttime + (self.npts - 1) / self.sampling_rate
+        self.chunk_samples = max(int(chunk_seconds * self.sampling_rate), 1)
+
+    def __iter__(self):
+        """
+        Yields:
+            三通道波形分块，形状为[3, n]，float32
+        """
+        import obspy
+
+        delta = 1.0 / self.sampling_rate
+        pad = RESAMPLE_PAD_SECONDS if self.resample else 0.0
+        consumed = 0
+        while consumed < self.npts:
+            n = min(self.chunk_samples, self.npts - consumed)
+            t0 = self.starttime + consumed * delta
+            t1 = self.starttime + (consumed + n - 1) * delta
+            st = select_station(obspy.read(self.path, starttime=t0 - pad, endtime=t1 + pad), self.station)
+            # 整个分块都处于某个分量的间断中时，该分量填0
+            block = assemble_waveform(st, self.sampling_rate, starttime=t0, npts=n, require_all=False)
+            consumed += n
+            yield block
+
+
+class StreamingPicker:
+    """
+    增量式的滑动窗口推理与震相拾取
+
+    feed()接收连续的波形分块，返回已经确定、今后不会再改变的事件；
+    close()在数据结束时返回剩余事件。所有事件的采样点索引都是相对于
+    整条记录起点的全局索引，结果与对整条记录调用DiTing_predict_onnx一致。
+
+    未确定事件的置信度在安静段处裁剪；持续嘈杂、超过max_pending_windows个窗口都没有安静段时
+    强制确定并裁剪以限制内存，此时裁剪点附近的事件可能与整体处理的结果不同。
+    """
+
+    def __init__(self, session, window_length=10000, step_size=3000, p_th=0.1, s_th=0.1, det_th=0.50,
+                 batch_size=1, p_mpd=10, s_mpd=10, ev_tolerance=100, p_tolerance=500, engine=None,
+                 max_pending_windows=1000):
+        """
+        Args:
+            session: ONNX运行时会话对象
+            window_length: 窗口长度
+            step_size: 步长
+            p_th: P波检测阈值
+            s_th: S波检测阈值
+            det_th: 事件检测阈值
+            batch_size: 每次session.run处理的窗口数
+            p_mpd, s_mpd, ev_tolerance, p_tolerance: 传给postprocesser_ev_center的参数
+            engine: 可选的InferenceEngine，批大小以引擎为准；多个StreamingPicker串行使用时
+                可以共享同一个引擎 (如RealtimePicker的各台站)，默认各自创建
+            max_pending_windows: 保留的未确定置信度超过这么多个步长时强制裁剪
+        """
+        self.session = session
+        self.window_length = window_length
+        self.step_size = step_size
+        self.p_th = p_th
+        self.s_th = s_th
+        self.det_th = det_th
+        if engine is None:
+            engine = InferenceEngine(session, window_length,
+                                     _resolve_batch_size(session, batch_size) if batch_size > 1 else 1)
+        self.engine = engine
+        self.batch_size = engine.batch_size
+        self.p_mpd = p_mpd
+        self.s_mpd = s_mpd
+        self.ev_tolerance = ev_tolerance
+        self.p_tolerance = p_tolerance
+        # 安静段 (三条置信度都低于阈值) 至少这么长时，两侧的后处理结果互不影响
+        self.barrier_length = max(ev_tolerance, p_mpd, s_mpd) + 2
+        self.max_pending_samples = max(max_pending_windows * step_size, window_length + 2 * p_tolerance)
+
+        self.accumulator = ConfidenceAccumulator(None, window_length, step_size, None)
+        self.samples_seen = 0
+        # 尚未被窗口用完的波形，对应[_wave_base, _wave_base+n)
+        self._wave = np.zeros((3, 0), dtype=np.float32)
+        self._wave_base = 0
+        # 已完成但尚未确定事件的置信度，对应[_conf_base, _conf_base+n)
+        self._conf = np.zeros((3, 0), dtype=np.float32)
+        self._conf_base = 0
+        self._emitted = set()
+
+    @property
+    def windows_done(self):
+        """已完成推理的窗口数"""
+        return self.accumulator.windows_added
+
+    def feed(self, block):
+        """
+        输入下一段波形
+
+        Args:
+            block: 三通道波形分块，形状为[3, n]
+
+        Returns:
+            已确定的事件列表，结构同postprocesser_ev_center的返回值
+        """
+        block = np.asarray(block, dtype=np.float32)
+        self.samples_seen += block.shape[1]
+        self._wave = np.concatenate([self._wave, block], axis=1)
+
+        # 当前缓冲区中可以完整取出的窗口
+        first = self.accumulator.windows_added * self.step_size - self._wave_base
+        available = self._wave.shape[1] - first
+        if available >= self.window_length:
+            num_windows = (available - self.window_length) // self.step_size + 1
+            windows = _sliding_windows(self._wave[:, first:], self.window_length, self.step_size, num_windows)
+            for b_start in range(0, num_windows, self.batch_size):
+                b_end = min(b_start + self.batch_size, num_windows)
+                output_np = self.engine.predict(windows[b_start:b_end])
+                for k in range(b_end - b_start):
+                    self.accumulator.add(output_np[k])
+            # 丢弃后续窗口不再需要的波形
+            drop = self.accumulator.windows_added * self.step_size - self._wave_base
+            self._wave = self._wave[:, drop:].copy()
+            self._wave_base += drop
+
+        self._append_confidence()
+        return self._collect_events(final=False)
+
+    def close(self):
+        """
+        数据结束，处理剩余部分
+
+        Returns:
+            剩余的事件列表
+        """
+        if self.accumulator.windows_added == 0 and self.samples_seen > 0:
+            # 记录短于一个窗口: 与DiTing_predict_onnx一致，归一化后补零为一个窗口
+            output_np = self.engine.predict_padded(self._wave)
+            self.accumulator.add(output_np[0])
+            self.accumulator.finish(self.window_length)
+        else:
+            self.accumulator.finish(self.samples_seen)
+        self._wave = np.zeros((3, 0), dtype=np.float32)
+        self._append_confidence()
+        return self._collect_events(final=True)
+
+    def _append_confidence(self):
+        offset, chunk = self.accumulator.flush()
+        if chunk.shape[1]:
+            assert offset == self._conf_base + self._conf.shape[1]
+            self._conf = np.concatenate([self._conf, chunk], axis=1)
+
+    def _collect_events(self, final):
+        """在已完成的置信度上做后处理，返回新确定的事件并裁掉不再需要的部分"""
+        conf = self._conf
+        length = conf.shape[1]
+        if length == 0:
+            return []
+
+        forced = False
+        if final:
+            frontier = length
+            barrier_starts = None
+        else:
+            quiet = (conf[0] < self.det_th) & (conf[1] < self.p_th) & (conf[2] < self.s_th)
+            barrier_starts = self._barrier_starts(quiet)
+            if barrier_starts.size:
+                # 最后一个安静段之前的峰值和检测不会再受后续数据影响
+                frontier = int(barrier_starts[-1]) - self.p_tolerance
+            elif length > self.max_pending_samples:
+                # 长时间没有安静段: 最后一个窗口之前的部分强制确定
+                forced = True
+                frontier = length - self.window_length
+            else:
+                return []
+
+        matches = postprocesser_ev_center(
+            yh1=conf[0], yh2=conf[1], yh3=conf[2],
+            det_th=self.det_th, p_th=self.p_th, p_mpd=self.p_mpd,
+            s_th=self.s_th, s_mpd=self.s_mpd,
+            ev_tolerance=self.ev_tolerance, p_tolerance=self.p_tolerance)
+
+        events = []
+        for bg, candidate_Ps, candidate_Ss in matches:
+            if not final and bg > frontier:
+                continue
+            global_bg = int(bg) + self._conf_base
+            if global_bg in self._emitted:
+                continue
+            self._emitted.add(global_bg)
+            events.append([
+                global_bg,
+                [[p_idx + self._conf_base, p_prob] for p_idx, p_prob in candidate_Ps],
+                [[s_idx + self._conf_base, s_prob] for s_idx, s_prob in candidate_Ss],
+            ])
+
+        if forced:
+            self._force_trim(conf[0], frontier - self.p_tolerance)
+        elif not final:
+            self._trim(conf[0], frontier, barrier_starts)
+        return events
+
+    def _barrier_starts(self, quiet):
+        """长度不小于barrier_length的安静段的起点"""
+        padded = np.concatenate([[False], quiet, [False]])
+        edges = np.flatnonzero(padded[1:] != padded[:-1])
+        starts, ends = edges[0::2], edges[1::2]
+        return starts[ends - starts >= self.barrier_length]
+
+    def _trim(self, yh1, frontier, barrier_starts):
+        """在安静段处裁掉已确定且不会再被用到的置信度"""
+        # 下一个待定事件的起点之前p_tolerance范围内的P波峰值仍会被用到
+        above = yh1 >= self.det_th
+        onsets = np.flatnonzero(above & ~np.concatenate([[False], above[:-1]]))
+        onsets = onsets[onsets > frontier]
+        pending = int(onsets[0]) if onsets.size else yh1.shape[0]
+        limit = pending - self.p_tolerance
+        candidates = barrier_starts[barrier_starts <= limit]
+        if candidates.size == 0 or candidates[-1] == 0:
+            return
+        self._cut(int(candidates[-1]))
+
+    def _force_trim(self, yh1, limit):
+        """没有安静段时在limit之前裁剪，尽量选在检测置信度低于阈值处，避免把进行中的检测切成新的事件"""
+        if limit <= 0:
+            return
+        below = np.flatnonzero(yh1[:limit] < self.det_th)
+        self._cut(int(below[-1]) if below.size and below[-1] > 0 else limit)
+
+    def _cut(self, cut):
+        self._conf = self._conf[:, cut:].copy()
+        self._conf_base += cut
+        self._emitted = {bg for bg in self._emitted if bg >= self._conf_base}
+
+
+def DiTing_predict_stream(session, reader, window_length=10000, step_size=3000, p_th=0.1, s_th=0.1, det_th=0.50,
+                          batch_size=1):
+    """
+    流式运行DiTing模型，逐个返回已确定的事件
+
+    Args:
+        session: ONNX运行时会话对象
+        reader: 可迭代的波形分块来源，如WaveformChunkReader
+        window_length: 窗口长度
+        step_size: 步长
+        p_th: P波检测阈值
+        s_th: S波检测阈值
+        det_th: 事件检测阈值
+        batch_size: 每次session.run处理的窗口数
+
+    Yields:
+        事件，结构为[bg, [[p_idx, p_prob]], [[s_idx, s_prob]]]，索引相对于记录起点
+    """
+    picker = StreamingPicker(session, window_length=window_length, step_size=step_size,
+                             p_th=p_th, s_th=s_th, det_th=det_th, batch_size=batch_size)
+    for block in reader:
+        for event in picker.feed(block):
+            yield event
+    for event in picker.close():
+        yield event
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+后端测试的公共夹具
+
+后端模块按平级方式互相导入 (如 from post_processing import ...)，这里把 backend 目录加入搜索路径。
+推理相关的测试使用 standin_model 生成的替身模型，需要安装 onnx 和 onnxruntime。
+
+用法 (在 backend 目录下):
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def session(tmp_path_factory):
+    """替身模型的ONNX运行时会话"""
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    from dt_onnx_inference_windows import load_onnx_model
+    from standin_model import build_standin_model
+
+    path = build_standin_model(str(tmp_path_factory.mktemp('model') / 'standin.onnx'))
+    return load_onnx_model(path)
+
+
+def synthetic_waveform(npts, event_spacing=6000, seed=0):
+    """
+    生成合成的三分量波形 [3, npts]: 背景噪声上每隔约 event_spacing 个采样点叠加一段衰减的振荡，
+    替身模型在这些位置输出检测和P/S峰值
+    """
+    rng = np.random.default_rng(seed)
+    waveform = rng.normal(0, 1, size=(3, npts)).astype(np.float32)
+    for onset in range(event_spacing // 2, npts - 2000, event_spacing):
+        onset += int(rng.integers(-event_spacing // 4, event_spacing // 4))
+        t = np.arange(int(rng.integers(300, 1500)))
+        burst = rng.uniform(2, 6) * np.exp(-3.0 * t / t.size) * np.sin(0.3 * t)
+        waveform[:, onset:onset + t.size] += (burst * rng.uniform(0.5, 1.5, size=(3, 1))).astype(np.float32)
+    return waveform
+
+
+@pytest.fixture(scope='session')
+def waveform():
+    """约20分钟的合成波形 (100 Hz)，包含十几个事件"""
+    return synthetic_waveform(120000)
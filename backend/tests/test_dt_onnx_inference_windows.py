@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""批量推理和float32累加与原来的逐窗口推理一致"""
+
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from confidence_accumulator import ConfidenceAccumulator
+from dt_onnx_inference_windows import DiTing_predict_onnx
+
+WINDOW_LENGTH = 10000
+STEP_SIZE = 3000
+
+
+def baseline_confidence(session, waveform, window_length=WINDOW_LENGTH, step_size=STEP_SIZE):
+    """原来的实现: 逐窗口归一化和推理，以float64累加后除以覆盖次数"""
+    npts = waveform.shape[1]
+    num_windows = (npts - window_length) // step_size + 1
+    total = np.zeros((3, npts))
+    count = np.zeros(npts)
+    name = session.get_inputs()[0].name
+    for i in range(num_windows):
+        start = i * step_size
+        window = waveform[:, start:start + window_length].astype(np.float64)
+        window -= window.mean(axis=1, keepdims=True)
+        window /= window.std(axis=1, keepdims=True) + 1e-8
+        output = session.run(None, {name: window[np.newaxis].astype(np.float32)})[0][0]
+        total[:, start:start + window_length] += output
+        count[start:start + window_length] += 1
+    return total / np.maximum(count, 1)
+
+
+def predict(session, waveform, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return DiTing_predict_onnx(session, None, waveform=waveform, **kwargs)
+
+
+@pytest.fixture(scope='module')
+def baseline(session, waveform):
+    return baseline_confidence(session, waveform)
+
+
+@pytest.mark.parametrize('batch_size', [1, 4, 16])
+def test_confidence_matches_baseline(session, waveform, baseline, batch_size):
+    _, confidence = predict(session, waveform, batch_size=batch_size)
+    assert confidence.dtype == np.float32
+    assert confidence.shape == (1, 3, waveform.shape[1])
+    np.testing.assert_allclose(confidence[0], baseline, atol=1e-5)
+
+
+@pytest.mark.parametrize('batch_size', [4, 16])
+def test_batched_events_match_single(session, waveform, batch_size):
+    single, _ = predict(session, waveform, batch_size=1)
+    batched, _ = predict(session, waveform, batch_size=batch_size)
+    assert len(single) > 1
+    assert repr(batched) == repr(single)
+
+
+def test_short_record_is_padded(session, waveform):
+    events, confidence = predict(session, waveform[:, :WINDOW_LENGTH // 2])
+    assert confidence.shape == (1, 3, WINDOW_LENGTH)
+    assert len(events) >= 1
+
+
+@pytest.mark.parametrize('total_length, window_length, step_size', [
+    (100000, 10000, 3000),
+    (10007, 1000, 300),
+    (5000, 1000, 1000),
+    (5000, 1000, 1500),
+])
+def test_float32_accumulator_matches_float64(total_length, window_length, step_size):
+    rng = np.random.default_rng(0)
+    num_windows = (total_length - window_length) // step_size + 1
+    outputs = rng.uniform(0, 1, size=(num_windows, 3, window_length)).astype(np.float32)
+
+    expected = np.zeros((3, total_length))
+    count = np.zeros(total_length)
+    for i, output in enumerate(outputs):
+        start = i * step_size
+        expected[:, start:start + window_length] += output
+        count[start:start + window_length] += 1
+    expected /= np.maximum(count, 1)
+
+    accumulator = ConfidenceAccumulator(total_length, window_length, step_size, num_windows)
+    result = np.full((3, total_length), np.nan, dtype=np.float32)
+    for output in outputs:
+        accumulator.add(output)
+        offset, chunk = accumulator.flush()
+        result[:, offset:offset + chunk.shape[1]] = chunk
+    offset, chunk = accumulator.flush()
+    result[:, offset:offset + chunk.shape[1]] = chunk
+
+    assert not np.isnan(result).any()
+    np.testing.assert_allclose(result, expected, atol=1e-6)
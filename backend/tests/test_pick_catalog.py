@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""拾取目录的游标分页按 (time, id) 顺序返回全部结果，不重复也不遗漏"""
+
+import numpy as np
+import pytest
+
+from pick_catalog import PickCatalog, decode_cursor
+
+
+@pytest.fixture(scope='module')
+def catalog(tmp_path_factory):
+    catalog = PickCatalog(str(tmp_path_factory.mktemp('catalog') / 'picks.sqlite3'))
+    rng = np.random.default_rng(0)
+    picks = []
+    for i in range(300):
+        # 时间取整，很多拾取的时间相同，检验相同时间处的分页
+        p_time = float(rng.integers(0, 100))
+        picks.append({'station': f"XX.{'ABC'[i % 3]}.", 'p_arrival_utc': p_time,
+                      'p_confidence': float(rng.uniform(0, 1)),
+                      's_arrival_utc': p_time + float(rng.integers(0, 5)) if i % 2 else None,
+                      's_confidence': float(rng.uniform(0, 1))})
+    catalog.record_picks(picks)
+    events = [[100.0, [[200.0, 0.9]], [[400.0, 0.8]]], [300.0, [[300.0, 0.7]], [[np.nan, np.nan]]]]
+    catalog.record('analysis-1', 'XX.D.', 0.0, 100.0, events)
+    return catalog
+
+
+def all_pages(catalog, limit, **filters):
+    picks, cursor, pages = [], None, 0
+    while True:
+        page, cursor = catalog.query(limit=limit, cursor=cursor, **filters)
+        assert len(page) <= limit
+        picks += page
+        pages += 1
+        if cursor is None:
+            return picks, pages
+
+
+def expected_picks(catalog, stations=None, starttime=None, endtime=None, phase=None, min_confidence=None,
+                   analysis_id=None):
+    picks = list(catalog.iter_picks())
+    picks = [pick for pick in picks
+             if (stations is None or pick['station'] in stations)
+             and (starttime is None or pick['time'] >= starttime)
+             and (endtime is None or pick['time'] <= endtime)
+             and (phase is None or pick['phase'] == phase)
+             and (min_confidence is None or pick['confidence'] >= min_confidence)
+             and (analysis_id is None or pick['analysis_id'] == analysis_id)]
+    return sorted(picks, key=lambda pick: (pick['time'], pick['id']))
+
+
+@pytest.mark.parametrize('limit', [1, 7, 50, 1000])
+@pytest.mark.parametrize('filters', [
+    {},
+    {'stations': ['XX.A.', 'XX.C.']},
+    {'starttime': 10.0, 'endtime': 50.0, 'phase': 'S'},
+    {'min_confidence': 0.9},
+    {'analysis_id': 'analysis-1'},
+])
+def test_cursor_pagination(catalog, limit, filters):
+    expected = expected_picks(catalog, **filters)
+    picks, pages = all_pages(catalog, limit, **filters)
+    assert len(expected) > 0
+    assert [pick['id'] for pick in picks] == [pick['id'] for pick in expected]
+    assert pages == -(-len(expected) // limit)
+    assert catalog.count(**filters) == len(expected)
+
+
+def test_iter_picks_is_ordered(catalog):
+    keys = [(pick['time'], pick['id']) for pick in catalog.iter_picks(batch_size=13)]
+    assert keys == sorted(keys) and len(set(keys)) == len(keys) == catalog.stats()['picks']
+
+
+def test_record_replaces_same_analysis(catalog):
+    before = catalog.count(analysis_id='analysis-1')
+    catalog.record('analysis-1', 'XX.D.', 0.0, 100.0, [[100.0, [[200.0, 0.9]], [[400.0, 0.8]]],
+                                                       [300.0, [[300.0, 0.7]], [[np.nan, np.nan]]]])
+    assert catalog.count(analysis_id='analysis-1') == before == 3
+
+
+@pytest.mark.parametrize('cursor', ['', 'abc', '1.0', '1.0:x'])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
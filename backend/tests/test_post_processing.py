@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""向量化的 postprocesser_ev_center 与原来的逐个扫描实现一致"""
+
+import pytest
+
+from bench_post_processing import _reference_postprocesser, _same_matches, synthetic_confidence
+from post_processing import postprocesser_ev_center
+
+
+@pytest.mark.parametrize('length, seed', [(10000, 0), (100000, 1), (300000, 2)])
+@pytest.mark.parametrize('params', [
+    {},
+    {'det_th': 0.5, 'p_th': 0.1, 's_th': 0.1},
+    {'p_mpd': 1, 's_mpd': 50, 'ev_tolerance': 0, 'p_tolerance': 2000},
+])
+def test_matches_reference(length, seed, params):
+    yh1, yh2, yh3 = synthetic_confidence(length, event_spacing=8000, seed=seed)
+    expected = _reference_postprocesser(yh1, yh2, yh3, **params)
+    got = postprocesser_ev_center(yh1, yh2, yh3, **params)
+    assert len(expected) > 0
+    assert _same_matches(got, expected)
+
+
+def test_no_detection():
+    yh1, yh2, yh3 = synthetic_confidence(10000, seed=3)
+    assert len(postprocesser_ev_center(yh1 * 0, yh2, yh3)) == 0
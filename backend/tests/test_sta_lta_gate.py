@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""门控的窗口选择与逐窗口判断重叠的结果一致"""
+
+import numpy as np
+import pytest
+
+from sta_lta_gate import StaLtaGate
+
+
+def expected_mask(intervals, margin, window_length, step_size, num_windows):
+    """逐窗口判断 [i*step_size, i*step_size+window_length) 是否与某个 [lo-margin, hi+margin] 重叠"""
+    mask = np.zeros(num_windows, dtype=bool)
+    for i in range(num_windows):
+        start, end = i * step_size, i * step_size + window_length - 1
+        mask[i] = any(start <= hi + margin and end >= lo - margin for lo, hi in intervals)
+    return mask
+
+
+@pytest.mark.parametrize('window_length, step_size', [(10000, 3000), (1000, 1000), (1000, 1500), (500, 7)])
+@pytest.mark.parametrize('margin_seconds', [0.0, 0.01, 30.0])
+def test_window_mask_overlap(monkeypatch, window_length, step_size, margin_seconds):
+    rng = np.random.default_rng(window_length + step_size)
+    npts = 200000
+    num_windows = (npts - window_length) // step_size + 1
+    starts = np.sort(rng.integers(0, npts, size=20))
+    intervals = np.stack([starts, starts + rng.integers(0, 3000, size=20)], axis=1)
+    # 恰好落在窗口边界两侧的区间
+    edge = step_size * 5 + window_length
+    intervals = np.concatenate([intervals, [[edge - 1, edge - 1], [edge, edge], [0, 0], [npts - 1, npts + 100]]])
+
+    gate = StaLtaGate(margin_seconds=margin_seconds)
+    monkeypatch.setattr(gate, 'triggered_intervals', lambda waveform, sampling_rate: intervals)
+    mask = gate.window_mask(None, 100, window_length, step_size, num_windows)
+    margin = int(round(margin_seconds * 100))
+    np.testing.assert_array_equal(mask, expected_mask(intervals, margin, window_length, step_size, num_windows))
+
+
+def test_window_mask_on_waveform(waveform):
+    gate = StaLtaGate(margin_seconds=5.0)
+    num_windows = (waveform.shape[1] - 10000) // 3000 + 1
+    mask = gate.window_mask(waveform, 100, 10000, 3000, num_windows)
+    assert mask.shape == (num_windows,) and mask.dtype == bool
+    # LTA预热段之前的窗口总是运行
+    assert mask[0]
+    intervals = gate.triggered_intervals(waveform, 100)
+    np.testing.assert_array_equal(mask, expected_mask(intervals, 500, 10000, 3000, num_windows))
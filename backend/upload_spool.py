@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传文件的磁盘暂存
+
+multipart 表单中的文件在接收过程中直接逐块写入暂存目录中的临时文件，不在内存中保留整个文件:
+
+    * 收到文件开头的若干字节后立即检查格式 (MiniSEED/SAC/GSE2 或 zip/tar/gzip 压缩包)，
+      无法识别时立即拒绝，不再接收其余部分
+    * 单个文件超过大小上限时立即拒绝 (请求头中有 Content-Length 时，整个请求体的上限
+      由 Flask 的 MAX_CONTENT_LENGTH 在读取前检查)
+    * 写入的同时计算内容哈希 (与 result_cache.content_digest 相同)，不必再读一遍文件
+
+解码时直接从暂存文件路径读取 (ObsPy 读取 MiniSEED 文件路径时使用内存映射)。
+暂存文件在请求结束时删除，需要在请求之后继续使用 (异步任务、流式响应) 时先调用 detach()。
+"""
+
+import hashlib
+import io
+import os
+import struct
+import tempfile
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+# 格式检查需要的文件开头字节数 (SAC头的版本号位于第304字节，tar的标识位于第257字节)
+SNIFF_BYTES = 632
+
+
+def sniff_format(head):
+    """
+    根据文件开头的字节判断格式
+
+    Args:
+        head: 文件开头的字节 (文件较短时为整个文件)
+
+    Returns:
+        格式名称 (MSEED/SAC/GSE2/ZIP/TAR/GZIP/BZIP2/XZ)，无法识别时返回None
+    """
+    if head[:4] in (b'PK\x03\x04', b'PK\x05\x06'):
+        return 'ZIP'
+    if head[:2] == b'\x1f\x8b':
+        return 'GZIP'
+    if head[:3] == b'BZh':
+        return 'BZIP2'
+    if head[:6] == b'\xfd7zXZ\x00':
+        return 'XZ'
+    if head[257:262] == b'ustar':
+        return 'TAR'
+    # MiniSEED 2: 6位序号 (数字、空格或\0) + 数据质量标识 + 保留字节
+    if (len(head) >= 8 and all(c in b'0123456789 \x00' for c in head[:6])
+            and head[6:7] in (b'D', b'R', b'Q', b'M') and head[7:8] in (b' ', b'\x00')):
+        return 'MSEED'
+    if head[:2] == b'MS' and head[2:3] == b'\x03':
+        return 'MSEED'
+    # SAC 二进制: 头段版本号 nvhdr (第304字节的int32) 为6或7，字节序任意
+    if len(head) >= 308:
+        for byteorder in '<>':
+            if struct.unpack(f'{byteorder}i', head[304:308])[0] in (6, 7):
+                return 'SAC'
+    if head.lstrip()[:4] in (b'WID2', b'BEGI', b'DATA'):
+        return 'GSE2'
+    return None
+
+
+class UploadRejected(UnsupportedMediaType):
+    """上传文件的格式无法识别"""
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    """上传文件超过大小上限"""
+
+
+class SpoolFile(io.FileIO):
+    """
+    暂存目录中的上传文件，写入时检查格式和大小并计算哈希，关闭时删除 (除非已detach)
+    """
+
+    def __init__(self, spool_dir, filename=None, max_bytes=None, check_format=True):
+        """
+        Args:
+            spool_dir: 暂存目录
+            filename: 上传的文件名，用于保留扩展名
+            max_bytes: 大小上限 (字节)，None表示不限
+            check_format: 是否检查格式
+        """
+        suffix = os.path.splitext(filename or '')[1][:16]
+        fd, self.path = tempfile.mkstemp(suffix=suffix, dir=spool_dir)
+        os.close(fd)
+        super().__init__(self.path, 'w+b')
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.format = None
+        self.detached = False
+        self._hasher = hashlib.sha256()
+        self._head = b'' if check_format else None
+
+    def write(self, b):
+        self.size += len(b)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise UploadTooLarge(f"文件 {self.filename} 超过大小上限 {self.max_bytes // (1024 * 1024)} MB")
+        if self._head is not None:
+            self._head += bytes(b[:SNIFF_BYTES - len(self._head)])
+            if len(self._head) >= SNIFF_BYTES:
+                self._check()
+        self._hasher.update(b)
+        return super().write(b)
+
+    def seek(self, *args):
+        # 接收完成后表单解析器会回到开头，文件短于 SNIFF_BYTES 时在此检查
+        if self._head is not None:
+            self._check()
+        return super().seek(*args)
+
+    def _check(self):
+        head, self._head = self._head, None
+        self.format = sniff_format(head)
+        if self.format is None:
+            raise UploadRejected(f"无法识别文件 {self.filename} 的格式，支持 MiniSEED/SAC/GSE2 及其 zip/tar 压缩包")
+
+    @property
+    def digest(self):
+        """已接收内容的SHA-256 (十六进制)"""
+        return self._hasher.hexdigest()
+
+    def detach(self):
+        """
+        请求结束后保留暂存文件，之后由调用方负责删除
+
+        Returns:
+            暂存文件路径
+        """
+        self.detached = True
+        return self.path
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        if not self.detached:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def spooled(file):
+    """
+    取得表单文件 (werkzeug FileStorage) 的暂存文件
+
+    Returns:
+        SpoolFile，文件不是由 SpoolingRequest 接收时返回None
+    """
+    stream = getattr(file, 'stream', None)
+    return stream if isinstance(stream, SpoolFile) else None
+
+
+def make_request_class(spool_dir, max_bytes=None, check_format=True):
+    """
+    生成把上传文件暂存到磁盘的 Flask Request 类 (用于 app.request_class)
+
+    Args:
+        spool_dir: 暂存目录
+        max_bytes: 单个文件的大小上限 (字节)，None表示不限
+        check_format: 是否在接收开头部分后检查格式
+    """
+    os.makedirs(spool_dir, exist_ok=True)
+
+    class SpoolingRequest(Request):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            return SpoolFile(spool_dir, filename, max_bytes=max_bytes, check_format=check_format)
+
+    return SpoolingRequest
@@ -0,0 +1,637 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+USGS 地震目录 (GeoJSON summary feed) 的缓存代理
+
+前端的实时地震地图和首页仪表盘原本在每个浏览器中各自下载完整的 USGS feed 并逐条筛选、统计。
+这里由后端定时拉取，各客户端共用同一份数据:
+
+    * 条件请求 (If-None-Match / If-Modified-Since)，feed 未变化时 USGS 返回304，不重复下载；
+      拉取到的内容和校验信息保存在缓存目录，多个工作进程共享，间隔内只有一个进程访问上游
+    * 每次更新后把 feed 解析为数组 (震级、时间、更新时间、经纬度、Web墨卡托坐标)，
+      预先计算统计信息 (与前端 calculateStats / calculateDashboardStats 的字段相同)，
+      震级和时间筛选、范围筛选都是数组运算
+    * 地图标记按缩放级别在墨卡托像素网格中聚合 (CLUSTER_CELL_PIXELS 像素一格)，
+      格子与 256 像素的瓦片对齐，同一缩放级别的聚合结果在瓦片之间一致；
+      未加筛选时每个缩放级别的结果只计算一次
+    * 增量更新: 客户端传入上次得到的版本 (feed 的生成时间，毫秒)，只返回之后新增或修改的地震
+      (USGS 的 updated 字段) 以及从 feed 中消失的地震ID
+
+数据源可以是 http(s) 地址，也可以是本地文件 (离线时的替代，按修改时间和大小判断是否变化)。
+
+用法 (离线测试):
+    # 生成模拟的 feed 文件，之后每次 --update 追加新地震、修改和删除已有地震
+    python usgs_feed.py synthetic /tmp/all_day.geojson --count 300
+    python usgs_feed.py synthetic /tmp/all_day.geojson --count 5 --update
+    # 后端使用本地文件
+    DITING_USGS_FEEDS=all_day=/tmp/all_day.geojson python app.py
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 前端使用的 feed
+DEFAULT_FEEDS = {
+    'all_day': 'https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_day.geojson',
+    '2.5_day': 'https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/2.5_day.geojson',
+}
+# 地图图例的震级分档 (与 RealtimeEarthquakeMap 的 calculateStats 一致)
+MAP_MAGNITUDE_EDGES = (3, 5, 6, 7)
+MAP_MAGNITUDE_LABELS = ('< 3', '3-5', '5-6', '6-7', '>= 7')
+# 仪表盘饼图的震级分档 (与 Welcome 一致)
+DASHBOARD_MAGNITUDE_EDGES = (4, 5, 6)
+DASHBOARD_MAGNITUDE_LABELS = ('M 2.5-4', 'M 4-5', 'M 5-6', 'M 6+')
+UNKNOWN_LABEL = '未知'
+
+TILE_SIZE = 256
+# 聚合格子的边长 (像素)，需整除 TILE_SIZE
+CLUSTER_CELL_PIXELS = 64
+MAX_ZOOM = 20
+# Web墨卡托的纬度范围
+MAX_MERCATOR_LAT = 85.05112878
+# 保留的版本变化数，更早的 since 返回全部地震
+DELTA_HISTORY = 1440
+
+
+def parse_feeds(spec):
+    """
+    解析 feed 配置
+
+    Args:
+        spec: "名称=地址或本地路径,..."，为空时使用 DEFAULT_FEEDS
+
+    Returns:
+        {名称: 数据源}
+
+    Raises:
+        ValueError: 配置格式错误
+    """
+    if not spec or not spec.strip():
+        return dict(DEFAULT_FEEDS)
+    feeds = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        name, sep, source = item.partition('=')
+        name, source = name.strip(), source.strip()
+        if not sep or not source or not re.fullmatch(r'[A-Za-z0-9._-]+', name):
+            raise ValueError(f"无效的 feed 配置: {item!r}，格式为 名称=地址或本地路径")
+        feeds[name] = source
+    return feeds
+
+
+def fetch_feed(source, validators=None, timeout=30):
+    """
+    条件请求拉取 feed
+
+    Args:
+        source: http(s) 地址或本地文件路径 (可带 file:// 前缀，.gz 结尾时按gzip解压)
+        validators: 上次返回的校验信息 {'etag', 'last_modified'}
+        timeout: 超时 (秒)
+
+    Returns:
+        (内容bytes，未变化时为None, 新的校验信息)
+    """
+    validators = validators or {}
+    if source.startswith(('http://', 'https://')):
+        headers = {'Accept-Encoding': 'gzip', 'User-Agent': 'DiTing-backend'}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        try:
+            with urllib.request.urlopen(urllib.request.Request(source, headers=headers), timeout=timeout) as resp:
+                body = resp.read()
+                if resp.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                return body, {'etag': resp.headers.get('ETag'), 'last_modified': resp.headers.get('Last-Modified')}
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None, validators
+            raise
+
+    path = source[len('file://'):] if source.startswith('file://') else source
+    st = os.stat(path)
+    token = f'{st.st_mtime_ns}-{st.st_size}'
+    if validators.get('etag') == token:
+        return None, validators
+    with open(path, 'rb') as f:
+        body = f.read()
+    if path.endswith('.gz'):
+        body = gzip.decompress(body)
+    return body, {'etag': token}
+
+
+def mercator(lat, lng):
+    """经纬度转换为归一化的Web墨卡托坐标 (x, y)，范围 [0, 1)，y 向南增大"""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    x = (np.asarray(lng, dtype=np.float64) + 180.0) / 360.0
+    y = 0.5 - np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) / (2 * np.pi)
+    return np.clip(x, 0.0, np.nextafter(1.0, 0)), np.clip(y, 0.0, np.nextafter(1.0, 0))
+
+
+def inverse_mercator(x, y):
+    """归一化的Web墨卡托坐标转换为 (纬度, 经度)"""
+    lat = np.degrees(2 * np.arctan(np.exp((0.5 - np.asarray(y)) * 2 * np.pi)) - np.pi / 2)
+    return lat, np.asarray(x) * 360.0 - 180.0
+
+
+def _bucket_counts(mag, edges, labels):
+    counts = np.bincount(np.searchsorted(edges, mag, side='right'), minlength=len(labels))
+    return {label: int(n) for label, n in zip(labels, counts)}
+
+
+def magnitude_stats(mag):
+    """
+    震级统计，字段与前端的 EarthquakeStats 相同
+
+    Args:
+        mag: 震级数组，未知震级为NaN
+    """
+    known = mag[~np.isnan(mag)]
+    unknown = int(mag.size - known.size)
+    count_by_magnitude = _bucket_counts(known, MAP_MAGNITUDE_EDGES, MAP_MAGNITUDE_LABELS)
+    count_by_magnitude[UNKNOWN_LABEL] = unknown
+    distribution = _bucket_counts(known, DASHBOARD_MAGNITUDE_EDGES, DASHBOARD_MAGNITUDE_LABELS)
+    distribution[UNKNOWN_LABEL] = unknown
+    return {
+        'totalCount': int(mag.size),
+        'maxMagnitude': float(known.max()) if known.size else None,
+        'minMagnitude': float(known.min()) if known.size else None,
+        'avgMagnitude': float(known.mean()) if known.size else None,
+        'countByMagnitude': count_by_magnitude,
+        'countM5Plus': int((known >= 5).sum()),
+        'countM6Plus': int((known >= 6).sum()),
+        'magnitudeDistribution': distribution,
+    }
+
+
+def _float_array(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+class FeedSnapshot:
+    """
+    一次拉取得到的 feed，解析为按列存放的数组 (只读)
+    """
+
+    def __init__(self, body, fetched_at=None):
+        """
+        Args:
+            body: GeoJSON 内容 (bytes)
+            fetched_at: 拉取时间 (UTC时间戳)
+
+        Raises:
+            ValueError: 内容不是 GeoJSON FeatureCollection
+        """
+        data = json.loads(body)
+        if not isinstance(data, dict) or not isinstance(data.get('features'), list):
+            raise ValueError("feed 内容不是 GeoJSON FeatureCollection")
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.metadata = data.get('metadata') or {}
+        self.features = data['features']
+        props = [f.get('properties') or {} for f in self.features]
+        coords = [((f.get('geometry') or {}).get('coordinates') or [None, None, None]) + [None] * 3
+                  for f in self.features]
+        self.ids = [f.get('id') for f in self.features]
+        self.index_of = {fid: i for i, fid in enumerate(self.ids)}
+        self.mag = _float_array([p.get('mag') for p in props])
+        self.time = _float_array([p.get('time') for p in props])
+        updated = _float_array([p.get('updated') for p in props])
+        self.updated = np.where(np.isnan(updated), self.time, updated)
+        self.lng = _float_array([c[0] for c in coords])
+        self.lat = _float_array([c[1] for c in coords])
+        self.x, self.y = mercator(np.nan_to_num(self.lat), np.nan_to_num(self.lng))
+        # 版本: feed 的生成时间，没有时用最近的更新时间或拉取时间 (毫秒)
+        generated = self.metadata.get('generated')
+        if generated is None:
+            generated = np.nanmax(self.updated) if self.features and not np.all(np.isnan(self.updated)) \
+                else self.fetched_at * 1000
+        self.version = int(generated)
+        self.stats = dict(magnitude_stats(self.mag), lastUpdated=self.metadata.get('generated'),
+                          dataSourceTitle=self.metadata.get('title'), version=self.version)
+        self._markers = {}
+
+    def __len__(self):
+        return len(self.features)
+
+    def select(self, min_mag=None, max_mag=None, starttime=None, endtime=None, bbox=None, tile=None, since=None):
+        """
+        筛选地震，规则与前端相同: 未知震级不受震级条件限制，未知时间不受时间条件限制
+
+        Args:
+            min_mag, max_mag: 震级范围 (含两端)
+            starttime, endtime: 时间范围 (UTC毫秒，含两端)
+            bbox: (west, south, east, north)，west > east 时跨越180度经线
+            tile: (z, x, y) 瓦片
+            since: 只保留更新时间晚于此版本 (毫秒) 的地震
+
+        Returns:
+            符合条件的地震的下标数组
+        """
+        mask = np.ones(len(self.features), dtype=bool)
+        if min_mag is not None:
+            mask &= ~(self.mag < min_mag)
+        if max_mag is not None:
+            mask &= ~(self.mag > max_mag)
+        if starttime is not None:
+            mask &= ~(self.time < starttime)
+        if endtime is not None:
+            mask &= ~(self.time > endtime)
+        if bbox is not None:
+            mask &= _in_bbox(self.lat, self.lng, bbox)
+        if tile is not None:
+            z, tx, ty = tile
+            n = 2 ** z
+            mask &= (np.floor(self.x * n) == tx) & (np.floor(self.y * n) == ty)
+        if since is not None:
+            mask &= self.updated > since
+        return np.flatnonzero(mask)
+
+    def markers(self, zoom, index=None):
+        """
+        按缩放级别聚合的地图标记
+
+        Args:
+            zoom: 缩放级别 (0-MAX_ZOOM)
+            index: 参与聚合的地震下标，None表示全部 (结果按缩放级别缓存)
+
+        Returns:
+            Markers
+        """
+        if index is None:
+            markers = self._markers.get(zoom)
+            if markers is None:
+                markers = self._markers[zoom] = cluster_markers(self, np.arange(len(self.features)), zoom)
+            return markers
+        return cluster_markers(self, index, zoom)
+
+
+def _in_bbox(lat, lng, bbox):
+    west, south, east, north = bbox
+    in_lat = (lat >= south) & (lat <= north)
+    if west <= east:
+        return in_lat & (lng >= west) & (lng <= east)
+    return in_lat & ((lng >= west) | (lng <= east))
+
+
+class Markers:
+    """聚合后的地图标记，以及用于按范围、瓦片筛选的坐标数组"""
+
+    def __init__(self, items, lat, lng, x, y):
+        self.items = items
+        self.lat, self.lng, self.x, self.y = lat, lng, x, y
+
+    def select(self, bbox=None, tile=None):
+        """
+        按标记位置筛选 (聚合格子与瓦片对齐，按瓦片筛选的结果与在瓦片内聚合相同)
+
+        Returns:
+            标记列表
+        """
+        mask = np.ones(len(self.items), dtype=bool)
+        if bbox is not None:
+            mask &= _in_bbox(self.lat, self.lng, bbox)
+        if tile is not None:
+            z, tx, ty = tile
+            n = 2 ** z
+            mask &= (np.floor(self.x * n) == tx) & (np.floor(self.y * n) == ty)
+        return [self.items[i] for i in np.flatnonzero(mask)]
+
+
+def cluster_markers(snapshot, index, zoom, cell_pixels=CLUSTER_CELL_PIXELS):
+    """
+    在缩放级别 zoom 的墨卡托像素网格中聚合地震
+
+    同一格子中只有一个地震时输出该地震 ({"type": "quake", "lat", "lng", "feature"})，
+    否则输出聚合点 ({"type": "cluster", "count", "lat", "lng", "maxMagnitude", "bbox"})，
+    聚合点位置为格子内地震的墨卡托坐标平均值，bbox 为 [west, south, east, north]
+
+    Args:
+        snapshot: FeedSnapshot
+        index: 参与聚合的地震下标
+        zoom: 缩放级别
+        cell_pixels: 格子边长 (像素)
+
+    Returns:
+        Markers
+    """
+    index = np.asarray(index, dtype=np.int64)
+    index = index[~np.isnan(snapshot.lat[index]) & ~np.isnan(snapshot.lng[index])]
+    if index.size == 0:
+        empty = np.zeros(0)
+        return Markers([], empty, empty, empty, empty)
+    cells = TILE_SIZE * 2 ** zoom // cell_pixels
+    x, y = snapshot.x[index], snapshot.y[index]
+    keys = np.floor(x * cells).astype(np.int64) * cells + np.floor(y * cells).astype(np.int64)
+    order = np.argsort(keys, kind='stable')
+    keys, index, x, y = keys[order], index[order], x[order], y[order]
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    counts = np.diff(np.append(starts, keys.size))
+    mx = np.add.reduceat(x, starts) / counts
+    my = np.add.reduceat(y, starts) / counts
+    lat, lng = inverse_mercator(mx, my)
+    member_lat, member_lng = snapshot.lat[index], snapshot.lng[index]
+    south, north = np.minimum.reduceat(member_lat, starts), np.maximum.reduceat(member_lat, starts)
+    west, east = np.minimum.reduceat(member_lng, starts), np.maximum.reduceat(member_lng, starts)
+    max_mag = np.fmax.reduceat(snapshot.mag[index], starts)
+
+    items = []
+    for k, start in enumerate(starts):
+        if counts[k] == 1:
+            i = int(index[start])
+            items.append({'type': 'quake', 'lat': float(member_lat[start]), 'lng': float(member_lng[start]),
+                          'feature': snapshot.features[i]})
+        else:
+            items.append({'type': 'cluster', 'count': int(counts[k]),
+                          'lat': float(lat[k]), 'lng': float(lng[k]),
+                          'maxMagnitude': None if np.isnan(max_mag[k]) else float(max_mag[k]),
+                          'bbox': [float(west[k]), float(south[k]), float(east[k]), float(north[k])]})
+    return Markers(items, lat, lng, mx, my)
+
+
+class FeedCache:
+    """
+    一个 feed 的缓存: 定时条件请求上游，保存最新的 FeedSnapshot 和最近的版本变化
+    """
+
+    def __init__(self, name, source, poll_seconds=60.0, store_dir=None, timeout=30):
+        """
+        Args:
+            name: feed 名称
+            source: http(s) 地址或本地文件路径
+            poll_seconds: 拉取间隔 (秒)
+            store_dir: 共享缓存目录，多个工作进程共用拉取结果，None表示不共享
+            timeout: 请求超时 (秒)
+        """
+        self.name = name
+        self.source = source
+        self.poll_seconds = poll_seconds
+        self.timeout = timeout
+        self.snapshot = None
+        self.validators = {}
+        self.last_checked = None
+        self.last_error = None
+        self.fetches = 0
+        self.not_modified = 0
+        self._digest = None
+        # 各次版本变化: (上一版本, 新版本, 消失的地震ID)
+        self._changes = deque(maxlen=DELTA_HISTORY)
+        self._first_version = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if store_dir is not None:
+            os.makedirs(store_dir, exist_ok=True)
+            self._body_path = os.path.join(store_dir, f'{name}.geojson')
+            self._meta_path = os.path.join(store_dir, f'{name}.json')
+        else:
+            self._body_path = self._meta_path = None
+
+    def _read_shared(self):
+        """共享缓存中的 (校验信息, 内容)，没有时返回 (None, None)"""
+        if self._meta_path is None:
+            return None, None
+        try:
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(self._body_path, 'rb') as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None, None
+
+    def _write_shared(self, body=None):
+        if self._meta_path is None:
+            return
+        suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        if body is not None:
+            with open(self._body_path + suffix, 'wb') as f:
+                f.write(body)
+            os.replace(self._body_path + suffix, self._body_path)
+        with open(self._meta_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump({'validators': self.validators, 'checked_at': self.last_checked}, f)
+        os.replace(self._meta_path + suffix, self._meta_path)
+
+    def _install(self, body, fetched_at):
+        """解析新内容，内容未变化时返回False"""
+        digest = hashlib.sha256(body).hexdigest()
+        if digest == self._digest:
+            return False
+        snapshot = FeedSnapshot(body, fetched_at)
+        previous = self.snapshot
+        if previous is None:
+            self._first_version = snapshot.version
+        elif snapshot.version != previous.version:
+            removed = frozenset(previous.index_of) - frozenset(snapshot.index_of)
+            self._changes.append((previous.version, snapshot.version, removed))
+        self.snapshot = snapshot
+        self._digest = digest
+        return True
+
+    def refresh(self, force=False):
+        """
+        检查更新: 其他工作进程在拉取间隔内已经拉取过时使用共享缓存，否则条件请求上游
+
+        Args:
+            force: 忽略拉取间隔，直接请求上游
+
+        Returns:
+            数据是否有变化
+
+        Raises:
+            上游请求失败或内容无法解析时的异常 (保留原有数据)
+        """
+        with self._refresh_lock:
+            changed = False
+            meta, body = self._read_shared()
+            if meta is not None:
+                if body is not None and self._install(body, meta.get('checked_at')):
+                    self.validators = meta.get('validators') or {}
+                    changed = True
+                if not force and meta.get('checked_at') and time.time() - meta['checked_at'] < self.poll_seconds:
+                    self.last_checked = meta['checked_at']
+                    return changed
+            try:
+                body, validators = fetch_feed(self.source, self.validators, timeout=self.timeout)
+                self.last_checked = time.time()
+                self.fetches += 1
+                if body is None:
+                    self.not_modified += 1
+                else:
+                    changed = self._install(body, self.last_checked) or changed
+                self.validators = validators
+                self._write_shared(body)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            return changed
+
+    def ensure_loaded(self):
+        """
+        首次使用时同步拉取
+
+        Returns:
+            FeedSnapshot
+
+        Raises:
+            拉取失败时的异常
+        """
+        if self.snapshot is None:
+            self.refresh()
+        return self.snapshot
+
+    def delta(self, since):
+        """
+        版本 since 之后的变化
+
+        Args:
+            since: 客户端上次得到的版本 (毫秒)
+
+        Returns:
+            (FeedSnapshot, 变化的地震下标数组或None (None表示变化记录不完整，需要全部地震), 消失的地震ID集合)
+        """
+        snapshot = self.snapshot
+        changes = list(self._changes)
+        oldest = changes[0][0] if changes else self._first_version
+        if oldest is None or since < oldest:
+            return snapshot, None, set()
+        removed = set()
+        for previous, version, ids in changes:
+            if version > since:
+                removed |= ids
+        removed -= set(snapshot.index_of)
+        return snapshot, snapshot.select(since=since), removed
+
+    def status(self):
+        snapshot = self.snapshot
+        return {
+            'name': self.name,
+            'source': self.source,
+            'loaded': snapshot is not None,
+            'version': snapshot.version if snapshot else None,
+            'count': len(snapshot) if snapshot else 0,
+            'title': snapshot.metadata.get('title') if snapshot else None,
+            'last_checked': self.last_checked,
+            'fetches': self.fetches,
+            'not_modified': self.not_modified,
+            'poll_seconds': self.poll_seconds,
+            'last_error': self.last_error,
+        }
+
+    def start(self):
+        """启动后台定时拉取线程"""
+        if self._thread is not None or self.poll_seconds <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name=f'usgs-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.refresh():
+                    logger.info(f"USGS feed {self.name} 已更新: {len(self.snapshot)} 个地震，版本 {self.snapshot.version}")
+            except Exception as e:
+                logger.warning(f"拉取 USGS feed {self.name} 失败: {str(e)}")
+            self._stop.wait(self.poll_seconds)
+
+
+def synthetic_feed(count, now_ms, rng, start_id=0, window_ms=86400000):
+    """生成模拟的地震 (GeoJSON Feature 列表)，时间在 [now_ms - window_ms, now_ms] 内"""
+    features = []
+    for k in range(count):
+        event_time = int(now_ms - rng.random() * window_ms)
+        mag = None if rng.random() < 0.02 else round(float(min(rng.exponential(1.0) + 0.5, 8.5)), 2)
+        lat, lng = float(rng.uniform(-60, 70)), float(rng.uniform(-180, 180))
+        features.append({
+            'type': 'Feature',
+            'id': f'sim{start_id + k:08d}',
+            'properties': {'mag': mag, 'place': f'模拟地震 {start_id + k}', 'time': event_time,
+                           'updated': min(event_time + int(rng.integers(60000, 600000)), now_ms), 'status': 'automatic',
+                           'tsunami': 0, 'sig': 0, 'net': 'sim', 'magType': 'ml', 'type': 'earthquake',
+                           'title': f'M {mag} - 模拟地震 {start_id + k}'},
+            'geometry': {'type': 'Point', 'coordinates': [lng, lat, round(float(rng.uniform(0, 100)), 2)]},
+        })
+    return features
+
+
+def main():
+    parser = argparse.ArgumentParser(description='USGS feed 缓存代理的离线测试工具')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    s = sub.add_parser('synthetic', help='生成或更新模拟的 feed 文件')
+    s.add_argument('output', help='输出的 GeoJSON 文件')
+    s.add_argument('--count', type=int, default=300, help='生成 (或 --update 时追加) 的地震数')
+    s.add_argument('--update', action='store_true', help='在已有文件上追加地震，并修改、删除已有地震各一个')
+    s.add_argument('--seed', type=int, default=None, help='随机种子')
+
+    p = sub.add_parser('poll', help='按间隔拉取并打印变化')
+    p.add_argument('source', help='http(s) 地址或本地文件')
+    p.add_argument('--interval', type=float, default=60.0, help='拉取间隔 (秒)')
+    args = parser.parse_args()
+
+    if args.command == 'synthetic':
+        rng = np.random.default_rng(args.seed)
+        now_ms = int(time.time() * 1000)
+        if args.update and os.path.exists(args.output):
+            with open(args.output, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            features = data['features']
+            next_id = max((int(f['id'][3:]) for f in features), default=-1) + 1
+            if features:
+                features.pop(int(rng.integers(len(features))))
+            if features:
+                revised = features[int(rng.integers(len(features)))]['properties']
+                revised['mag'] = round(float(rng.uniform(2, 6)), 2)
+                revised['updated'] = now_ms
+                revised['status'] = 'reviewed'
+            features += synthetic_feed(args.count, now_ms, rng, start_id=next_id, window_ms=60000)
+        else:
+            features = synthetic_feed(args.count, now_ms, rng)
+        features.sort(key=lambda f: f['properties']['time'], reverse=True)
+        data = {'type': 'FeatureCollection',
+                'metadata': {'generated': now_ms, 'url': args.output, 'title': '模拟地震目录 (离线)',
+                             'status': 200, 'api': '1.10.3', 'count': len(features)},
+                'features': features}
+        tmp = f'{args.output}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, args.output)
+        print(f"已写入 {args.output}: {len(features)} 个地震，版本 {now_ms}")
+        return
+
+    cache = FeedCache('poll', args.source, poll_seconds=args.interval)
+    while True:
+        t0 = time.perf_counter()
+        version = cache.snapshot.version if cache.snapshot else None
+        changed = cache.refresh(force=True)
+        elapsed = (time.perf_counter() - t0) * 1000
+        if changed and version is not None:
+            _, index, removed = cache.delta(version)
+            print(f"版本 {cache.snapshot.version}: {len(cache.snapshot)} 个地震，"
+                  f"变化 {len(index)}，消失 {len(removed)}，耗时 {elapsed:.0f} ms")
+        else:
+            print(f"{'已加载' if changed else '未变化'}: {len(cache.snapshot)} 个地震，"
+                  f"版本 {cache.snapshot.version}，耗时 {elapsed:.0f} ms")
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+三分量波形组装
+
+把 ObsPy Stream 中 *HZ/*HN/*HE 三个分量组装为模型输入用的 float32 数组 [3, n] (Z/N/E 顺序)。
+同一分量可以有多个数据段 (有间断或重叠的文件)，三个分量的起止时间和长度可以不同:
+
+    * 三个分量对齐到最早的起始时间，按最近的采样点放置各数据段，
+      间断和各分量首尾缺失的部分填充 fill_value，重叠部分以较晚开始的数据段为准
+    * 采样率与模型采样率不同的数据段用多相滤波 (scipy.signal.resample_poly) 重采样，
+      不修改传入的 Stream。滤波器只涉及邻近的采样点，分块读取时两端多读一小段，
+      结果与整体读取一致
+
+不需要重采样的数据段只在写入输出数组时转换一次类型，除此之外不产生与记录等长的中间数组。
+
+只组装一个台站: Stream 中有多个台站时取第一个三分量齐全的台站 (见select_station)，
+不同台站的数据不会拼接到同一个分量中。
+
+间断全部填充，因此在分配数组之前检查 (见set_limits): 数据段之间 (含各分量之间) 的间断超过
+max_gap_seconds，或在内存中组装的长度超过 max_seconds 时抛出 WaveformSpanError，
+避免很小的文件 (如相隔数年的两段数据) 展开成上百GB的数组。
+"""
+
+from fractions import Fraction
+
+import numpy as np
+
+CHANNELS = ('*HZ', '*HN', '*HE')
+# DiTing 模型的输入采样率 (Hz)
+MODEL_SAMPLING_RATE = 100.0
+# 允许填充的最长间断 (秒) 和整体组装的最长时长 (秒)，None表示不限制，见set_limits
+_limits = {'max_gap_seconds': 3600.0, 'max_seconds': 2 * 86400.0}
+
+
+class WaveformSpanError(ValueError):
+    """间断过长或组装后的波形过长"""
+
+
+def set_limits(max_gap_seconds=3600.0, max_seconds=2 * 86400.0):
+    """
+    设置间断和组装长度的上限
+
+    Args:
+        max_gap_seconds: 允许填充的最长间断 (秒)，None表示不限制
+        max_seconds: 在内存中或存储中整体组装的最长时长 (秒)，None表示不限制；
+            分块读取 (WaveformChunkReader) 不受此限制
+    """
+    _limits.update(max_gap_seconds=max_gap_seconds, max_seconds=max_seconds)
+
+
+def check_length(npts, sampling_rate=MODEL_SAMPLING_RATE):
+    """
+    检查整体组装的长度，在分配数组之前调用
+
+    Raises:
+        WaveformSpanError: 超过 set_limits 设置的 max_seconds
+    """
+    max_seconds = _limits['max_seconds']
+    if max_seconds is not None and npts > max_seconds * sampling_rate + 1:
+        raise WaveformSpanError(f"波形时长 {npts / sampling_rate:.0f} 秒超过上限 {max_seconds:.0f} 秒")
+
+
+def _resample_ratio(trace, sampling_rate):
+    """重采样比例 up/down，采样率相同时返回None"""
+    if abs(trace.stats.sampling_rate - sampling_rate) <= 1e-6 * sampling_rate:
+        return None
+    return Fraction(sampling_rate / trace.stats.sampling_rate).limit_denominator(1000)
+
+
+def _resampled_npts(npts, ratio):
+    # 与 resample_poly 的输出长度相同: ceil(npts * up / down)
+    return -(-npts * ratio.numerator // ratio.denominator)
+
+
+def select_station(stream, station=None):
+    """
+    取出一个台站的数据
+
+    Args:
+        stream: ObsPy Stream对象 (可包含多个台站)
+        station: 台站标识 (网络.台站.位置码)，None表示第一个 *HZ/*HN/*HE 三分量齐全的台站
+
+    Returns:
+        只包含该台站的Stream (指定的台站不存在时为空)；只有一个台站时直接返回传入的Stream
+
+    Raises:
+        ValueError: 有多个台站但没有三分量齐全的台站 (未指定station时)
+    """
+    from multi_station import group_by_station, station_id
+
+    ids = {station_id(tr) for ch in CHANNELS for tr in stream.select(channel=ch)}
+    if station is not None:
+        if ids == {station}:
+            return stream
+        network, sta, location = station.split('.')
+        return stream.select(network=network, station=sta, location=location)
+    if len(ids) <= 1:
+        return stream
+    stations, skipped = group_by_station(stream)
+    if not stations:
+        reasons = '; '.join(f"{sid}: {reason}" for sid, reason in skipped.items())
+        raise ValueError(f"数据包含 {len(ids)} 个台站，但没有三分量齐全的台站 ({reasons})")
+    return next(iter(stations.values()))
+
+
+def _component_segments(stream, sampling_rate, fill_value, require_all=True):
+    """按 Z/N/E 顺序取出各分量的数据段 [(起始时间, 数据)]，采样率不同的数据段重采样为 sampling_rate"""
+    components = []
+    for ch in CHANNELS:
+        traces = stream.select(channel=ch)
+        if not traces and require_all:
+            raise ValueError(f"缺少通道: {ch}")
+        segments = []
+        for tr in traces:
+            data = tr.data
+            if isinstance(data, np.ma.MaskedArray):
+                data = data.filled(fill_value)
+            ratio = _resample_ratio(tr, sampling_rate)
+            if ratio is not None:
+                from scipy.signal import resample_poly
+                data = resample_poly(np.asarray(data, dtype=np.float64), ratio.numerator, ratio.denominator)
+            segments.append((tr.stats.starttime, data))
+        components.append(sorted(segments, key=lambda segment: segment[0]))
+    return components
+
+
+def waveform_starttime(stream):
+    """
+    组装后波形第一个采样点的时间 (三个分量中最早的起始时间)，只读取头信息
+
+    Args:
+        stream: ObsPy Stream对象，有多个台站时取 select_station 选出的台站
+
+    Returns:
+        UTCDateTime
+    """
+    stream = select_station(stream)
+    traces = [tr for ch in CHANNELS for tr in stream.select(channel=ch)]
+    if not traces:
+        raise ValueError("没有找到 *HZ/*HN/*HE 通道")
+    return min(tr.stats.starttime for tr in traces)
+
+
+def waveform_npts(stream, sampling_rate=MODEL_SAMPLING_RATE, starttime=None):
+    """
+    组装后波形的长度 (到三个分量中最晚的结束时间为止)，只读取头信息
+
+    Args:
+        stream: ObsPy Stream对象 (可以是 headonly 读取的)，有多个台站时取 select_station 选出的台站
+        sampling_rate: 输出采样率 (Hz)
+        starttime: 输出第一个采样点的时间，None表示 waveform_starttime(stream)
+
+    Returns:
+        采样点数
+
+    Raises:
+        WaveformSpanError: 数据段之间的间断超过 set_limits 设置的 max_gap_seconds
+    """
+    stream = select_station(stream)
+    if starttime is None:
+        starttime = waveform_starttime(stream)
+    spans = []
+    for ch in CHANNELS:
+        for tr in stream.select(channel=ch):
+            ratio = _resample_ratio(tr, sampling_rate)
+            npts = tr.stats.npts if ratio is None else _resampled_npts(tr.stats.npts, ratio)
+            spans.append((tr.stats.starttime, tr.stats.starttime + (npts - 1) / sampling_rate))
+    spans.sort(key=lambda span: span[0])
+    # 按起始时间扫描所有分量的数据段，覆盖范围之间的空白即为需要填充的间断
+    max_gap = _limits['max_gap_seconds']
+    endtime = spans[0][1]
+    for start, end in spans[1:]:
+        if max_gap is not None and start - endtime > max_gap:
+            raise WaveformSpanError(f"数据在 {endtime} 之后间断 {start - endtime:.0f} 秒，超过上限 {max_gap:.0f} 秒，"
+                                    f"请分别上传间断前后的数据")
+        endtime = max(endtime, end)
+    return int(round((endtime - starttime) * sampling_rate)) + 1
+
+
+def assemble_waveform(stream, sampling_rate=MODEL_SAMPLING_RATE, starttime=None, npts=None, fill_value=0,
+                      require_all=True, out=None):
+    """
+    组装三分量波形
+
+    Args:
+        stream: ObsPy Stream对象，有多个台站时只组装 select_station 选出的台站
+        sampling_rate: 输出采样率 (Hz)
+        starttime: 输出第一个采样点的时间，None表示三个分量中最早的起始时间
+        npts: 输出长度，None表示到三个分量中最晚的结束时间为止；
+            与starttime一起给出时可按固定的时间网格截取 (如分块读取)
+        fill_value: 间断和缺失部分的填充值
+        require_all: 为False时缺少的分量整体填充fill_value，否则抛出ValueError
+        out: 可选的输出数组 (如磁盘上的内存映射)，float32，形状为[3, npts]
+
+    Returns:
+        float32数组，形状为[3, npts] (给出out时即为out)
+
+    Raises:
+        ValueError: 缺少某个分量 (require_all为True时)，没有任何分量，或有多个台站但没有三分量齐全的台站
+        WaveformSpanError: 未给出npts时间断过长，或未给出out时长度超过上限 (见set_limits)
+    """
+    stream = select_station(stream)
+    if starttime is None:
+        starttime = waveform_starttime(stream)
+    if npts is None:
+        npts = waveform_npts(stream, sampling_rate, starttime)
+    if out is None:
+        check_length(npts, sampling_rate)
+    components = _component_segments(stream, sampling_rate, fill_value, require_all)
+
+    if out is None:
+        waveform = np.full((3, max(npts, 0)), fill_value, dtype=np.float32)
+    else:
+        waveform = out
+        waveform[...] = fill_value
+    for chdx, segments in enumerate(components):
+        for segment_start, data in segments:
+            offset = int(round((segment_start - starttime) * sampling_rate))
+            # 截掉落在输出范围之外的部分
+            skip = max(-offset, 0)
+            stop = min(offset + data.shape[0], npts)
+            if stop > offset + skip:
+                waveform[chdx, offset + skip:stop] = data[skip:stop - offset]
+    return waveform
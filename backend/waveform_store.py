@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+解码后波形的内存映射存储
+
+上传的波形文件第一次分析时按台站组装 (见assemble_waveform) 为 float32 [3, npts] 数组，
+直接写入 .npy 文件；之后对同一文件的再次分析和按时间范围的查询都通过 np.load(mmap_mode='r')
+读取，不再经过 obspy.read 解码，也只会读入实际访问到的页面。
+
+文件按内容哈希和台站标识存放，存储方式见 lru_store.LruFileStore，索引另按台站和时间建立。
+已被其他进程映射的文件被淘汰后，映射在关闭前依然有效。
+"""
+
+import os
+import time
+
+import numpy as np
+
+from lru_store import LruFileStore
+from multi_station import group_by_station
+from waveform_assembly import (CHANNELS, MODEL_SAMPLING_RATE, assemble_waveform, check_length, waveform_npts,
+                               waveform_starttime)
+
+
+class StoredWaveform:
+    """存储中的一个台站波形"""
+
+    def __init__(self, store, file_key, station, channels, starttime, sampling_rate, npts):
+        """
+        Args:
+            store: 所属的WaveformStore
+            file_key: 源文件的内容哈希
+            station: 台站标识 (network.station.location)
+            channels: Z/N/E 三个分量的通道代码
+            starttime: 第一个采样点的时间 (UTC时间戳，秒)
+            sampling_rate: 采样率 (Hz)
+            npts: 采样点数
+        """
+        self.store = store
+        self.file_key = file_key
+        self.station = station
+        self.channels = channels
+        self.starttime = starttime
+        self.sampling_rate = sampling_rate
+        self.npts = npts
+
+    @property
+    def path(self):
+        return self.store.data_path(self.file_key, self.station)
+
+    @property
+    def endtime(self):
+        """最后一个采样点的时间 (UTC时间戳，秒)"""
+        return self.starttime + (self.npts - 1) / self.sampling_rate
+
+    def open(self):
+        """以只读内存映射打开，返回形状为[3, npts]的float32数组"""
+        return np.load(self.path, mmap_mode='r')
+
+    def index_range(self, starttime=None, endtime=None):
+        """
+        时间范围对应的采样点范围
+
+        Args:
+            starttime: 起始时间 (UTC时间戳)，None表示从头开始
+            endtime: 结束时间 (UTC时间戳，含)，None表示到结尾
+
+        Returns:
+            (i0, i1)，对应[i0, i1)，可能为空
+        """
+        i0 = 0 if starttime is None else int(np.ceil((starttime - self.starttime) * self.sampling_rate - 1e-6))
+        i1 = self.npts if endtime is None else int(np.floor((endtime - self.starttime) * self.sampling_rate + 1e-6)) + 1
+        i0 = min(max(i0, 0), self.npts)
+        return i0, min(max(i1, i0), self.npts)
+
+    def read(self, starttime=None, endtime=None):
+        """
+        读取时间范围内的波形
+
+        Returns:
+            (第一个采样点的索引, 内存映射的视图[3, n])
+        """
+        i0, i1 = self.index_range(starttime, endtime)
+        return i0, self.open()[:, i0:i1]
+
+    def to_stream(self, waveform=None):
+        """
+        以内存映射的数据构建ObsPy Stream (不复制数据)，用于截取事件片段等需要Stream的场合
+
+        Args:
+            waveform: 已打开的内存映射，None表示重新打开
+        """
+        import obspy
+
+        if waveform is None:
+            waveform = self.open()
+        network, station, location = (self.station.split('.') + ['', '', ''])[:3]
+        stream = obspy.Stream()
+        for chdx, channel in enumerate(self.channels):
+            stream.append(obspy.Trace(data=waveform[chdx], header={
+                'network': network, 'station': station, 'location': location, 'channel': channel,
+                'starttime': obspy.UTCDateTime(self.starttime), 'sampling_rate': self.sampling_rate}))
+        return stream
+
+    def to_dict(self):
+        import obspy
+
+        return {
+            'file_key': self.file_key,
+            'station': self.station,
+            'channels': list(self.channels),
+            'start_time_utc': obspy.UTCDateTime(self.starttime).isoformat(),
+            'end_time_utc': obspy.UTCDateTime(self.endtime).isoformat(),
+            'sampling_rate_hz': self.sampling_rate,
+            'npts': self.npts,
+        }
+
+
+class WaveformStore(LruFileStore):
+    """
+    有大小上限、LRU淘汰、可持久化的波形存储
+    """
+
+    table = 'waveforms'
+    columns = ('file_key TEXT NOT NULL, station TEXT NOT NULL, channels TEXT NOT NULL, '
+               'starttime REAL NOT NULL, endtime REAL NOT NULL, sampling_rate REAL NOT NULL, '
+               'npts INTEGER NOT NULL, size INTEGER NOT NULL, ordinal INTEGER NOT NULL, '
+               'created_at REAL NOT NULL, last_access REAL NOT NULL')
+    key_columns = ('file_key', 'station')
+    indexes = {'station': 'station, starttime', 'starttime': 'starttime'}
+
+    def __init__(self, store_dir, max_bytes=4096 * 1024 * 1024):
+        """
+        Args:
+            store_dir: 存储目录
+            max_bytes: 总大小上限 (字节)
+        """
+        super().__init__(store_dir, max_bytes)
+
+    def data_path(self, file_key, station):
+        return os.path.join(self.store_dir, f"{file_key}.{station}.npy")
+
+    def _paths(self, file_key, station):
+        return [self.data_path(file_key, station)]
+
+    def _entry(self, row):
+        file_key, station, channels, starttime, sampling_rate, npts = row
+        return StoredWaveform(self, file_key, station, tuple(channels.split(',')), starttime, sampling_rate, npts)
+
+    _COLUMNS = 'file_key, station, channels, starttime, sampling_rate, npts'
+
+    def get(self, file_key):
+        """
+        查询某个文件的所有台站波形
+
+        Args:
+            file_key: 源文件的内容哈希
+
+        Returns:
+            按文件中台站顺序排列的StoredWaveform列表，未存储时返回None
+        """
+        with self._lock, self._transaction() as conn:
+            rows = conn.execute(f'SELECT {self._COLUMNS} FROM waveforms WHERE file_key = ? ORDER BY ordinal',
+                                (file_key,)).fetchall()
+            entries = [self._entry(row) for row in rows]
+            if not entries or not all(os.path.exists(entry.path) for entry in entries):
+                # 文件丢失，视为未存储
+                for entry in entries:
+                    self._remove(conn, (file_key, entry.station))
+                return None
+            conn.execute('UPDATE waveforms SET last_access = ? WHERE file_key = ?', (time.time(), file_key))
+        return entries
+
+    def put(self, file_key, stream):
+        """
+        组装并写入一个文件中所有三分量齐全的台站
+
+        Args:
+            file_key: 源文件的内容哈希
+            stream: 解码后的ObsPy Stream (可包含多个台站)
+
+        Returns:
+            StoredWaveform列表 (没有三分量齐全的台站时为空列表)
+
+        Raises:
+            WaveformSpanError: 间断过长或某个台站的时长超过上限 (见waveform_assembly.set_limits)
+            ValueError: 所有台站的总大小超过存储上限
+        """
+        stations, _ = group_by_station(stream)
+        # 只读取头信息确定各台站的长度，在创建文件之前检查长度和总大小
+        spans = []
+        for sid, st in stations.items():
+            starttime = waveform_starttime(st)
+            npts = waveform_npts(st, MODEL_SAMPLING_RATE, starttime)
+            check_length(npts, MODEL_SAMPLING_RATE)
+            spans.append((sid, st, starttime, npts))
+        total = sum(3 * npts * np.dtype(np.float32).itemsize for _, _, _, npts in spans)
+        if total > self.max_bytes:
+            raise ValueError(f"波形大小 {total / 1e6:.1f} MB 超过存储上限 {self.max_bytes / 1e6:.1f} MB")
+        rows = []
+        for ordinal, (sid, st, starttime, npts) in enumerate(spans):
+            channels = [st.select(channel=ch)[0].stats.channel for ch in CHANNELS]
+            path = self.data_path(file_key, sid)
+            with self._replacing(path) as tmp_path:
+                # 直接组装到磁盘上的 .npy 中，不在内存中保留整条记录
+                out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(3, npts))
+                assemble_waveform(st, MODEL_SAMPLING_RATE, starttime=starttime, npts=npts, out=out)
+                out.flush()
+                del out
+            rows.append({'file_key': file_key, 'station': sid, 'channels': ','.join(channels),
+                         'starttime': starttime.timestamp,
+                         'endtime': starttime.timestamp + (npts - 1) / MODEL_SAMPLING_RATE,
+                         'sampling_rate': MODEL_SAMPLING_RATE, 'npts': npts, 'size': os.path.getsize(path),
+                         'ordinal': ordinal})
+        self._insert(rows, keep=file_key)
+        return [StoredWaveform(self, row['file_key'], row['station'], tuple(row['channels'].split(',')),
+                               row['starttime'], row['sampling_rate'], row['npts'])
+                for row in rows]
+
+    def find(self, station=None, starttime=None, endtime=None, limit=1000):
+        """
+        按台站和时间范围查询
+
+        Args:
+            station: 台站标识，None表示所有台站
+            starttime: 起始时间 (UTC时间戳)，返回与[starttime, endtime]有重叠的波形
+            endtime: 结束时间 (UTC时间戳)
+            limit: 最多返回的条数
+
+        Returns:
+            按起始时间排序的StoredWaveform列表
+        """
+        clauses, params = [], []
+        if station is not None:
+            clauses.append('station = ?')
+            params.append(station)
+        if endtime is not None:
+            clauses.append('starttime <= ?')
+            params.append(endtime)
+        if starttime is not None:
+            clauses.append('endtime >= ?')
+            params.append(starttime)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._transaction() as conn:
+            rows = conn.execute(f'SELECT {self._COLUMNS} FROM waveforms {where} ORDER BY starttime LIMIT ?',
+                                params + [int(limit)]).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def lookup(self, file_key, station):
+        """查询单个台站波形，不存在时返回None"""
+        with self._transaction() as conn:
+            row = conn.execute(f'SELECT {self._COLUMNS} FROM waveforms WHERE file_key = ? AND station = ?',
+                               (file_key, station)).fetchone()
+        if row is None:
+            return None
+        entry = self._entry(row)
+        return entry if os.path.exists(entry.path) else None
+
+    def stats(self):
+        """条目数和占用大小"""
+        with self._transaction() as conn:
+            files, entries, total = conn.execute(
+                'SELECT COUNT(DISTINCT file_key), COUNT(*), COALESCE(SUM(size), 0) FROM waveforms').fetchone()
+        return {'files': files, 'entries': entries, 'size_bytes': total, 'max_bytes': self.max_bytes}